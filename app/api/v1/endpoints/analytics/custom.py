@@ -20,7 +20,7 @@ class CustomReport(CustomReportBase):
 async def list_custom_reports():
     """List all saved custom reports"""
     query = "SELECT id, name, description, sql_query, view_name, created_at FROM custom_reports ORDER BY created_at DESC"
-    results = db_manager.execute_pg_query(query)
+    results = await db_manager.execute_pg_query_async(query)
     # Convert to Pydantic models
     return [CustomReport(**row) for row in results]
 
@@ -33,7 +33,7 @@ async def create_custom_report(report: CustomReportBase):
         RETURNING id, name, description, sql_query, view_name, created_at
     """
     params = (report.name, report.description, report.sql_query, report.view_name)
-    result = db_manager.execute_pg_query(query, params)
+    result = await db_manager.execute_pg_query_async(query, params)
     if not result:
         raise HTTPException(status_code=500, detail="Failed to create report")
     return CustomReport(**result[0])
@@ -42,7 +42,7 @@ async def create_custom_report(report: CustomReportBase):
 async def delete_custom_report(id: int):
     """Delete a custom report"""
     query = "DELETE FROM custom_reports WHERE id = %s RETURNING id"
-    result = db_manager.execute_pg_query(query, (id,))
+    result = await db_manager.execute_pg_query_async(query, (id,))
     if not result:
         raise HTTPException(status_code=404, detail="Report not found")
     return {"status": "success", "message": "Report deleted"}
@@ -51,7 +51,7 @@ async def delete_custom_report(id: int):
 async def execute_custom_report(id: int):
     """Execute the SQL query of a custom report"""
     # 1. Get Query
-    report_res = db_manager.execute_pg_query("SELECT sql_query FROM custom_reports WHERE id = %s", (id,))
+    report_res = await db_manager.execute_pg_query_async("SELECT sql_query FROM custom_reports WHERE id = %s", (id,))
     if not report_res:
         raise HTTPException(status_code=404, detail="Report not found")
     
@@ -64,7 +64,7 @@ async def execute_custom_report(id: int):
     # User implies Logo Reports. So execute on MSSQL.
     
     try:
-        data = db_manager.execute_ms_query(sql)
+        data = await db_manager.execute_ms_query_async(sql)
         # Limit rows for safety?
         return {"data": data[:1000] if data else [], "count": len(data) if data else 0, "truncated": len(data) > 1000 if data else False}
     except Exception as e:
@@ -1,9 +1,23 @@
-from fastapi import APIRouter, HTTPException
+from datetime import date
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
 from app.services.logo_service import logo_service
+from app.services.sales_rollup import RollupNotReady, sales_rollup
+from app.services.comparison_engine import comparison_engine
 from loguru import logger
 
 router = APIRouter()
 
+
+def _not_ready(e: RollupNotReady):
+    # The firm's rollup is being backfilled in the background; clients retry later
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "60"},
+        content={"success": False, "status": "rollup_not_ready", "detail": str(e)}
+    )
+
+
 @router.get("/yoy/daily")
 async def get_yoy_daily_comparison(firma: str = None, period: str = None):
     """
@@ -22,6 +36,8 @@ async def get_yoy_daily_comparison(firma: str = None, period: str = None):
             "success": True,
             "data": result
         }
+    except RollupNotReady as e:
+        return _not_ready(e)
     except Exception as e:
         logger.error(f"YoY Daily Comparison API error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -44,6 +60,8 @@ async def get_yoy_weekly_comparison(firma: str = None, period: str = None):
             "success": True,
             "data": result
         }
+    except RollupNotReady as e:
+        return _not_ready(e)
     except Exception as e:
         logger.error(f"YoY Weekly Comparison API error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -67,6 +85,137 @@ async def get_yoy_monthly_comparison(firma: str = None, period: str = None):
             "success": True,
             "data": result
         }
+    except RollupNotReady as e:
+        return _not_ready(e)
     except Exception as e:
         logger.error(f"YoY Monthly Comparison API error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/yoy/range")
+async def get_yoy_range_comparison(
+    start: date = Query(..., description="Window start (inclusive)"),
+    end: date = Query(..., description="Window end (inclusive)"),
+    firma: str = None
+):
+    """
+    Year-over-Year Comparison for Any Window
+    
+    Compares [start, end] vs the same dates last year, read from the daily sales rollup.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    try:
+        result = await logo_service.get_yoy_range_comparison(start, end, firma)
+        return {
+            "success": True,
+            "data": result
+        }
+    except RollupNotReady as e:
+        return _not_ready(e)
+    except Exception as e:
+        logger.error(f"YoY Range Comparison API error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/yoy/rollup")
+async def get_sales_rollup_state():
+    """
+    Daily Sales Rollup State
+    
+    Watermark and last backfill/refresh per firm and period.
+    """
+    return {
+        "success": True,
+        "data": await sales_rollup.state()
+    }
+
+
+@router.post("/yoy/rollup/refresh")
+async def refresh_sales_rollup(
+    firma: str = None,
+    full: bool = Query(False, description="Rebuild every period of the firm from scratch")
+):
+    """
+    Refresh the Daily Sales Rollup
+    
+    Incremental by default; full=true re-runs the backfill.
+    """
+    try:
+        result = await sales_rollup.backfill_firm(firma or logo_service.firma_no, full=full)
+        return {
+            "success": True,
+            "data": result
+        }
+    except Exception as e:
+        logger.error(f"Sales rollup refresh API error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/yoy/compare")
+async def compare_periods(
+    start: date = Query(..., description="Window start (inclusive)"),
+    end: date = Query(..., description="Window end (inclusive)"),
+    align: str = Query("date", pattern="^(date|weekday|previous)$",
+                       description="date: same dates last year, weekday: 52 weeks back, previous: the preceding window"),
+    firma: str = None
+):
+    """
+    Period Comparison for Any Window
+    
+    Computed in memory from the cached daily series; no Logo queries.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    try:
+        data = await comparison_engine.compare_range(firma or logo_service.firma_no, start, end, align)
+    except RollupNotReady as e:
+        return _not_ready(e)
+    return {
+        "success": True,
+        "data": data
+    }
+
+
+@router.get("/yoy/compare/to-date")
+async def compare_to_date(
+    today: date = Query(None, description="Reference day (default: today)"),
+    align: str = Query("date", pattern="^(date|weekday)$"),
+    firma: str = None
+):
+    """
+    To-Date Comparisons
+    
+    Week-, month- and year-to-date plus trailing 7/30/90 days, each vs last year.
+    """
+    try:
+        data = await comparison_engine.to_date(firma or logo_service.firma_no, today, align)
+    except RollupNotReady as e:
+        return _not_ready(e)
+    return {
+        "success": True,
+        "data": data
+    }
+
+
+@router.get("/yoy/compare/rolling")
+async def compare_rolling(
+    window: int = Query(7, ge=1, le=366, description="Rolling window in days"),
+    days: int = Query(90, ge=1, le=1830, description="Number of points"),
+    end: date = Query(None),
+    align: str = Query("weekday", pattern="^(date|weekday)$"),
+    firma: str = None
+):
+    """
+    Rolling Window Series
+    
+    Trailing window totals for each day with the aligned last-year series.
+    """
+    try:
+        data = await comparison_engine.rolling_series(firma or logo_service.firma_no, window, days, end, align)
+    except RollupNotReady as e:
+        return _not_ready(e)
+    return {
+        "success": True,
+        "data": data
+    }
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from loguru import logger
 from app.services.logo_service import logo_service
+from app.services.company_sync import company_sync
 from app.core.database import db_manager
 from pydantic import BaseModel
 from typing import List, Optional
@@ -46,7 +47,7 @@ async def get_companies():
             WHERE is_active = true
             ORDER BY is_default DESC, name ASC
         """
-        results = db_manager.execute_pg_query(query)
+        results = await db_manager.execute_pg_query_async(query)
         return results
     except Exception as e:
         logger.error(f"Get companies error: {e}")
@@ -66,7 +67,7 @@ async def get_periods(company_id: int):
             WHERE company_id = {company_id} AND is_active = true
             ORDER BY is_default DESC, logo_period_nr DESC
         """
-        results = db_manager.execute_pg_query(query)
+        results = await db_manager.execute_pg_query_async(query)
         return results
     except Exception as e:
         logger.error(f"Get periods error: {e}")
@@ -97,7 +98,7 @@ async def get_default_company_period():
             WHERE c.is_default = true
             LIMIT 1
         """
-        results = db_manager.execute_pg_query(query)
+        results = await db_manager.execute_pg_query_async(query)
         
         if not results:
             raise HTTPException(
@@ -119,107 +120,19 @@ async def sync_companies_from_logo():
     """
     Sync companies and periods from Logo ERP
     
-    Reads L_CAPIFIRM table from Logo and syncs to EXFIN database.
+    Reads L_CAPIFIRM and L_CAPIPERIOD (one query each) and upserts both into the EXFIN
+    database in a single transaction. Firms/periods no longer in Logo are deactivated;
+    `diff` lists what was inserted, updated (old/new values) or deactivated.
     """
     try:
-        # Logo'dan firmaları çek
-        logo_query = """
-            SELECT 
-                NR as logo_nr,
-                CODE as code,
-                NAME as name,
-                TAXOFFICE as tax_office,
-                TAXNR as tax_number,
-                ADDR1 as address
-            FROM L_CAPIFIRM WITH (NOLOCK)
-            WHERE NR > 0
-            ORDER BY NR
-        """
-        
-        logo_companies = db_manager.execute_ms_query(logo_query)
-        
-        if not logo_companies:
-            raise HTTPException(
-                status_code=404,
-                detail="No companies found in Logo ERP"
-            )
-        
-        synced_companies = []
-        synced_periods = []
-        
-        for logo_company in logo_companies:
-            # EXFIN DB'ye ekle/güncelle
-            pg_query = f"""
-                INSERT INTO companies (logo_nr, code, name, tax_office, tax_number, address, is_active)
-                VALUES (
-                    {logo_company['logo_nr']},
-                    '{logo_company['code']}',
-                    '{logo_company['name'].replace("'", "''")}',
-                    '{logo_company.get('tax_office', '') or ''}',
-                    '{logo_company.get('tax_number', '') or ''}',
-                    '{logo_company.get('address', '') or ''}',
-                    true
-                )
-                ON CONFLICT (logo_nr) DO UPDATE SET
-                    name = EXCLUDED.name,
-                    tax_office = EXCLUDED.tax_office,
-                    tax_number = EXCLUDED.tax_number,
-                    address = EXCLUDED.address,
-                    updated_at = CURRENT_TIMESTAMP
-                RETURNING id, logo_nr, code, name
-            """
-            
-            company_result = db_manager.execute_pg_query(pg_query)
-            synced_companies.append(company_result[0])
-            
-            # Dönemleri çek (L_CAPIPERIOD)
-            periods_query = f"""
-                SELECT 
-                    PERNR as period_nr,
-                    BEGDATE as start_date,
-                    ENDDATE as end_date
-                FROM L_CAPIPERIOD WITH (NOLOCK)
-                WHERE FIRMNR = {logo_company['logo_nr']}
-                ORDER BY PERNR
-            """
-            
-            logo_periods = db_manager.execute_ms_query(periods_query)
-            
-            for logo_period in logo_periods:
-                # Dönem adını yıldan çıkar
-                year = logo_period['start_date'].year if logo_period.get('start_date') else logo_period['period_nr']
-                
-                period_insert = f"""
-                    INSERT INTO periods (
-                        company_id, logo_period_nr, code, name, 
-                        start_date, end_date, is_active
-                    )
-                    SELECT 
-                        {company_result[0]['id']},
-                        {logo_period['period_nr']},
-                        '{logo_period['period_nr']:02d}',
-                        '{year}',
-                        '{logo_period.get('start_date', '')}',
-                        '{logo_period.get('end_date', '')}',
-                        true
-                    ON CONFLICT (company_id, logo_period_nr) DO UPDATE SET
-                        start_date = EXCLUDED.start_date,
-                        end_date = EXCLUDED.end_date,
-                        updated_at = CURRENT_TIMESTAMP
-                    RETURNING id, logo_period_nr, name
-                """
-                
-                period_result = db_manager.execute_pg_query(period_insert)
-                synced_periods.append(period_result[0])
-        
+        result = await company_sync.sync()
         return {
             "success": True,
             "message": "Companies and periods synced from Logo ERP",
-            "synced_companies": len(synced_companies),
-            "synced_periods": len(synced_periods),
-            "companies": synced_companies
+            **result
         }
-        
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"Sync from Logo error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -232,7 +145,7 @@ async def set_default_company(company_id: int):
     """
     try:
         # Önce tüm firmaların default'unu kaldır
-        db_manager.execute_pg_query("UPDATE companies SET is_default = false")
+        await db_manager.execute_pg_query_async("UPDATE companies SET is_default = false")
         
         # Seçili firmayı default yap
         query = f"""
@@ -241,7 +154,7 @@ async def set_default_company(company_id: int):
             WHERE id = {company_id}
             RETURNING id, code, name
         """
-        result = db_manager.execute_pg_query(query)
+        result = await db_manager.execute_pg_query_async(query)
         
         if not result:
             raise HTTPException(status_code=404, detail="Company not found")
@@ -266,7 +179,7 @@ async def set_default_period(period_id: int):
         get_company_query = f"""
             SELECT company_id FROM periods WHERE id = {period_id}
         """
-        company_result = db_manager.execute_pg_query(get_company_query)
+        company_result = await db_manager.execute_pg_query_async(get_company_query)
         
         if not company_result:
             raise HTTPException(status_code=404, detail="Period not found")
@@ -274,7 +187,7 @@ async def set_default_period(period_id: int):
         company_id = company_result[0]['company_id']
         
         # O firmadaki tüm dönemlerin default'unu kaldır
-        db_manager.execute_pg_query(
+        await db_manager.execute_pg_query_async(
             f"UPDATE periods SET is_default = false WHERE company_id = {company_id}"
         )
         
@@ -285,7 +198,7 @@ async def set_default_period(period_id: int):
             WHERE id = {period_id}
             RETURNING id, code, name
         """
-        result = db_manager.execute_pg_query(query)
+        result = await db_manager.execute_pg_query_async(query)
         
         return {
             "success": True,
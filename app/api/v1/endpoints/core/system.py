@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, R
 from loguru import logger
 from app.services.system_service import system_service
 from app.services.scheduler_service import scheduler_service
-from app.services.profiler_service import profiler_service
+from app.services.profiler_service import profiler_service, api_query_stats, API_QUERY_SORTS
+from app.core.database import db_manager
 from app.core.config import settings
 from pydantic import BaseModel
 
@@ -29,6 +30,26 @@ async def stop_profiler(x_firma: str = Header("001", alias="x-firma")): # Defaul
          raise HTTPException(status_code=500, detail=result)
     return {"status": "success", "data": result}
 
+@router.get("/profiler/api-queries")
+async def api_query_report(
+    sort: str = Query("cpu", description="cpu | reads | duration | executions"),
+    limit: int = Query(50, ge=1, le=500),
+    refresh: bool = Query(False, description="Collect from dm_exec_query_stats before answering")
+):
+    """Logo server cost (CPU, logical reads, duration, executions) of the API's own SQL, per endpoint"""
+    if sort not in API_QUERY_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(API_QUERY_SORTS)}")
+    if refresh:
+        import asyncio
+        await asyncio.to_thread(api_query_stats.collect)
+    return api_query_stats.report(sort=sort, limit=limit)
+
+@router.delete("/profiler/api-queries")
+async def reset_api_query_report():
+    """Clear the accumulated per-endpoint query statistics"""
+    api_query_stats.reset()
+    return {"status": "success"}
+
 
 @router.post("/update")
 async def update_system():
@@ -123,6 +144,11 @@ async def remove_schedule(job_id: str):
         return {"status": "success", "message": "Job removed"}
     raise HTTPException(status_code=404, detail="Job not found")
 
+@router.get("/db-pools")
+async def db_pool_stats():
+    """Connection pool statistics per named database (size, in use, waits, timeouts)"""
+    return db_manager.pool_stats()
+
 @router.get("/info")
 async def system_info():
     """Returns System Version and Status"""
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from loguru import logger
 from app.core.database import db_manager
+from app.services.master_data_sync import master_data_sync, MASTER_DATA
+from app.services.sync_orchestrator import sync_orchestrator, SYNC_PLAN
 from typing import List, Optional
 from pydantic import BaseModel, Field
 
@@ -51,225 +53,104 @@ class Campaign(BaseModel):
 # SYNC ENDPOINTS (Logo'dan Çek)
 # =====================================================
 
+MODE_QUERY = Query("auto", pattern="^(auto|incremental|full)$", description="auto: değişenleri çek, süresi dolunca tam mutabakat; incremental: sadece değişenler; full: tümü (silinenler pasife alınır)")
+
+
+async def _company_firma(company_id: int) -> str:
+    result = await db_manager.execute_pg_query_async("SELECT logo_nr FROM companies WHERE id = %s", (company_id,))
+    if not result:
+        raise HTTPException(status_code=404, detail="Company not found")
+    return str(result[0]['logo_nr']).zfill(3)
+
+
+def _sync_result(totals: dict, message: str) -> dict:
+    return {
+        "success": True,
+        "message": message,
+        "count": totals["fetched"],
+        **totals
+    }
+
+
 @router.post("/sync/salesmen")
-async def sync_salesmen(company_id: int):
+async def sync_salesmen(company_id: int, mode: str = MODE_QUERY):
     """
     **Satış Elemanlarını Senkronize Et**
 
     Logo ERP'den satış temsilcilerini (SALESMAN) çeker ve yerel veritabanına kaydeder.
-    Sadece 'Aktif' statüsündeki kayıtlar çekilir.
+    Pasif kartlar `is_active = false` olarak tutulur. Kayıtlar toplu (batch) birleştirilir;
+    yanıt eklenen / güncellenen / değişmeyen / pasife alınan sayılarını içerir.
+    Varsayılan (auto) modda sadece son senkronizasyondan beri değişen kartlar çekilir.
     """
     try:
-        # Get company info
-        company_query = f"SELECT logo_nr FROM companies WHERE id = {company_id}"
-        company_result = db_manager.execute_pg_query(company_query)
-        
-        if not company_result:
-            raise HTTPException(status_code=404, detail="Company not found")
-        
-        firma_no = str(company_result[0]['logo_nr']).zfill(3)
-        
-        # Logo'dan satış elemanlarını çek
-        logo_query = f"""
-            SELECT 
-                LOGICALREF as logo_ref,
-                CODE as code,
-                DEFINITION_ as name,
-                EMAIL as email,
-                TELEPHONE1 as phone
-            FROM LG_{firma_no}_SALESMAN WITH (NOLOCK)
-            WHERE ACTIVE = 0  -- 0 = aktif
-            ORDER BY CODE
-        """
-        
-        salesmen = db_manager.execute_ms_query(logo_query)
-        
-        synced_count = 0
-        for salesman in salesmen:
-            # EXFIN DB'ye ekle/güncelle
-            pg_query = f"""
-                INSERT INTO salesmen (
-                    company_id, logo_ref, code, name, email, phone, is_active
-                )
-                VALUES (
-                    {company_id},
-                    {salesman['logo_ref']},
-                    '{salesman['code']}',
-                    '{salesman['name'].replace("'", "''")}',
-                    '{salesman.get('email', '') or ''}',
-                    '{salesman.get('phone', '') or ''}',
-                    true
-                )
-                ON CONFLICT (company_id, logo_ref) DO UPDATE SET
-                    name = EXCLUDED.name,
-                    email = EXCLUDED.email,
-                    phone = EXCLUDED.phone,
-                    last_sync = CURRENT_TIMESTAMP
-            """
-            db_manager.execute_pg_query(pg_query)
-            synced_count += 1
-        
-        return {
-            "success": True,
-            "message": f"{synced_count} satış elemanı başarıyla senkronize edildi.",
-            "count": synced_count
-        }
-        
+        firma_no = await _company_firma(company_id)
+        totals = await master_data_sync.sync("salesmen", {"company_id": company_id}, firma_no, mode=mode)
+        return _sync_result(totals, f"{totals['fetched']} satış elemanı başarıyla senkronize edildi.")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Sync salesmen error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/sync/brands")
-async def sync_brands(company_id: int):
+async def sync_brands(company_id: int, mode: str = MODE_QUERY):
     """
     **Markaları Senkronize Et**
     
     Logo ERP'den ürün markalarını (MARK) çeker ve günceller.
     """
     try:
-        company_query = f"SELECT logo_nr FROM companies WHERE id = {company_id}"
-        company_result = db_manager.execute_pg_query(company_query)
-        
-        if not company_result:
-            raise HTTPException(status_code=404, detail="Company not found")
-        
-        firma_no = str(company_result[0]['logo_nr']).zfill(3)
-        
-        logo_query = f"""
-            SELECT 
-                LOGICALREF as logo_ref,
-                CODE as code,
-                DESCR as name
-            FROM LG_{firma_no}_MARK WITH (NOLOCK)
-            WHERE ACTIVE = 0
-            ORDER BY CODE
-        """
-        
-        brands = db_manager.execute_ms_query(logo_query)
-        
-        synced_count = 0
-        for brand in brands:
-            pg_query = f"""
-                INSERT INTO brands (company_id, logo_ref, code, name, is_active)
-                VALUES (
-                    {company_id},
-                    {brand['logo_ref']},
-                    '{brand['code']}',
-                    '{brand['name'].replace("'", "''")}',
-                    true
-                )
-                ON CONFLICT (company_id, logo_ref) DO UPDATE SET
-                    name = EXCLUDED.name,
-                    last_sync = CURRENT_TIMESTAMP
-            """
-            db_manager.execute_pg_query(pg_query)
-            synced_count += 1
-        
-        return {
-            "success": True,
-            "message": f"{synced_count} marka başarıyla senkronize edildi.",
-            "count": synced_count
-        }
-        
+        firma_no = await _company_firma(company_id)
+        totals = await master_data_sync.sync("brands", {"company_id": company_id}, firma_no, mode=mode)
+        return _sync_result(totals, f"{totals['fetched']} marka başarıyla senkronize edildi.")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Sync brands error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/sync/special-codes")
-async def sync_special_codes(company_id: int, specode_type: str = "customer"):
+async def sync_special_codes(company_id: int, specode_type: str = "customer", mode: str = MODE_QUERY):
     """
     **Özel Kodları Senkronize Et**
     
-    Logo ERP'den Özel Kod (SPECODE) tanımlarını çeker.
+    Logo ERP'den Özel Kod (SPECODE) tanımlarını çeker (1-5 arası tüm kod sıraları tek sorguda).
     
     **Parametreler:**
-    - `specode_type`: Çekilecek kod tipi ('customer', 'item', 'invoice', 'order')
+    - `specode_type`: Çekilecek kod tipi ('customer', 'item', 'invoice')
     """
+    if specode_type not in MASTER_DATA["special_codes"]["variants"]:
+        raise HTTPException(status_code=400, detail=f"Geçersiz specode_type: {specode_type}")
     try:
-        company_query = f"SELECT logo_nr FROM companies WHERE id = {company_id}"
-        company_result = db_manager.execute_pg_query(company_query)
-        
-        if not company_result:
-            raise HTTPException(status_code=404, detail="Company not found")
-        
-        firma_no = str(company_result[0]['logo_nr']).zfill(3)
-        
-        # Tablo adını belirle
-        table_map = {
-            "customer": "CLSPECODE",
-            "item": "ITSPECODE",
-            "invoice": "INVOICESPECODE"
-        }
-        
-        table_name = table_map.get(specode_type, "CLSPECODE")
-        
-        synced_count = 0
-        
-        # Her SPECODE için (1-5)
-        for code_num in range(1, 6):
-            logo_query = f"""
-                SELECT 
-                    LOGICALREF as logo_ref,
-                    SPECODE as code,
-                    DEFINITION_ as name,
-                    CODETYPE as code_number
-                FROM LG_{firma_no}_{table_name} WITH (NOLOCK)
-                WHERE CODETYPE = {code_num}
-                ORDER BY SPECODE
-            """
-            
-            codes = db_manager.execute_ms_query(logo_query)
-            
-            for code in codes:
-                pg_query = f"""
-                    INSERT INTO special_codes (
-                        company_id, logo_ref, specode_type, code_number, code, name, is_active
-                    )
-                    VALUES (
-                        {company_id},
-                        {code['logo_ref']},
-                        '{specode_type}',
-                        {code_num},
-                        '{code['code']}',
-                        '{code['name'].replace("'", "''")}',
-                        true
-                    )
-                    ON CONFLICT (company_id, specode_type, code_number, logo_ref) DO UPDATE SET
-                        name = EXCLUDED.name,
-                        last_sync = CURRENT_TIMESTAMP
-                """
-                db_manager.execute_pg_query(pg_query)
-                synced_count += 1
-        
-        return {
-            "success": True,
-            "message": f"{specode_type} için {synced_count} özel kod senkronize edildi.",
-            "count": synced_count
-        }
-        
+        firma_no = await _company_firma(company_id)
+        totals = await master_data_sync.sync(
+            "special_codes", {"company_id": company_id, "specode_type": specode_type}, firma_no, variant=specode_type, mode=mode
+        )
+        return _sync_result(totals, f"{specode_type} için {totals['fetched']} özel kod senkronize edildi.")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Sync special codes error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/sync/campaigns")
-async def sync_campaigns(company_id: int, period_id: int):
+async def sync_campaigns(company_id: int, period_id: int, mode: str = MODE_QUERY):
     """
     **Kampanyaları Senkronize Et**
 
     Logo ERP üzerindeki kampanya kartlarını (CAMPAIGN) çeker.
+    Kampanya tablosu yoksa boş sonuç döner.
     """
     try:
-        # Get company and period info
-        query = f"""
+        result = await db_manager.execute_pg_query_async("""
             SELECT c.logo_nr, p.logo_period_nr
             FROM companies c
             JOIN periods p ON p.company_id = c.id
-            WHERE c.id = {company_id} AND p.id = {period_id}
-        """
-        result = db_manager.execute_pg_query(query)
+            WHERE c.id = %s AND p.id = %s
+        """, (company_id, period_id))
         
         if not result:
             raise HTTPException(status_code=404, detail="Company/Period not found")
@@ -277,67 +158,19 @@ async def sync_campaigns(company_id: int, period_id: int):
         firma_no = str(result[0]['logo_nr']).zfill(3)
         period_no = str(result[0]['logo_period_nr']).zfill(2)
         
-        # Logo'dan kampanyaları çek (örnek - Logo'da kampanya yapısına göre değişir)
-        logo_query = f"""
-            SELECT 
-                LOGICALREF as logo_ref,
-                CODE as code,
-                NAME as name,
-                BEGDATE as start_date,
-                ENDDATE as end_date,
-                DISCRATE as discount_rate
-            FROM LG_{firma_no}_{period_no}_CAMPAIGN WITH (NOLOCK)
-            WHERE ACTIVE = 0
-            ORDER BY CODE
-        """
-        
-        try:
-            campaigns = db_manager.execute_ms_query(logo_query)
-        except:
-            # Kampanya tablosu yoksa boş liste dön
-            campaigns = []
-        
-        synced_count = 0
-        for campaign in campaigns:
-            pg_query = f"""
-                INSERT INTO campaigns (
-                    company_id, period_id, logo_ref, code, name, 
-                    start_date, end_date, discount_rate, is_active
-                )
-                VALUES (
-                    {company_id},
-                    {period_id},
-                    {campaign['logo_ref']},
-                    '{campaign['code']}',
-                    '{campaign['name'].replace("'", "''")}',
-                    '{campaign.get('start_date', '')}',
-                    '{campaign.get('end_date', '')}',
-                    {campaign.get('discount_rate', 0)},
-                    true
-                )
-                ON CONFLICT (company_id, period_id, logo_ref) DO UPDATE SET
-                    name = EXCLUDED.name,
-                    start_date = EXCLUDED.start_date,
-                    end_date = EXCLUDED.end_date,
-                    discount_rate = EXCLUDED.discount_rate,
-                    last_sync = CURRENT_TIMESTAMP
-            """
-            db_manager.execute_pg_query(pg_query)
-            synced_count += 1
-        
-        return {
-            "success": True,
-            "message": f"{synced_count} kampanya senkronize edildi.",
-            "count": synced_count
-        }
-        
+        totals = await master_data_sync.sync(
+            "campaigns", {"company_id": company_id, "period_id": period_id}, firma_no, period=period_no, mode=mode
+        )
+        return _sync_result(totals, f"{totals['fetched']} kampanya senkronize edildi.")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Sync campaigns error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/sync/all")
-async def sync_all_logo_data(company_id: int, period_id: int = None):
+async def sync_all_logo_data(company_id: int, period_id: int = None, mode: str = MODE_QUERY):
     """
     **Tüm Verileri Senkronize Et**
     
@@ -351,30 +184,37 @@ async def sync_all_logo_data(company_id: int, period_id: int = None):
         results = {}
         
         # Salesmen
-        salesmen_result = await sync_salesmen(company_id)
+        details = {}
+        salesmen_result = await sync_salesmen(company_id, mode)
         results['salesmen'] = salesmen_result['count']
+        details['salesmen'] = salesmen_result
         
         # Brands
-        brands_result = await sync_brands(company_id)
+        brands_result = await sync_brands(company_id, mode)
         results['brands'] = brands_result['count']
+        details['brands'] = brands_result
         
         # Special codes (customer)
-        customer_codes = await sync_special_codes(company_id, "customer")
+        customer_codes = await sync_special_codes(company_id, "customer", mode)
         results['customer_special_codes'] = customer_codes['count']
+        details['customer_special_codes'] = customer_codes
         
         # Special codes (item)
-        item_codes = await sync_special_codes(company_id, "item")
+        item_codes = await sync_special_codes(company_id, "item", mode)
         results['item_special_codes'] = item_codes['count']
+        details['item_special_codes'] = item_codes
         
         # Campaigns (if period provided)
         if period_id:
-            campaigns_result = await sync_campaigns(company_id, period_id)
+            campaigns_result = await sync_campaigns(company_id, period_id, mode)
             results['campaigns'] = campaigns_result['count']
+            details['campaigns'] = campaigns_result
         
         return {
             "success": True,
             "message": "Tüm Logo verileri başarıyla senkronize edildi.",
-            "results": results
+            "results": results,
+            "details": {k: {c: v[c] for c in ("mode", "inserted", "updated", "unchanged", "deactivated", "duration_ms")} for k, v in details.items()}
         }
         
     except Exception as e:
@@ -382,6 +222,79 @@ async def sync_all_logo_data(company_id: int, period_id: int = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/sync/state")
+async def get_sync_state(firma: Optional[str] = None):
+    """
+    **Senkronizasyon Durumu**
+
+    Varlık/kapsam başına değişiklik damgası (watermark), son mod ve son tam mutabakat zamanı.
+    """
+    return await master_data_sync.states(firma)
+
+
+@router.post("/sync/orchestrate")
+async def orchestrate_sync(
+    mode: str = MODE_QUERY,
+    company_ids: Optional[List[int]] = Query(None, description="Boşsa tüm aktif firmalar"),
+    concurrency: Optional[int] = Query(None, ge=1, description="Aynı anda çalışan senkronizasyon adımı (üst sınır MASTER_SYNC_CONCURRENCY)")
+):
+    """
+    **Paralel Toplu Senkronizasyon**
+
+    Önce firmalar/dönemler, ardından her firma için satış elemanı, marka, özel kod ve
+    kampanya senkronizasyonları bağlantı bütçesi dahilinde paralel çalışır. İşlem arka
+    planda yürür; adım ilerlemesi (satır/sn, tahmini kalan süre) realtime websocket
+    üzerinden `master_sync_progress` mesajlarıyla yayınlanır.
+    """
+    try:
+        run_id = await sync_orchestrator.start(mode, company_ids, concurrency)
+    except Exception as e:
+        logger.error(f"Sync orchestrate error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"success": True, "run_id": run_id, "steps": list(SYNC_PLAN)}
+
+
+@router.get("/sync/runs")
+async def get_sync_runs(limit: int = Query(20, ge=1, le=200)):
+    """
+    **Senkronizasyon Çalıştırmaları**
+
+    Son toplu senkronizasyon çalıştırmaları (durum, mod, başlangıç/bitiş).
+    """
+    return await sync_orchestrator.runs(limit)
+
+
+@router.get("/sync/runs/{run_id}")
+async def get_sync_run(run_id: str):
+    """
+    **Çalıştırma Detayı**
+
+    Adım bazında durum, kontrol noktası (son LOGICALREF), sonuç ve hata; çalışan
+    adımlar için canlı ilerleme.
+    """
+    run = await sync_orchestrator.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Sync run not found")
+    return run
+
+
+@router.post("/sync/runs/{run_id}/resume")
+async def resume_sync_run(run_id: str):
+    """
+    **Çalıştırmayı Sürdür**
+
+    Hatalı/yarım kalan bir çalıştırmanın tamamlanmamış adımlarını kaldıkları
+    kontrol noktasından devam ettirir; tamamlanan adımlar tekrar çalışmaz.
+    """
+    try:
+        await sync_orchestrator.resume(run_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Sync run not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, "run_id": run_id}
+
+
 # =====================================================
 # GET ENDPOINTS (Cache'den Oku)
 # =====================================================
@@ -400,7 +313,7 @@ async def get_salesmen(company_id: int):
             WHERE company_id = {company_id} AND is_active = true
             ORDER BY name
         """
-        results = db_manager.execute_pg_query(query)
+        results = await db_manager.execute_pg_query_async(query)
         return results
     except Exception as e:
         logger.error(f"Get salesmen error: {e}")
@@ -421,7 +334,7 @@ async def get_brands(company_id: int):
             WHERE company_id = {company_id} AND is_active = true
             ORDER BY name
         """
-        results = db_manager.execute_pg_query(query)
+        results = await db_manager.execute_pg_query_async(query)
         return results
     except Exception as e:
         logger.error(f"Get brands error: {e}")
@@ -444,7 +357,7 @@ async def get_special_codes(company_id: int, specode_type: str = "customer"):
               AND is_active = true
             ORDER BY code_number, code
         """
-        results = db_manager.execute_pg_query(query)
+        results = await db_manager.execute_pg_query_async(query)
         return results
     except Exception as e:
         logger.error(f"Get special codes error: {e}")
@@ -469,7 +382,7 @@ async def get_campaigns(company_id: int, period_id: int):
               AND is_active = true
             ORDER BY start_date DESC
         """
-        results = db_manager.execute_pg_query(query)
+        results = await db_manager.execute_pg_query_async(query)
         return results
     except Exception as e:
         logger.error(f"Get campaigns error: {e}")
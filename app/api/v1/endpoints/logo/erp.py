@@ -1,9 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response, UploadFile, File
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
 from app.services.logo_service import logo_service
 from app.services.xml_service import xml_service
+from app.services.report_cache import report_cache
+from app.services.single_flight import report_flight
+from app.services.dimension_cache import dimension_cache
+from app.services.search_index import search_index
+from app.services.transfer_outbox import transfer_outbox
+from app.services.unity_pool import unity_pool
+from app.services.report_fanout import report_fanout
+from app.services.report_catalog import report_catalog
 from app.core.security import get_current_userModel
 from pydantic import BaseModel, Field
 from typing import Optional, List
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import tempfile
 
 router = APIRouter()
 
@@ -25,17 +40,44 @@ async def get_firms():
     """
     return await logo_service.get_available_firms()
 
+CURSOR = Query(None, description="Önceki sayfanın X-Next-Cursor değeri (LOGICALREF)")
+LIMIT = Query(None, ge=1, description="Sayfa boyutu (varsayılan 100, en fazla 1000)")
+FIELDS = Query(None, description="Virgülle ayrılmış alan listesi (ör. CODE,NAME)")
+
+async def _list_page(fetch, fields: Optional[str], **kwargs):
+    """
+    Run a keyset-paginated list call. The body stays a plain row list;
+    paging info travels in headers (X-Next-Cursor, X-Has-More, X-Estimated-Total).
+    """
+    projection = [c.strip() for c in fields.split(",") if c.strip()] if fields else None
+    try:
+        page = await fetch(fields=projection, **kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if page is None:
+        raise HTTPException(status_code=500, detail="Logo query failed")
+    headers = {"X-Has-More": "true" if page["has_more"] else "false"}
+    if page["next_cursor"] is not None:
+        headers["X-Next-Cursor"] = str(page["next_cursor"])
+    if page["estimated_total"] is not None:
+        headers["X-Estimated-Total"] = str(page["estimated_total"])
+    return JSONResponse(content=jsonable_encoder(page["items"]), headers=headers)
+
 @router.get("/customers")
 async def get_logo_customers(
     search: Optional[str] = Query(None, description="Arama metni (Kod veya Ünvan)"),
+    cursor: Optional[int] = CURSOR,
+    limit: Optional[int] = LIMIT,
+    fields: Optional[str] = FIELDS,
     x_firma: Optional[str] = Header(None, description="Hedef Firma No")
 ):
     """
     **Logo Müşteri Ara**
 
     Doğrudan Logo veritabanından (CLCARD) canlı müşteri araması yapar.
+    Sonuçlar LOGICALREF sırasıyla sayfalanır; sonraki sayfa için X-Next-Cursor başlığını `cursor` olarak gönderin.
     """
-    return await logo_service.get_customers(search, firma=x_firma)
+    return await _list_page(logo_service.get_customers, fields, search=search, firma=x_firma, cursor=cursor, limit=limit)
 
 @router.post("/customers")
 async def create_logo_customer(customer: LogoCustomerBase):
@@ -62,39 +104,78 @@ async def update_logo_customer(erp_code: str, customer: LogoCustomerBase):
     return {"status": "success", "message": "Customer updated in Logo"}
 
 @router.get("/items")
-async def read_logo_items(search: Optional[str] = Query(None, description="Malzeme arama")):
+async def read_logo_items(
+    search: Optional[str] = Query(None, description="Malzeme arama"),
+    cursor: Optional[int] = CURSOR,
+    limit: Optional[int] = LIMIT,
+    fields: Optional[str] = FIELDS,
+    x_firma: Optional[str] = Header(None, description="Hedef Firma No")
+):
     """
     **Malzeme Ara (ITEMS)**
 
-    Logo'daki malzemeleri (ITEMS) listeler. Stok durumu, fiyat vb. içerir.
+    Logo'daki malzemeleri (ITEMS) sayfalı olarak listeler.
     """
-    return await logo_service.get_items(search)
+    return await _list_page(logo_service.get_items, fields, search=search, firma=x_firma, cursor=cursor, limit=limit)
 
 @router.get("/services")
-async def read_logo_services(search: Optional[str] = Query(None, description="Hizmet arama")):
+async def read_logo_services(
+    search: Optional[str] = Query(None, description="Hizmet arama"),
+    cursor: Optional[int] = CURSOR,
+    limit: Optional[int] = LIMIT,
+    fields: Optional[str] = FIELDS,
+    x_firma: Optional[str] = Header(None, description="Hedef Firma No")
+):
     """
     **Hizmet Kartları (SRVCARD)**
 
-    Logo'daki hizmet kartlarını listeler.
+    Logo'daki hizmet kartlarını sayfalı olarak listeler.
     """
-    return await logo_service.get_services(search)
+    return await _list_page(logo_service.get_services, fields, search=search, firma=x_firma, cursor=cursor, limit=limit)
+
+async def _enqueue_transfer(kind: str, payload: dict, idempotency_key: Optional[str], firma: Optional[str] = None,
+                            period: Optional[str] = None):
+    job = await transfer_outbox.enqueue(kind, payload, idempotency_key=idempotency_key, firma=firma, period=period)
+    if not job:
+        raise HTTPException(status_code=500, detail="Failed to queue transfer")
+    return JSONResponse(status_code=202, content={
+        "status": "queued",
+        "job_id": str(job["id"]),
+        "job_status": job["status"],
+        "duplicate": job["duplicate"]
+    })
+
+IDEMPOTENCY_KEY = Header(None, alias="Idempotency-Key", description="Tekrar gönderimlerde aynı anahtar (boşsa içerikten üretilir)")
 
-@router.post("/invoices")
+@router.post("/invoices", status_code=202)
 async def create_logo_invoice(
     local_invoice_id: str = Query(..., description="Yerel Fatura ID"), 
-    type: str = Query("wholesale", description="Fatura Tipi: 'wholesale' (Toptan), 'retail' (Perakende), 'service' (Hizmet)")
+    type: str = Query("wholesale", description="Fatura Tipi: 'wholesale' (Toptan), 'retail' (Perakende), 'service' (Hizmet)"),
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY,
+    x_firma: Optional[str] = Header(None, description="Hedef Firma No"),
+    x_period: Optional[str] = Header(None, description="Hedef Dönem No")
 ):
     """
     **Fatura Aktarımı (Logo Objects)**
 
-    Yerel veritabanındaki bir faturayı Logo REST Objects aracılığıyla Logo'ya aktarır.
-    İşlem başarılı olursa Fiş Numarasını döner.
+    Faturayı aktarım kuyruğuna (outbox) ekler ve hemen iş numarası (job_id) döner.
+    Aktarım arka planda yapılır; durum `/transfers/{job_id}` ile izlenir.
     """
-    success = await logo_service.transfer_invoice_to_logo(local_invoice_id, invoice_type=type)
-    if not success:
-         raise HTTPException(status_code=500, detail="Failed to transfer invoice to Logo")
-    # Duplicate call removed in cleanup
-    return {"status": "success", "message": f"Invoice ({type}) transferred to Logo"}
+    return await _enqueue_transfer("invoice", {"local_invoice_id": local_invoice_id, "invoice_type": type}, idempotency_key, x_firma, x_period)
+
+@router.post("/orders/{order_id}/transfer", status_code=202)
+async def transfer_logo_order(
+    order_id: str,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY,
+    x_firma: Optional[str] = Header(None, description="Hedef Firma No"),
+    x_period: Optional[str] = Header(None, description="Hedef Dönem No")
+):
+    """
+    **Sipariş Aktarımı (ORFICHE)**
+
+    Yerel siparişi aktarım kuyruğuna ekler ve iş numarası döner.
+    """
+    return await _enqueue_transfer("order", {"order_id": order_id}, idempotency_key, x_firma, x_period)
 
 @router.post("/clients/sync")
 async def create_logo_client(client_data: dict, mode: str = Query("objects", description="'objects' (Rest) veya 'sql' (Direct DB)")):
@@ -124,29 +205,93 @@ async def create_logo_item(item_data: dict):
     raise HTTPException(status_code=500, detail=f"Item creation failed: {ref}")
 
 @router.post("/import/xml")
-async def import_logo_xml(file: UploadFile = File(..., description="Logo XML Dosyası")):
+async def import_logo_xml(
+    file: UploadFile = File(..., description="Logo XML Dosyası"),
+    batch_size: Optional[int] = Query(None, ge=1, le=5000, description="DataFromXML çağrısı başına kayıt"),
+    concurrency: Optional[int] = Query(None, ge=1, le=32, description="Aynı anda işlenen parti sayısı"),
+    progress: Optional[str] = Query(None, pattern="^ndjson$", description="'ndjson': parti bazında ilerleme akışı"),
+    x_firma: Optional[str] = Header(None),
+    x_period: Optional[str] = Header(None)
+):
     """
     **XML İçe Aktar (Mini LogoConnect)**
 
     Standart Logo XML formatındaki veriyi doğrudan Logo'ya işler (DataFromXML).
     Fatura, Sipariş, Cari vb. tüm XML tiplerini destekler.
     Windows-1254 (Türkçe) encoding desteği vardır.
-    """
+
+    Dosya akış halinde (iterparse) okunur ve kayıtlar partiler halinde eşzamanlı işlenir;
+    sonuçta kayıt bazında başarı/hata listesi döner. `progress=ndjson` ile ilerleme canlı izlenir.
+    Hatalı bir partinin Logo'da zaten bulunan kayıtları tekrar gönderilmez (`exists`); kontrol
+    edilemeyenler `unverified` olarak döner.
+    """
+    # Spool to a temp file: the upload is closed once the handler returns,
+    # but a streamed progress response keeps reading after that.
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    while chunk := await file.read(1024 * 1024):
+        spool.write(chunk)
+    spool.seek(0)
+
+    events = xml_service.import_xml_stream(spool, batch_size=batch_size, concurrency=concurrency, firma=x_firma, period=x_period)
+
+    if progress:
+        async def _events():
+            try:
+                async for event in events:
+                    yield event
+            finally:
+                spool.close()
+        return StreamingResponse(_iter_ndjson(_events()), media_type="application/x-ndjson")
+
+    records, summary, error = [], {}, None
     try:
-        content = await file.read()
-        # Decode - try utf-8, fallback to windows-1254 (turkish)
-        try:
-            xml_str = content.decode("utf-8")
-        except UnicodeDecodeError:
-             xml_str = content.decode("cp1254")
-
-        success, msg = logo_service.import_xml_data(xml_str)
-        if success:
-             return {"status": "success", "message": "XML Import Successful"}
-        else:
-             raise HTTPException(status_code=400, detail=msg)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        async for event in events:
+            if event["event"] == "batch":
+                records.extend(event["records"])
+            elif event["event"] == "error":
+                error = event["error"]
+            else:
+                summary = event
+    finally:
+        spool.close()
+
+    if summary.get("processed", 0) == 0:
+        raise HTTPException(status_code=400, detail=error or "No records found in XML")
+    if summary["succeeded"] + summary["existing"] == 0:
+        raise HTTPException(status_code=400, detail={"message": "XML Import Failed", "records": records})
+    records.sort(key=lambda r: r["index"])
+    return {
+        "status": "success" if not summary["failed"] and not error else "partial",
+        "message": "XML Import Successful" if not summary["failed"] and not error else "XML Import completed with errors",
+        "total": summary["processed"],
+        "succeeded": summary["succeeded"],
+        "existing": summary["existing"],
+        "failed": summary["failed"],
+        "parse_error": error,
+        "elapsed_ms": summary["elapsed_ms"],
+        "records": records
+    }
+
+@router.get("/export/xml/invoices")
+async def export_invoices_xml(
+    start_date: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    ids: Optional[List[str]] = Query(None, description="Fatura ID listesi (tekrarlı parametre)")
+):
+    """
+    **Toplu Fatura XML Dışa Aktar**
+
+    Tarih aralığındaki veya verilen ID listesindeki faturaları tek bir Logo XML
+    (SALES_INVOICES) dosyası olarak akış halinde indirir.
+    """
+    if not ids and not (start_date and end_date):
+        raise HTTPException(status_code=400, detail="start_date & end_date or ids is required")
+    filename = f"invoices_{start_date or 'list'}_{end_date or len(ids)}.xml"
+    return StreamingResponse(
+        xml_service.iter_sales_invoices_xml(start_date=start_date, end_date=end_date, ids=ids),
+        media_type="application/xml",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
 @router.get("/export/xml/{type}/{id}")
 async def export_xml(
@@ -181,34 +326,106 @@ async def export_xml(
         
     return Response(content=xml_content, media_type="application/xml", headers={"Content-Disposition": f"attachment; filename={filename}"})
 
-@router.post("/dispatches/sync")
-async def create_logo_dispatch(dispatch_data: dict, items: list[dict]):
+@router.post("/dispatches/sync", status_code=202)
+async def create_logo_dispatch(
+    dispatch_data: dict,
+    items: list[dict],
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY,
+    x_firma: Optional[str] = Header(None, description="Hedef Firma No"),
+    x_period: Optional[str] = Header(None, description="Hedef Dönem No")
+):
     """
     **İrsaliye Aktarımı**
+
+    İrsaliyeyi aktarım kuyruğuna ekler ve iş numarası döner.
     """
-    success, ref = await logo_service._transfer_dispatch_via_objects(dispatch_data, items)
-    if success: return {"status": "success", "ref": ref}
-    raise HTTPException(status_code=500, detail=f"Dispatch creation failed: {ref}")
+    return await _enqueue_transfer("dispatch", {"dispatch_data": dispatch_data, "items": items}, idempotency_key, x_firma, x_period)
 
-@router.post("/collections/sync")
-async def create_logo_collection_sync(collection_data: dict):
+@router.post("/collections/sync", status_code=202)
+async def create_logo_collection_sync(
+    collection_data: dict,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY,
+    x_firma: Optional[str] = Header(None, description="Hedef Firma No"),
+    x_period: Optional[str] = Header(None, description="Hedef Dönem No")
+):
     """
     **Tahsilat Aktarımı (Objects)**
     
-    Nakit veya Kredi Kartı tahsilatlarını Logo'ya işler.
+    Nakit veya Kredi Kartı tahsilatlarını aktarım kuyruğuna ekler ve iş numarası döner.
     """
-    success, ref = await logo_service._transfer_collection_via_objects(collection_data)
-    if success: return {"status": "success", "ref": ref}
-    raise HTTPException(status_code=500, detail=f"Collection failed: {ref}")
+    return await _enqueue_transfer("collection", {"collection_data": collection_data}, idempotency_key, x_firma, x_period)
+
+@router.get("/unity/sessions")
+async def get_unity_sessions():
+    """
+    **Unity Objects Oturum Havuzu**
+
+    Açık (login olmuş) oturum sayısı, boşta bekleme süreleri, login / yeniden kullanım
+    ve sağlık kontrolü istatistiklerini döner.
+    """
+    return unity_pool.stats()
+
+# --- TRANSFER OUTBOX ---
+
+@router.get("/transfers")
+async def list_logo_transfers(
+    status: Optional[str] = Query(None, pattern="^(pending|running|done|dead|unknown)$"),
+    kind: Optional[str] = Query(None, description="invoice, order, dispatch, collection"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    **Aktarım Kuyruğu**
+
+    Son aktarım işlerini ve kuyruk özetini listeler.
+    """
+    return {
+        "summary": await transfer_outbox.stats(),
+        "jobs": await transfer_outbox.list_jobs(status=status, kind=kind, limit=limit) or []
+    }
+
+@router.get("/transfers/{job_id}")
+async def get_logo_transfer(job_id: str):
+    """
+    **Aktarım Durumu**
+
+    pending / running / done / dead / unknown durumunu, deneme sayısını ve son hatayı döner.
+    `unknown`: zaman aşımı veya yeniden başlatma nedeniyle Logo'ya yazılıp yazılmadığı bilinmiyor;
+    otomatik tekrar denenmez.
+    """
+    job = await transfer_outbox.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Transfer job not found")
+    return job
+
+@router.post("/transfers/{job_id}/retry")
+async def retry_logo_transfer(job_id: str):
+    """
+    **Başarısız Aktarımı Yeniden Dene**
+
+    Dead-letter veya `unknown` durumundaki işi kuyruğa geri alır. Belge numarası (FICHENO)
+    Logo'da zaten varsa tekrar gönderilmez, iş tamamlandı olarak işaretlenir.
+    """
+    job = await transfer_outbox.retry(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No dead-lettered or unknown-outcome job with this id")
+    return {"status": "success", "job_id": str(job["id"])}
 
 @router.get("/orders")
-async def read_logo_orders(customer_code: Optional[str] = Query(None, description="Müşteri Kodu")):
+async def read_logo_orders(
+    customer_code: Optional[str] = Query(None, description="Müşteri Kodu"),
+    cursor: Optional[int] = CURSOR,
+    limit: Optional[int] = LIMIT,
+    fields: Optional[str] = FIELDS,
+    x_firma: Optional[str] = Header(None, description="Hedef Firma No"),
+    x_period: Optional[str] = Header(None, description="Hedef Dönem No")
+):
     """
     **Sipariş Listesi (ORFICHE)**
 
-    Logo'daki bekleyen siparişleri listeler.
+    Logo'daki siparişleri en yeniden eskiye sayfalı olarak listeler.
     """
-    return await logo_service.get_orders(customer_code)
+    return await _list_page(logo_service.get_orders, fields, customer_code=customer_code,
+                            firma=x_firma, period=x_period, cursor=cursor, limit=limit)
 
 class LogoPaymentCreate(BaseModel):
     customer_code: str = Field(..., description="Cari Kodu")
@@ -237,269 +454,427 @@ async def read_logo_stock(item_code: str):
 
 # --- REPORTING ENDPOINTS ---
 
+STREAM_QUERY = Query(None, pattern="^(ndjson|json)$", description="Akış modu: 'ndjson' (satır satır) veya 'json' (parçalı JSON dizi). Boş ise normal yanıt. Akış yarıda hata alırsa ndjson son satırı `_stream_error` kaydıdır, json yanıtı kapanmadan kesilir.")
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+async def _iter_ndjson(rows):
+    sent = 0
+    try:
+        async for row in rows:
+            yield json.dumps(row, default=_json_default, ensure_ascii=False) + "\n"
+            sent += 1
+    except Exception as e:
+        # Headers are already out: end with an explicit error record so truncation is detectable
+        logger.error(f"NDJSON stream aborted after {sent} rows: {e}")
+        yield json.dumps({"_stream_error": str(e), "rows_sent": sent}, ensure_ascii=False) + "\n"
+
+async def _iter_json_array(rows):
+    yield "["
+    first = True
+    async for row in rows:
+        yield ("" if first else ",") + json.dumps(row, default=_json_default, ensure_ascii=False)
+        first = False
+    # A failing iterator raises before "]": the response is aborted and the client gets invalid JSON, not a short list
+    yield "]"
+
+def _report_response(result, stream: Optional[str]):
+    """Wrap a streamed report (async row iterator) in a StreamingResponse; pass lists through"""
+    if not stream or result is None or isinstance(result, list):
+        return result
+    if stream == "ndjson":
+        return StreamingResponse(_iter_ndjson(result), media_type="application/x-ndjson")
+    return StreamingResponse(_iter_json_array(result), media_type="application/json")
+
+# --- REPORT CACHE ---
+
+@router.get("/cache/stats")
+async def get_report_cache_stats():
+    """
+    **Rapor Önbelleği İstatistikleri**
+
+    Hit/miss sayıları, doluluk, rapor bazında isabet oranları ve
+    birleştirilen (coalesced) eşzamanlı istek sayısını döner.
+    """
+    return {**report_cache.stats(), "single_flight": report_flight.stats()}
+
+@router.delete("/cache")
+async def invalidate_report_cache(
+    report: Optional[str] = Query(None, description="Servis metodu (örn. get_sales_report). Boş ise tümü."),
+    x_firma: Optional[str] = Header(None),
+    x_period: Optional[str] = Header(None)
+):
+    """
+    **Rapor Önbelleğini Temizle**
+
+    Belirtilen rapor / firma / dönem için önbelleği geçersiz kılar.
+    """
+    removed = report_cache.invalidate(method=report, firma=x_firma, period=x_period)
+    return {"status": "success", "removed": removed}
+
+# --- MASTER DATA DIMENSION CACHE ---
+
+@router.get("/dimensions")
+async def get_dimension_cache_status():
+    """
+    **Ana Veri Önbelleği Durumu**
+
+    Firma bazında CLCARD, ITEMS, SRVCARD, UNITSETL ve SALESMAN önbelleklerinin
+    satır sayısı, son yenileme zamanı, watermark ve hit/miss bilgilerini döner.
+    Müşteri/malzeme arama indeksinin durumu `search_index` altında yer alır.
+    """
+    return {**dimension_cache.stats(), "search_index": search_index.stats()}
+
+@router.post("/dimensions/refresh")
+async def refresh_dimension_cache(
+    full: bool = Query(False, description="Tam yeniden yükleme (silinen kartlar dahil)"),
+    x_firma: Optional[str] = Header(None)
+):
+    """
+    **Ana Veri Önbelleğini Yenile**
+
+    Varsayılan olarak sadece değişen kartları (CAPIBLOCK_MODIFIEDDATE) çeker.
+    """
+    applied = await dimension_cache.refresh_async(firma=x_firma, full=full)
+    return {"status": "success", "applied": applied}
+
+class FanoutTenant(BaseModel):
+    firma: str = Field(..., description="Firma No")
+    period: Optional[str] = Field(None, description="Dönem No (boşsa varsayılan dönem)")
+
+class ReportFanoutRequest(BaseModel):
+    report: str = Field(..., description="Rapor adı (sales, balances, aging, generic ...)")
+    tenants: List[FanoutTenant] = Field(..., min_length=1, description="Firma/dönem listesi")
+    params: dict = Field(default_factory=dict, description="Raporun kendi parametreleri (start_date, end_date, report_code ...)")
+    totals: bool = Field(False, description="Firmalar arası toplamları ekle")
+    group_by: Optional[List[str]] = Field(None, description="Konsolide toplam için gruplama kolonları")
+    concurrency: Optional[int] = Field(None, ge=1, description="Eşzamanlı sorgu sayısı (üst sınır ayarlardan)")
+
+@router.post("/reports/fanout")
+async def run_report_fanout(request: ReportFanoutRequest):
+    """
+    **Çoklu Firma/Dönem Raporu**
+
+    Aynı raporu birden fazla firma ve dönem için eşzamanlı çalıştırır.
+    Satırlar FIRMA/PERIOD kolonlarıyla birleştirilir; istenirse firmalar arası toplamlar eklenir.
+    Toplam süre yaklaşık olarak en yavaş firmanın süresi kadardır.
+    """
+    tenants = [(t.firma, t.period or logo_service.period_no) for t in request.tenants]
+    try:
+        return await report_fanout.run(
+            request.report, tenants, params=request.params, totals=request.totals,
+            group_by=request.group_by, concurrency=request.concurrency
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/reports/sales")
 async def get_logo_sales_report(
     start_date: str = Query(..., description="YYYY-MM-DD"),
     end_date: str = Query(..., description="YYYY-MM-DD"),
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Satış Raporu**
 
     Tarih aralığındaki satışları fatura bazında listeler.
     """
-    return await logo_service.get_sales_report(start_date, end_date, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_sales_report(start_date, end_date, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/collections")
 async def get_logo_collection_report(
     start_date: str,
     end_date: str,
-    x_firma: Optional[str] = Header(None)
+    x_firma: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Tahsilat Raporu**
 
     Nakit, Çek, Senet, Kredi Kartı tahsilatlarını raporlar.
     """
-    return await logo_service.get_collection_report(start_date, end_date, firma=x_firma)
+    return _report_response(await logo_service.get_collection_report(start_date, end_date, firma=x_firma, stream=bool(stream)), stream)
 
 @router.get("/reports/balances")
 async def get_logo_customer_balances(
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Cari Bakiye Raporu**
 
     Tüm müşterilerin güncel borç/alacak bakiyelerini döner.
     """
-    return await logo_service.get_customer_balances(firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_customer_balances(firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/inventory")
 async def get_logo_inventory_report(
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Envanter Raporu**
 
     Stoktaki ürünlerin miktar ve maliyet değerlerini raporlar.
     """
-    return await logo_service.get_inventory_status(firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_inventory_status(firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/top-selling")
 async def get_logo_top_selling_report(
     limit: int = 10,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **En Çok Satanlar**
 
     Miktar veya ciro bazında en çok satan ürünleri listeler.
     """
-    return await logo_service.get_top_selling_products(limit, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_top_selling_products(limit, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/visits")
-async def get_logo_visit_report(start_date: str, end_date: str):
+async def get_logo_visit_report(start_date: str, end_date: str, stream: Optional[str] = STREAM_QUERY):
     """
     **Ziyaret Performansı**
 
     Satış temsilcilerinin müşteri ziyaret sayılarını raporlar.
     (Eğer sistemde ziyaret modülü aktifse)
     """
-    return await logo_service.get_visit_performance_report(start_date, end_date)
+    return _report_response(await logo_service.get_visit_performance_report(start_date, end_date, stream=bool(stream)), stream)
 
 @router.get("/reports/order-tracking")
 async def get_logo_order_tracking_report(
     start_date: str, 
     end_date: str,
-    x_firma: Optional[str] = Header(None)
+    x_firma: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Sipariş Karşılama Raporu**
 
     Alınan siparişlerin ne kadarının sevk edildiğini (karşılama oranı) gösterir.
     """
-    return await logo_service.get_order_tracking_report(start_date, end_date, firma=x_firma)
+    return _report_response(await logo_service.get_order_tracking_report(start_date, end_date, firma=x_firma, stream=bool(stream)), stream)
 
 @router.get("/reports/leaderboard")
 async def get_logo_leaderboard(
     start_date: str, 
     end_date: str,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Plasiyer Sıralaması (Leaderboard)**
 
     Satış temsilcilerini ciroya göre sıralar.
     """
-    return await logo_service.get_salesman_leaderboard(start_date, end_date, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_salesman_leaderboard(start_date, end_date, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/aging")
 async def get_logo_aging_report(
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Yaşlandırma Raporu (Aging)**
 
     Borçların vadesine göre dağılımını (0-30, 30-60, 60-90, 90+ gün) gösterir.
     """
-    return await logo_service.get_debt_aging_report(firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_debt_aging_report(firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/categories")
 async def get_logo_category_analysis(
     start_date: str, 
     end_date: str,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Kategori Analizi**
 
     Ürün grubu (STGRPCODE) bazında satış dağılımı.
     """
-    return await logo_service.get_category_sales_analysis(start_date, end_date, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_category_sales_analysis(start_date, end_date, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/churn")
 async def get_logo_churn_report(
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Churn (Riskli Müşteri) Analizi**
 
     Uzun süredir sipariş vermeyen müşterileri tespit eder.
     """
-    return await logo_service.get_churn_risk_report(firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_churn_risk_report(firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/profitability")
 async def get_logo_profitability_analysis(
     start_date: str, 
     end_date: str,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Karlılık Analizi**
 
     Fatura maliyetleri üzerinden brüt kar marjını hesaplar.
     """
-    return await logo_service.get_profitability_analysis(start_date, end_date, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_profitability_analysis(start_date, end_date, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/targets")
 async def get_logo_target_achievement(
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Hedef Gerçekleşme**
 
     Aylık satış hedeflerine göre gerçekleşme oranlarını raporlar.
     """
-    return await logo_service.get_target_achievement_report(firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_target_achievement_report(firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/cross-history")
 async def get_logo_cross_history(
     customer_code: str,
     item_code: str,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Ürün-Müşteri Tarihçesi**
 
     Bir müşterinin belirli bir ürünü en son ne zaman, kaça aldığı bilgisi.
     """
-    return await logo_service.get_customer_product_history(customer_code, item_code, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_customer_product_history(customer_code, item_code, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/doc-chain")
 async def get_logo_doc_chain(
     start_date: str, 
     end_date: str,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Belge Bağlantı Raporu**
 
     Sipariş -> İrsaliye -> Fatura zincirini takip eder.
     """
-    return await logo_service.get_document_chain_report(start_date, end_date, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_document_chain_report(start_date, end_date, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/lines")
 async def get_logo_lines(
     type: str,
     fiche_no: str,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Fiş Satır Detayları**
 
     Fatura veya siparişin satırlarını (ürün, miktar, fiyat) döner.
     """
-    return await logo_service.get_detailed_line_report(type, fiche_no, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_detailed_line_report(type, fiche_no, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/pos-daily")
 async def get_logo_pos_daily(
     date: str,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Günlük Kasa Raporu**
     """
-    return await logo_service.get_pos_daily_report(date, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_pos_daily_report(date, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/lot-expiry")
 async def get_logo_lot_expiry(
     days: int = 30,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **SKT Yaklaşanlar (Lot/Seri)**
     """
-    return await logo_service.get_lot_expiry_report(days, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_lot_expiry_report(days, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/transfers")
 async def get_logo_transfers(
     start_date: str, 
     end_date: str,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Depo Transfer Raporu**
     """
-    return await logo_service.get_stock_transfer_report(start_date, end_date, firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_stock_transfer_report(start_date, end_date, firma=x_firma, period=x_period, stream=bool(stream)), stream)
 
 @router.get("/reports/cashflow")
 async def get_logo_cashflow(
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Nakit Akış Raporu**
     """
-    return await logo_service.get_cashflow_report(firma=x_firma, period=x_period)
+    return _report_response(await logo_service.get_cashflow_report(firma=x_firma, period=x_period, stream=bool(stream)), stream)
+
+@router.get("/reports/catalog")
+async def get_logo_report_catalog():
+    """
+    **Genel Rapor Kataloğu**
+
+    Tanımlı rapor kodları; parametre şemaları, maliyet sınıfı, önbellek süresi ve akış desteği ile.
+    """
+    return {"reports": report_catalog.describe()}
 
 @router.get("/reports/generic/{report_code}")
 async def get_logo_generic_report(
     report_code: str,
+    request: Request,
     x_firma: Optional[str] = Header(None),
-    x_period: Optional[str] = Header(None)
+    x_period: Optional[str] = Header(None),
+    stream: Optional[str] = STREAM_QUERY
 ):
     """
     **Genel Rapor Getir**
 
     Tanımlı özel SQL raporlarını (Generic Reports) çalıştırır.
+    Rapor parametreleri sorgu dizesinden okunur (ör. `?start_date=2024-01-01`); şemalar için `/reports/catalog`.
+    Varsayılan yanıt JSON'dur; akış destekleyen raporlar (katalogda `stream: true`) `?stream=ndjson` ile akış olarak alınabilir.
     """
-    return await logo_service.get_report_data(report_code, firma=x_firma, period=x_period)
+    if report_code not in report_catalog:
+        raise HTTPException(status_code=404, detail=f"Tanımsız rapor kodu: {report_code}")
+    params = {k: v for k, v in request.query_params.items() if k != "stream"}
+    try:
+        result = await logo_service.get_report_data(report_code, firma=x_firma, period=x_period, params=params, stream=bool(stream))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _report_response(result, stream)
 
 @router.get("/reports/yoy-comparison")
 async def get_yoy_comparison(
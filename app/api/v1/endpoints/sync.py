@@ -1,30 +1,148 @@
-from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
 from typing import Optional, List, Dict, Any
+from app.core.config import settings
 from app.services.sync_service import sync_service
+from app.services import snapshot_codec
+from app.services.scheduler_service import scheduler_service
+from app.services.report_catalog import report_catalog
+from app.core.database import db_manager
 from loguru import logger
 
 router = APIRouter()
 
+@router.get("/schedule")
+async def get_snapshot_schedule():
+    """Scheduled snapshot jobs with next run times, plus the current queue and running refreshes"""
+    return scheduler_service.snapshots.status()
+
+@router.post("/schedule/reload")
+async def reload_snapshot_schedule():
+    """Re-read snapshot_schedule.json and rebuild the snapshot jobs"""
+    scheduler_service.snapshots.reload()
+    return scheduler_service.snapshots.status()
+
+@router.post("/schedule/{report_code}/run")
+async def run_scheduled_snapshot(
+    report_code: str,
+    x_firma: Optional[str] = Header(None),
+    x_period: Optional[str] = Header(None)
+):
+    """Queue a refresh now through the scheduler (respects the concurrency limit, skips the busy/off-hours checks)"""
+    from app.services.logo_service import logo_service
+    if report_code not in report_catalog:
+        raise HTTPException(status_code=404, detail=f"Unknown report: {report_code}")
+    queued = scheduler_service.snapshots.submit(
+        report_code, x_firma or logo_service.firma_no, x_period or logo_service.period_no, force=True
+    )
+    return {"status": "queued" if queued else "already_queued", "report_code": report_code}
+
+@router.get("/runs")
+async def get_snapshot_runs(
+    report_code: Optional[str] = Query(None),
+    status: Optional[str] = Query(None, pattern="^(success|failed|skipped)$"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Snapshot refresh history with durations. Skipped runs are kept in memory only."""
+    if status == "skipped":
+        runs = [r for r in scheduler_service.snapshots.history
+                if r["status"] == "skipped" and (not report_code or r["report_code"] == report_code)]
+        return {"runs": runs[:limit]}
+
+    await sync_service.ensure_schema()
+    conditions, params = [], []
+    if report_code:
+        conditions.append("report_code = %s")
+        params.append(report_code)
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(limit)
+    runs = await db_manager.execute_pg_query_async(f"""
+        SELECT report_code, tenant_id, status, mode, fetched, row_count, duration_ms, error, started_at
+        FROM report_snapshot_runs {where} ORDER BY started_at DESC LIMIT %s
+    """, tuple(params))
+    summary = await db_manager.execute_pg_query_async("""
+        SELECT report_code, COUNT(*) AS runs, ROUND(AVG(duration_ms), 1) AS avg_ms, MAX(duration_ms) AS max_ms,
+               SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) AS failures
+        FROM report_snapshot_runs
+        WHERE started_at > CURRENT_TIMESTAMP - INTERVAL '7 days'
+        GROUP BY report_code ORDER BY avg_ms DESC
+    """)
+    return {"runs": runs or [], "last_7_days": summary or []}
+
 @router.post("/{report_code}/refresh")
 async def refresh_report_snapshot(
     report_code: str,
+    full: bool = Query(False, description="Force a full rebuild instead of a watermark-based refresh"),
     x_firma: Optional[str] = Header(None),
     x_period: Optional[str] = Header(None)
 ):
-    """Manually trigger a data snapshot refresh for a report"""
-    success = await sync_service.generate_and_save_snapshot(report_code, firma=x_firma, period=x_period)
-    if not success:
+    """Manually trigger a data snapshot refresh for a report (incremental where supported)"""
+    if report_code not in report_catalog:
+        raise HTTPException(status_code=404, detail=f"Unknown report: {report_code}")
+    result = await sync_service.generate_and_save_snapshot(report_code, firma=x_firma, period=x_period, full=full)
+    if not result:
         raise HTTPException(status_code=500, detail="Failed to refresh snapshot")
-    return {"status": "success", "message": f"Snapshot for {report_code} updated."}
+    return {"status": "success", "message": f"Snapshot for {report_code} updated.", **result}
 
 @router.get("/{report_code}/snapshot")
 async def get_report_snapshot(
     report_code: str,
+    offset: int = Query(0, ge=0, description="First row to return"),
+    limit: Optional[int] = Query(None, ge=1, description="Max rows to return"),
+    columns: Optional[str] = Query(None, description="Comma-separated column projection"),
+    format: str = Query("rows", pattern="^(columnar|rows)$", description="'rows' (default) or 'columnar' (schema + column arrays)"),
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
     x_firma: Optional[str] = Header(None),
     x_period: Optional[str] = Header(None)
 ):
-    """Retrieve the latest cached snapshot for a report (Offline-First support)"""
+    """
+    Retrieve the latest cached snapshot for a report (Offline-First support).
+    Default response is {snapshot_data: [...], version_id, updated_at}; with format=columnar
+    whole-snapshot reads are served as the stored compressed bytes.
+    """
     snapshot = await sync_service.get_latest_snapshot(report_code, firma=x_firma, period=x_period)
     if not snapshot:
         raise HTTPException(status_code=404, detail="No snapshot found for this report.")
-    return snapshot
+
+    etag = f'"{report_code}-{x_firma or settings.LOGO_FIRMA_NO}-{x_period or settings.LOGO_PERIOD_NO}-{snapshot["version_id"]}"'
+    headers = {
+        "ETag": etag,
+        "X-Snapshot-Version": str(snapshot["version_id"]),
+        "X-Snapshot-Updated": snapshot["updated_at"].isoformat() if snapshot.get("updated_at") else "",
+        "X-Row-Count": str(snapshot.get("row_count") or 0),
+        "Vary": "Accept-Encoding",
+    }
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+
+    encoding = snapshot["snapshot_encoding"]
+    accepted = {e.split(";")[0].strip() for e in (accept_encoding or "").split(",")}
+    whole = format == "columnar" and offset == 0 and limit is None and not columns
+    if whole and encoding in accepted:
+        return Response(
+            content=snapshot["snapshot_blob"],
+            media_type="application/json",
+            headers={**headers, "Content-Encoding": encoding}
+        )
+
+    doc = snapshot_codec.decode(snapshot["snapshot_blob"], encoding)
+    try:
+        selected = snapshot_codec.select(
+            doc, [c.strip() for c in columns.split(",") if c.strip()] if columns else None, offset, limit
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown column(s): {e.args[0]}")
+    if format == "rows":
+        body = {
+            "snapshot_data": snapshot_codec.to_rows(selected),
+            "version_id": snapshot["version_id"],
+            "updated_at": headers["X-Snapshot-Updated"] or None,
+        }
+        if offset or limit is not None or columns:
+            body.update(row_count=selected["row_count"], offset=offset, limit=limit)
+        return JSONResponse(content=body, headers=headers)
+    return JSONResponse(content=selected, headers=headers)
@@ -17,6 +17,76 @@ class Settings(BaseSettings):
     # Database Configurations (Legacy JSON support)
     DB_CONFIGS: List[Dict[str, Any]] = []
 
+    # Connection Pool (per named DB config, see DatabaseManager)
+    DB_POOL_MIN_SIZE: int = 1
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_TIMEOUT: float = 30.0        # seconds to wait for a free connection
+    DB_POOL_MAX_IDLE: int = 300          # close idle connections after N seconds
+    DB_POOL_MAX_LIFETIME: int = 3600     # recycle connections older than N seconds
+    DB_STREAM_BATCH_SIZE: int = 1000     # fetchmany size for streamed reports
+
+    # Logo query telemetry (see app/services/profiler_service.py)
+    QUERY_TAGGING_ENABLED: bool = True       # prefix MSSQL statements with /* exfin:<endpoint> */
+    QUERY_TAG_REQUEST_ID: bool = False       # also put the request id in SESSION_CONTEXT(N'exfin_rid') (one extra RPC per statement)
+    QUERY_STATS_INTERVAL_SECONDS: int = 60   # dm_exec_query_stats collector interval, 0 = off
+
+    # Logo Report Cache (see app/services/report_cache.py)
+    REPORT_CACHE_DEFAULT_TTL: int = 60
+    REPORT_CACHE_MAX_ENTRIES: int = 500
+    REPORT_CACHE_MAX_ROWS: int = 500000
+
+    # Keyset-paginated Logo lists (/logo/erp customers, items, services, orders)
+    LOGO_LIST_DEFAULT_LIMIT: int = 100
+    LOGO_LIST_MAX_LIMIT: int = 1000
+    LOGO_SEARCH_INDEX_ENABLED: bool = True    # customer/item search from the in-memory index (falls back to LIKE while building)
+
+    # Logo master-data dimension cache (see app/services/dimension_cache.py)
+    DIMENSION_CACHE_REFRESH_SECONDS: int = 300         # delta refresh interval, 0 = off
+    DIMENSION_CACHE_FULL_RELOAD_SECONDS: int = 86400   # full reload (picks up deletions)
+    SALES_ROLLUP_REFRESH_SECONDS: int = 300            # incremental daily sales rollup refresh, 0 = off
+    SALES_ROLLUP_LOOKBACK_DAYS: int = 3                # recent days always re-aggregated (catches deletions)
+    SALES_ROLLUP_FULL_EVERY_HOURS: int = 24            # full re-aggregation per firm/period (older deletions/cancels), 0 = off
+    COMPARISON_CACHE_SECONDS: int = 300                # in-memory daily series used by the comparison engine
+
+    # Logo master-data sync (see app/services/master_data_sync.py)
+    MASTER_SYNC_BATCH_SIZE: int = 5000   # Logo rows per keyset page / PostgreSQL merge
+    MASTER_SYNC_FULL_EVERY_HOURS: int = 24   # auto mode: full reconciliation (catches deletes) after N hours
+    MASTER_SYNC_CONCURRENCY: int = 3   # orchestrated sync: entity syncs running at once (Logo + PG connections each)
+    MASTER_SYNC_PROGRESS_INTERVAL: float = 1.0   # seconds between websocket progress messages per step
+
+    # Multi-firm report fan-out (see app/services/report_fanout.py)
+    REPORT_FANOUT_CONCURRENCY: int = 4   # firms/periods queried at once
+    REPORT_FANOUT_TIMEOUT: float = 120.0 # per firm/period
+
+    # ERP transfer outbox (see app/services/transfer_outbox.py)
+    OUTBOX_WORKERS: int = 4
+    OUTBOX_PER_FIRM_CONCURRENCY: int = 2
+    OUTBOX_MAX_ATTEMPTS: int = 6
+    OUTBOX_BACKOFF_BASE: float = 5.0     # seconds, doubled per attempt
+    OUTBOX_BACKOFF_MAX: float = 900.0
+    OUTBOX_POLL_INTERVAL: float = 2.0
+    OUTBOX_JOB_TIMEOUT: float = 300.0
+
+    # Unity Objects session pool (see app/services/unity_pool.py)
+    UNITY_BACKEND: str = "com"               # com | fake (pure-Python stand-in)
+    UNITY_POOL_MAX_SIZE: int = 4
+    UNITY_POOL_IDLE_TIMEOUT: int = 600       # logout after N idle seconds
+    UNITY_POOL_HEALTH_INTERVAL: int = 60     # re-check sessions idle longer than this
+    UNITY_POOL_ACQUIRE_TIMEOUT: float = 60.0
+
+    # Streaming Logo XML import (see XmlService.import_xml_stream)
+    XML_IMPORT_BATCH_SIZE: int = 50        # records per DataFromXML call
+    XML_IMPORT_CONCURRENCY: int = 4        # batches in flight (bounded by UNITY_POOL_MAX_SIZE)
+
+    # Report snapshots (see app/services/sync_service.py)
+    SNAPSHOT_DATE_LOOKBACK_DAYS: int = 7   # date-watermarked reports re-read this many days
+    SNAPSHOT_COMPRESSION: str = "gzip"     # gzip | zstd (needs the zstandard package)
+    SNAPSHOT_SCHEDULE_ENABLED: bool = True    # per-report overrides in snapshot_schedule.json
+    SNAPSHOT_MAX_CONCURRENCY: int = 2          # snapshot queries running against Logo at once
+    SNAPSHOT_REFRESH_INTERVAL_MINUTES: int = 60
+    SNAPSHOT_OFF_HOURS: str = "22:00-06:00"    # window for heavy reports
+    SNAPSHOT_BUSY_THRESHOLD: int = 20          # skip runs above this many active Logo requests
+
     # PostgreSQL Env Params
     DB_HOST: str = "localhost"
     DB_PORT: int = 5432
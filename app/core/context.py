@@ -1,3 +1,4 @@
+import re
 from contextvars import ContextVar
 from typing import Optional
 
@@ -8,3 +9,26 @@ def set_tenant_id(tenant_id: str):
 
 def get_current_tenant_id() -> Optional[str]:
     return tenant_id_context.get()
+
+# (ASGI scope, request id) of the API request being served; used to tag Logo SQL
+request_context: ContextVar[Optional[tuple]] = ContextVar("request_context", default=None)
+
+_TAG_UNSAFE = re.compile(r"[^\w /{}.:-]")
+
+def set_request_context(scope: dict, request_id: str):
+    request_context.set((scope, request_id))
+
+def get_query_tag() -> str:
+    """'GET /api/v1/logo/erp/reports/generic/{report_code}' or 'background' outside a request"""
+    current = request_context.get()
+    if current is None:
+        return "background"
+    scope, _ = current
+    # The router stores the matched route in the (shared) scope, so templates are available once routed
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return _TAG_UNSAFE.sub("_", f"{scope.get('method', '')} {path}")[:200]
+
+def get_request_id() -> Optional[str]:
+    current = request_context.get()
+    return current[1] if current else None
@@ -1,8 +1,37 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import pymssql
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from loguru import logger
 from .config import settings
+from .db_pool import ConnectionPool, PoolTimeoutError
+from .context import get_query_tag, get_request_id
+
+class QueryCancelToken:
+    """Lets an awaiting coroutine abort the query running on a worker thread"""
+
+    def __init__(self):
+        self.cancelled = False
+        self.conn = None
+        self.cursor = None
+
+    def cancel(self):
+        self.cancelled = True
+        # Best effort: psycopg2 -> conn.cancel(), pyodbc -> cursor.cancel(), pymssql -> conn._conn.cancel()
+        for target in (self.cursor, self.conn, getattr(self.conn, "_conn", None)):
+            cancel = getattr(target, "cancel", None)
+            if callable(cancel):
+                try:
+                    cancel()
+                    return
+                except Exception:
+                    continue
 
 class DatabaseManager:
     _instance = None
@@ -10,20 +39,13 @@ class DatabaseManager:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(DatabaseManager, cls).__new__(cls)
-            cls._instance.connections = {}
+            cls._instance.pools = {}
+            cls._instance.executors = {}
+            cls._instance._pools_lock = threading.Lock()
         return cls._instance
-    
-    def get_connection(self, name: str):
-        """Get or create a connection by its Name from db_config.json"""
-        if name in self.connections:
-            conn = self.connections[name]
-            # Check if closed
-            if hasattr(conn, 'closed') and conn.closed:
-                del self.connections[name]
-            else:
-                return conn
-                
-        # Connection not found or closed, create new
+
+    def _resolve_config(self, name: str):
+        """Find connection config by its Name in db_config.json (or env fallback)"""
         config = next((c for c in settings.DB_CONFIGS if c.get("Name") == name), None)
         
         # Fallback to Env Variables if not found in db_config.json
@@ -53,7 +75,86 @@ class DatabaseManager:
             else:
                 logger.error(f"Database configuration '{name}' not found.")
                 return None
-            
+        return config
+
+    def get_pool(self, name: str):
+        """Get or create the connection pool for a named DB config"""
+        pool = self.pools.get(name)
+        if pool is not None:
+            return pool
+        with self._pools_lock:
+            pool = self.pools.get(name)
+            if pool is not None:
+                return pool
+            config = self._resolve_config(name)
+            if not config:
+                return None
+            # Per-connection overrides in db_config.json: PoolMinSize, PoolMaxSize, PoolTimeout
+            pool = ConnectionPool(
+                name,
+                lambda: self._connect(name, config),
+                min_size=int(config.get("PoolMinSize", settings.DB_POOL_MIN_SIZE)),
+                max_size=int(config.get("PoolMaxSize", settings.DB_POOL_MAX_SIZE)),
+                timeout=float(config.get("PoolTimeout", settings.DB_POOL_TIMEOUT)),
+                max_idle=settings.DB_POOL_MAX_IDLE,
+                max_lifetime=settings.DB_POOL_MAX_LIFETIME
+            )
+            self.pools[name] = pool
+            return pool
+
+    def get_connection(self, name: str):
+        """
+        Borrow a connection from the named pool.
+        Must be given back with release_connection(); prefer the connection() context manager.
+        """
+        pool = self.get_pool(name)
+        if not pool: return None
+        return pool.acquire()
+
+    def release_connection(self, name: str, conn, broken: bool = False):
+        """Return a connection borrowed with get_connection()"""
+        pool = self.pools.get(name)
+        if pool:
+            pool.release(conn, broken=broken)
+
+    @contextmanager
+    def connection(self, name: str):
+        """Borrow a pooled connection for the duration of a with-block (yields None on failure)"""
+        pool = self.get_pool(name)
+        if not pool:
+            yield None
+            return
+        with pool.connection() as conn:
+            yield conn
+
+    def pool_stats(self):
+        """Per-pool usage statistics"""
+        return {name: pool.stats() for name, pool in list(self.pools.items())}
+
+    def get_executor(self, name: str):
+        """Dedicated worker threads per DB, sized to its pool so workers never queue on checkout"""
+        executor = self.executors.get(name)
+        if executor is not None:
+            return executor
+        pool = self.get_pool(name)
+        with self._pools_lock:
+            executor = self.executors.get(name)
+            if executor is None:
+                workers = pool.max_size if pool else 1
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"db-{name}")
+                self.executors[name] = executor
+            return executor
+
+    def close_all(self):
+        """Close idle pooled connections and stop query workers (shutdown)"""
+        for executor in list(self.executors.values()):
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.executors.clear()
+        for pool in list(self.pools.values()):
+            pool.close_all()
+
+    def _connect(self, name: str, config: dict):
+        """Open a new raw connection for the given config"""
         try:
             db_type = config.get("Type")
             if db_type == "PostgreSQL":
@@ -129,43 +230,246 @@ class DatabaseManager:
                 logger.error(f"Unsupported database type: {db_type}")
                 return None
                 
-            self.connections[name] = conn
             logger.info(f"Connected to {name} ({db_type}) successfully.")
             return conn
         except Exception as e:
             logger.error(f"Connection failed for {name}: {e}")
             return None
 
-    def execute_pg_query(self, query: str, params: tuple = None, fetch: bool = True):
+    @staticmethod
+    def _safe_rollback(conn) -> bool:
+        try:
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def execute_pg_query(self, query: str, params: tuple = None, fetch: bool = True, cancel_token: QueryCancelToken = None):
         """Execute PostgreSQL query using default DB"""
-        conn = self.get_connection(settings.DEFAULT_DB)
+        if cancel_token and cancel_token.cancelled: return None
+        pool = self.get_pool(settings.DEFAULT_DB)
+        if not pool: return None
+        try:
+            conn = pool.acquire()
+        except PoolTimeoutError as e:
+            logger.error(f"PostgreSQL pool timeout: {e}")
+            return None
         if not conn: return None
+        broken = False
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                if cancel_token:
+                    cancel_token.conn, cancel_token.cursor = conn, cur
                 cur.execute(query, params)
-                if fetch:
-                    return cur.fetchall()
-                conn.commit()
-                return True
+                result = cur.fetchall() if fetch else True
+            # Commit in both modes: INSERT ... RETURNING runs with fetch=True
+            conn.commit()
+            return result
         except Exception as e:
             logger.error(f"PostgreSQL execution error: {e}")
-            conn.rollback()
+            broken = not self._safe_rollback(conn)
             return None
+        finally:
+            if cancel_token:
+                broken = broken or cancel_token.cancelled
+                cancel_token.conn = cancel_token.cursor = None
+            pool.release(conn, broken=broken)
+
+    @staticmethod
+    def _tag_ms(query: str) -> str:
+        """Prefix MSSQL text with the calling endpoint (read back from the DMVs by profiler_service)"""
+        if not settings.QUERY_TAGGING_ENABLED:
+            return query
+        return f"/* exfin:{get_query_tag()} */ {query}"
 
-    def execute_ms_query(self, query: str, params: tuple = None, fetch: bool = True, db_name: str = "LOGO_Database"):
+    @staticmethod
+    def _mark_request(cur):
+        """Request id in SESSION_CONTEXT(N'exfin_rid') instead of the statement text, so plans stay shared (None clears it)"""
+        if not (settings.QUERY_TAGGING_ENABLED and settings.QUERY_TAG_REQUEST_ID):
+            return
+        try:
+            cur.callproc("sp_set_session_context", ("exfin_rid", get_request_id()))
+        except Exception as e:
+            logger.warning(f"sp_set_session_context failed (SQL Server 2016+ required): {e}")
+
+    def execute_ms_query(self, query: str, params: tuple = None, fetch: bool = True, db_name: str = "LOGO_Database",
+                         cancel_token: QueryCancelToken = None):
         """Execute MSSQL query using named DB"""
-        conn = self.get_connection(db_name)
+        if cancel_token and cancel_token.cancelled: return None
+        pool = self.get_pool(db_name)
+        if not pool: return None
+        try:
+            conn = pool.acquire()
+        except PoolTimeoutError as e:
+            logger.error(f"MSSQL ({db_name}) pool timeout: {e}")
+            return None
         if not conn: return None
+        broken = False
         try:
             with conn.cursor(as_dict=True) as cur:
-                cur.execute(query, params)
+                if cancel_token:
+                    cancel_token.conn, cancel_token.cursor = conn, cur
+                self._mark_request(cur)
+                cur.execute(self._tag_ms(query), params)
                 if fetch:
                     return cur.fetchall()
                 conn.commit()
                 return True
         except Exception as e:
             logger.error(f"MSSQL ({db_name}) execution error: {e}")
+            broken = not self._safe_rollback(conn)
             return None
+        finally:
+            if cancel_token:
+                broken = broken or cancel_token.cancelled
+                cancel_token.conn = cancel_token.cursor = None
+            pool.release(conn, broken=broken)
+
+    # --- Streaming (server-side cursors, constant memory) ---
+
+    def _stream_conn(self, name: str):
+        """Connection for a stream; raises instead of returning None so callers can't mistake it for an empty result"""
+        pool = self.get_pool(name)
+        if not pool:
+            raise RuntimeError(f"No connection pool for {name}")
+        try:
+            conn = pool.acquire()
+        except PoolTimeoutError as e:
+            logger.error(f"{name} pool timeout (stream): {e}")
+            raise
+        if not conn:
+            raise RuntimeError(f"No connection available for {name}")
+        return conn, pool
+
+    def stream_pg_query(self, query: str, params: tuple = None, batch_size: int = None):
+        """
+        Generator over a PostgreSQL result using a named (server-side) cursor.
+        Rows are fetched in `batch_size` chunks; the pooled connection is held until the generator is closed.
+        Errors are raised (after rollback/release), not swallowed: a stream that stops early must not look complete.
+        """
+        batch_size = batch_size or settings.DB_STREAM_BATCH_SIZE
+        conn, pool = self._stream_conn(settings.DEFAULT_DB)
+        broken = False
+        try:
+            with conn.cursor(name=f"exfin_stream_{uuid.uuid4().hex[:12]}", cursor_factory=RealDictCursor) as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+            conn.commit()
+        except GeneratorExit:
+            broken = not self._safe_rollback(conn)
+            raise
+        except Exception as e:
+            logger.error(f"PostgreSQL stream error: {e}")
+            broken = not self._safe_rollback(conn)
+            raise
+        finally:
+            pool.release(conn, broken=broken)
+
+    def stream_ms_query(self, query: str, params: tuple = None, batch_size: int = None, db_name: str = "LOGO_Database"):
+        """
+        Generator over an MSSQL result using fetchmany batches (pymssql reads rows off the wire as they are fetched).
+        A generator closed before exhaustion discards its connection, since the pending result set can't be reused.
+        Errors are raised like in stream_pg_query.
+        """
+        batch_size = batch_size or settings.DB_STREAM_BATCH_SIZE
+        conn, pool = self._stream_conn(db_name)
+        exhausted = False
+        try:
+            with conn.cursor(as_dict=True) as cur:
+                self._mark_request(cur)
+                cur.execute(self._tag_ms(query), params)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+            exhausted = True
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            logger.error(f"MSSQL ({db_name}) stream error: {e}")
+            exhausted = self._safe_rollback(conn)
+            raise
+        finally:
+            pool.release(conn, broken=not exhausted)
+
+    async def _iter_async(self, db_name: str, gen, batch_size: int):
+        """Drive a blocking row generator from the event loop, one batch per worker hop"""
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor(db_name)
+        ctx = contextvars.copy_context()  # request context (query tags) follows the generator into the workers
+
+        def next_batch():
+            batch = []
+            for row in gen:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    break
+            return batch
+
+        try:
+            while True:
+                batch = await loop.run_in_executor(executor, ctx.run, next_batch)
+                if not batch:
+                    break
+                for row in batch:
+                    yield row
+        finally:
+            await loop.run_in_executor(executor, ctx.run, gen.close)
+
+    async def stream_pg_query_async(self, query: str, params: tuple = None, batch_size: int = None):
+        """Async generator variant of stream_pg_query"""
+        batch_size = batch_size or settings.DB_STREAM_BATCH_SIZE
+        async for row in self._iter_async(settings.DEFAULT_DB, self.stream_pg_query(query, params, batch_size), batch_size):
+            yield row
+
+    async def stream_ms_query_async(self, query: str, params: tuple = None, batch_size: int = None, db_name: str = "LOGO_Database"):
+        """Async generator variant of stream_ms_query"""
+        batch_size = batch_size or settings.DB_STREAM_BATCH_SIZE
+        async for row in self._iter_async(db_name, self.stream_ms_query(query, params, batch_size, db_name), batch_size):
+            yield row
+
+    # --- Async facade (runs blocking drivers on per-DB worker threads) ---
+
+    async def _run_async(self, db_name: str, func, timeout: float = None):
+        token = QueryCancelToken()
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        future = loop.run_in_executor(self.get_executor(db_name), ctx.run, functools.partial(func, cancel_token=token))
+        try:
+            if timeout:
+                return await asyncio.wait_for(future, timeout)
+            return await future
+        except asyncio.TimeoutError:
+            token.cancel()
+            logger.error(f"Query on {db_name} cancelled after {timeout}s timeout")
+            return None
+        except asyncio.CancelledError:
+            # Client went away / task cancelled: stop the server-side query too
+            token.cancel()
+            raise
+
+    async def execute_pg_query_async(self, query: str, params: tuple = None, fetch: bool = True, timeout: float = None):
+        """Awaitable execute_pg_query; does not block the event loop"""
+        return await self._run_async(
+            settings.DEFAULT_DB,
+            functools.partial(self.execute_pg_query, query, params, fetch),
+            timeout
+        )
+
+    async def execute_ms_query_async(self, query: str, params: tuple = None, fetch: bool = True,
+                                     db_name: str = "LOGO_Database", timeout: float = None):
+        """Awaitable execute_ms_query; does not block the event loop"""
+        return await self._run_async(
+            db_name,
+            functools.partial(self.execute_ms_query, query, params, fetch, db_name),
+            timeout
+        )
 
 db_manager = DatabaseManager()
 
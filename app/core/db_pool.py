@@ -0,0 +1,235 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out within the timeout"""
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool for DB-API connections (psycopg2 / pymssql / pyodbc).
+    Connections are validated on borrow and recycled when idle or aged.
+    """
+
+    def __init__(self, name: str, factory, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 30.0, max_idle: float = 300.0, max_lifetime: float = 3600.0,
+                 validate_after: float = 30.0):
+        self.name = name
+        self._factory = factory
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.validate_after = validate_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._created = {}    # id(conn) -> created_at (checked-out + idle)
+        self._size = 0
+
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "created": 0,
+            "closed": 0,
+            "validation_failures": 0,
+            "wait_time_total_ms": 0.0,
+            "wait_time_max_ms": 0.0,
+        }
+
+    # --- internal helpers ---
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created.pop(id(conn), None)
+            self._size -= 1
+            self._stats["closed"] += 1
+            self._cond.notify()
+
+    def _is_alive(self, conn) -> bool:
+        """Cheap liveness check: closed flag + SELECT 1"""
+        if getattr(conn, "closed", False):
+            return False
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchall()
+            conn.rollback()  # don't leave an idle transaction behind
+            return True
+        except Exception:
+            return False
+        finally:
+            if cur is not None:
+                try:
+                    cur.close()
+                except Exception:
+                    pass
+
+    def _expired(self, created_at: float, last_used: float, now: float) -> bool:
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return True
+        if self.max_idle and now - last_used > self.max_idle and self._size > self.min_size:
+            return True
+        return False
+
+    def _prune_locked(self, now: float):
+        """Drop idle connections that are too old (caller holds the lock)"""
+        stale = []
+        kept = deque()
+        while self._idle:
+            entry = self._idle.popleft()
+            if self._expired(entry[1], entry[2], now):
+                stale.append(entry[0])
+                self._size -= 1
+                self._created.pop(id(entry[0]), None)
+                self._stats["closed"] += 1
+            else:
+                kept.append(entry)
+        self._idle = kept
+        return stale
+
+    # --- public API ---
+
+    def acquire(self, timeout: float = None):
+        """Borrow a connection. Blocks up to `timeout` seconds when the pool is exhausted."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            reuse = None
+            create = False
+            with self._cond:
+                stale = self._prune_locked(time.monotonic())
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Pool '{self.name}' exhausted ({self.max_size} connections busy, waited {timeout}s)"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    reuse = self._idle.pop()  # LIFO keeps hot connections hot
+                else:
+                    self._size += 1  # reserve a slot before connecting outside the lock
+                    create = True
+
+            for conn in stale:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+            if create:
+                try:
+                    conn = self._factory()
+                except Exception:
+                    conn = None
+                if conn is None:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    return None
+                now = time.monotonic()
+                with self._cond:
+                    self._created[id(conn)] = now
+                    self._stats["created"] += 1
+                    self._record_checkout(start)
+                return conn
+
+            conn, created_at, last_used = reuse
+            if time.monotonic() - last_used > self.validate_after and not self._is_alive(conn):
+                with self._cond:
+                    self._stats["validation_failures"] += 1
+                self._close(conn)
+                continue  # try again with the next idle one or a fresh connection
+
+            with self._cond:
+                self._record_checkout(start)
+            return conn
+
+    def _record_checkout(self, start: float):
+        waited = (time.monotonic() - start) * 1000
+        self._stats["checkouts"] += 1
+        self._stats["wait_time_total_ms"] += waited
+        if waited > self._stats["wait_time_max_ms"]:
+            self._stats["wait_time_max_ms"] = waited
+
+    def release(self, conn, broken: bool = False):
+        """Return a borrowed connection. Broken or aged connections are closed instead."""
+        if conn is None:
+            return
+        now = time.monotonic()
+        with self._cond:
+            created_at = self._created.get(id(conn))
+        if created_at is None:
+            # Not ours (or already discarded), just close it
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        if broken or getattr(conn, "closed", False) or (self.max_lifetime and now - created_at > self.max_lifetime):
+            self._close(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, created_at, now))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Context manager around acquire/release. Yields None if the DB is unreachable."""
+        conn = self.acquire(timeout)
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = conn is not None and getattr(conn, "closed", False)
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def close_all(self):
+        """Close all idle connections (used on shutdown / config reload)"""
+        with self._cond:
+            idle = [entry[0] for entry in self._idle]
+            self._idle.clear()
+            for conn in idle:
+                self._created.pop(id(conn), None)
+            self._size -= len(idle)
+            self._stats["closed"] += len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        with self._cond:
+            idle = len(self._idle)
+            s = dict(self._stats)
+            s.update({
+                "name": self.name,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "timeout": self.timeout,
+            })
+        s["wait_time_avg_ms"] = round(s["wait_time_total_ms"] / s["checkouts"], 2) if s["checkouts"] else 0.0
+        s["wait_time_total_ms"] = round(s["wait_time_total_ms"], 2)
+        s["wait_time_max_ms"] = round(s["wait_time_max_ms"], 2)
+        return s
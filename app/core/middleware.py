@@ -1,8 +1,10 @@
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from loguru import logger
+import re
 import time
 import uuid
+from app.core.context import set_request_context
 
 class LoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -32,3 +34,17 @@ class LoggingMiddleware(BaseHTTPMiddleware):
                     f"Request Failed: {e} | Took: {process_time:.2f}ms"
                 )
                 raise e # Let FastAPI exception handlers deal with it, but we logged it.
+
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+
+class QueryTagMiddleware(BaseHTTPMiddleware):
+    """Binds the endpoint and request id to the request context (Logo SQL tag / session context)"""
+    async def dispatch(self, request: Request, call_next):
+        request_id = request.headers.get("X-Request-ID", "")
+        if not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex[:16]
+        set_request_context(request.scope, request_id)
+        response = await call_next(request)
+        response.headers.setdefault("X-Request-ID", request_id)
+        return response
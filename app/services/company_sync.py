@@ -0,0 +1,182 @@
+import asyncio
+import time
+from psycopg2.extras import RealDictCursor, execute_values
+from loguru import logger
+from ..core.database import db_manager
+from ..core.config import settings
+
+FIRMS_SQL = """
+    SELECT NR AS logo_nr, CODE AS code, NAME AS name, TAXOFFICE AS tax_office, TAXNR AS tax_number, ADDR1 AS address
+    FROM L_CAPIFIRM WITH (NOLOCK)
+    WHERE NR > 0
+    ORDER BY NR
+"""
+
+PERIODS_SQL = """
+    SELECT FIRMNR AS firm_nr, NR AS period_nr, BEGDATE AS start_date, ENDDATE AS end_date
+    FROM L_CAPIPERIOD WITH (NOLOCK)
+    WHERE FIRMNR > 0
+    ORDER BY FIRMNR, NR
+"""
+
+# Columns compared for the diff (and refreshed on conflict)
+COMPANY_FIELDS = ("name", "tax_office", "tax_number", "address", "is_active")
+PERIOD_FIELDS = ("start_date", "end_date", "is_active")
+
+COMPANY_UPSERT = f"""
+    INSERT INTO companies (logo_nr, code, name, tax_office, tax_number, address, is_active)
+    VALUES %s
+    ON CONFLICT (logo_nr) DO UPDATE
+    SET name = EXCLUDED.name,
+        tax_office = EXCLUDED.tax_office,
+        tax_number = EXCLUDED.tax_number,
+        address = EXCLUDED.address,
+        is_active = true,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE ({', '.join(f'companies.{c}' for c in COMPANY_FIELDS)})
+          IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in COMPANY_FIELDS)})
+    RETURNING id, logo_nr, code, {', '.join(COMPANY_FIELDS)}, (xmax = 0) AS inserted
+"""
+
+# Periods resolve their company_id from logo_nr in the same statement
+PERIOD_UPSERT = f"""
+    INSERT INTO periods (company_id, logo_period_nr, code, name, start_date, end_date, is_active)
+    SELECT c.id, v.period_nr, v.code, v.name, v.start_date, v.end_date, true
+    FROM (VALUES %s) AS v (firm_nr, period_nr, code, name, start_date, end_date)
+    JOIN companies c ON c.logo_nr = v.firm_nr
+    ON CONFLICT (company_id, logo_period_nr) DO UPDATE
+    SET start_date = EXCLUDED.start_date,
+        end_date = EXCLUDED.end_date,
+        is_active = true,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE ({', '.join(f'periods.{c}' for c in PERIOD_FIELDS)})
+          IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in PERIOD_FIELDS)})
+    RETURNING id, company_id, logo_period_nr, name, {', '.join(PERIOD_FIELDS)}, (xmax = 0) AS inserted
+"""
+PERIOD_TEMPLATE = "(%s::int, %s::int, %s, %s, %s::date, %s::date)"
+
+SNAPSHOT_SQL = {
+    "companies": f"SELECT id, logo_nr, {', '.join(COMPANY_FIELDS)} FROM companies",
+    "periods": f"""
+        SELECT p.id, c.logo_nr, p.logo_period_nr, {', '.join(f'p.{c}' for c in PERIOD_FIELDS)}
+        FROM periods p JOIN companies c ON c.id = p.company_id
+    """,
+}
+
+DEACTIVATE_SQL = {
+    "companies": """
+        UPDATE companies SET is_active = false, updated_at = CURRENT_TIMESTAMP
+        WHERE is_active AND NOT (logo_nr = ANY(%s))
+        RETURNING id, logo_nr, name
+    """,
+    "periods": """
+        UPDATE periods p SET is_active = false, updated_at = CURRENT_TIMESTAMP
+        FROM companies c
+        WHERE c.id = p.company_id AND p.is_active
+          AND NOT EXISTS (SELECT 1 FROM unnest(%s::int[], %s::int[]) AS v (firm_nr, period_nr)
+                          WHERE v.firm_nr = c.logo_nr AND v.period_nr = p.logo_period_nr)
+        RETURNING p.id, c.logo_nr, p.logo_period_nr, p.name
+    """,
+}
+
+
+def _changes(old: dict, new: dict, fields) -> dict:
+    return {f: {"old": old[f], "new": new[f]} for f in fields if old[f] != new[f]}
+
+
+class CompanySyncService:
+    """
+    Mirrors Logo firms (L_CAPIFIRM) and periods (L_CAPIPERIOD) into companies / periods.
+    Both Logo tables are read with one query each; both upserts, and the deactivation of
+    firms/periods Logo no longer has, run as batched statements in a single transaction.
+    The result is a diff: inserted / updated (with old and new values) / deactivated rows.
+    """
+
+    def _apply(self, firms: list, periods: list) -> dict:
+        firm_values = [
+            (f["logo_nr"], f["code"] or str(f["logo_nr"]).zfill(3), f["name"] or "",
+             f.get("tax_office") or "", f.get("tax_number") or "", f.get("address") or "", True)
+            for f in firms
+        ]
+        period_values = [
+            (p["firm_nr"], p["period_nr"], f"{p['period_nr']:02d}",
+             str(p["start_date"].year if p.get("start_date") else p["period_nr"]), p.get("start_date"), p.get("end_date"))
+            for p in periods
+        ]
+        with db_manager.connection(settings.DEFAULT_DB) as conn:
+            if conn is None:
+                raise RuntimeError("PostgreSQL unavailable")
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    before = {}
+                    for table, sql in SNAPSHOT_SQL.items():
+                        cur.execute(sql)
+                        before[table] = cur.fetchall()
+                    companies = execute_values(cur, COMPANY_UPSERT, firm_values, page_size=len(firm_values), fetch=True)
+                    synced_periods = execute_values(
+                        cur, PERIOD_UPSERT, period_values, template=PERIOD_TEMPLATE, page_size=max(len(period_values), 1), fetch=True
+                    ) if period_values else []
+                    cur.execute(DEACTIVATE_SQL["companies"], ([v[0] for v in firm_values],))
+                    gone_companies = cur.fetchall()
+                    cur.execute(DEACTIVATE_SQL["periods"], ([v[0] for v in period_values], [v[1] for v in period_values]))
+                    gone_periods = cur.fetchall()
+                    cur.execute("SELECT id, logo_nr, code, name FROM companies WHERE is_active ORDER BY logo_nr")
+                    active = cur.fetchall()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        old_companies = {r["logo_nr"]: r for r in before["companies"]}
+        logo_nr_of = {r["id"]: r["logo_nr"] for r in before["companies"] + companies}
+        old_periods = {(r["logo_nr"], r["logo_period_nr"]): r for r in before["periods"]}
+        company_diff = {"inserted": [], "updated": [], "deactivated": gone_companies}
+        for r in companies:
+            if r["inserted"]:
+                company_diff["inserted"].append({"id": r["id"], "logo_nr": r["logo_nr"], "name": r["name"]})
+            else:
+                company_diff["updated"].append({"id": r["id"], "logo_nr": r["logo_nr"], "name": r["name"],
+                                                "changes": _changes(old_companies[r["logo_nr"]], r, COMPANY_FIELDS)})
+        company_diff["unchanged"] = len(firm_values) - len(companies)
+
+        period_diff = {"inserted": [], "updated": [], "deactivated": gone_periods}
+        for r in synced_periods:
+            key = (logo_nr_of.get(r["company_id"]), r["logo_period_nr"])
+            entry = {"id": r["id"], "logo_nr": key[0], "logo_period_nr": r["logo_period_nr"], "name": r["name"]}
+            if r["inserted"]:
+                period_diff["inserted"].append(entry)
+            else:
+                period_diff["updated"].append({**entry, "changes": _changes(old_periods[key], r, PERIOD_FIELDS)})
+        period_diff["unchanged"] = len(period_values) - len(synced_periods)
+        return {"companies": active, "diff": {"companies": company_diff, "periods": period_diff}}
+
+    async def sync(self) -> dict:
+        start = time.monotonic()
+        firms, periods = await asyncio.gather(
+            db_manager.execute_ms_query_async(FIRMS_SQL),
+            db_manager.execute_ms_query_async(PERIODS_SQL),
+        )
+        if not firms:
+            # Never reconcile against an empty or failed read: that would deactivate every company
+            raise LookupError("No companies found in Logo ERP")
+        if periods is None:
+            raise RuntimeError("Logo read failed for L_CAPIPERIOD")
+        firm_nrs = {f["logo_nr"] for f in firms}
+        periods = [p for p in periods if p["firm_nr"] in firm_nrs]
+
+        result = await asyncio.get_running_loop().run_in_executor(None, self._apply, firms, periods)
+        result.update(
+            synced_companies=len(firms),
+            synced_periods=len(periods),
+            duration_ms=round((time.monotonic() - start) * 1000, 1),
+        )
+        diff = result["diff"]
+        logger.info(
+            "Company sync: " + ", ".join(
+                f"{table} +{len(d['inserted'])} ~{len(d['updated'])} -{len(d['deactivated'])}" for table, d in diff.items()
+            ) + f" in {result['duration_ms']}ms"
+        )
+        return result
+
+
+company_sync = CompanySyncService()
@@ -0,0 +1,186 @@
+import asyncio
+import time
+from datetime import date, timedelta
+import numpy as np
+from loguru import logger
+from ..core.database import db_manager
+from ..core.config import settings
+from .sales_rollup import RollupNotReady, sales_rollup, same_day_last_year
+
+# Additive daily metrics; distinct-customer counts are not additive and stay with sales_rollup.window()
+METRICS = ["invoice_count", "revenue", "stock_movement_count", "stock_movement_value", "collection_count", "collections"]
+# ratio name -> (numerator, denominator)
+DERIVED = {"avg_order_value": ("revenue", "invoice_count")}
+
+ROLLING_WINDOWS = (7, 30, 90)
+
+
+class _Series:
+    """Dense daily matrix (metrics x days) for one firm plus its prefix sums"""
+
+    __slots__ = ("first_day", "days", "values", "cumsum", "loaded_at")
+
+    def __init__(self, first_day: date, values: np.ndarray):
+        self.first_day = first_day
+        self.days = values.shape[1]
+        self.values = values
+        # cumsum[:, i] = sum of days [0, i), so any window total is two lookups
+        self.cumsum = np.concatenate([np.zeros((len(METRICS), 1)), np.cumsum(values, axis=1)], axis=1)
+        self.loaded_at = time.time()
+
+    def index(self, d) -> np.ndarray:
+        """Day(s) -> column index, clipped to [0, days] (out of range windows sum to zero)"""
+        offsets = (np.asarray(d, dtype="datetime64[D]") - np.datetime64(self.first_day, "D")).astype(np.int64)
+        return np.clip(offsets, 0, self.days)
+
+    def totals(self, starts, ends) -> np.ndarray:
+        """Vectorized window sums: metrics x windows for inclusive [start, end] pairs"""
+        a = self.index(starts)
+        b = self.index(np.asarray(ends, dtype="datetime64[D]") + np.timedelta64(1, "D"))
+        return self.cumsum[:, b] - self.cumsum[:, a]
+
+
+class ComparisonEngine:
+    """
+    In-process period comparisons over the daily sales rollup.
+    Each firm's full daily history is read once into a NumPy matrix; any window,
+    rolling series or year-over-year alignment is then answered from prefix sums
+    without going back to PostgreSQL or Logo.
+    """
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        self._series = {}  # firma -> _Series
+        self._locks = {}
+
+    def invalidate(self, firma: str = None):
+        if firma is None:
+            self._series.clear()
+        else:
+            self._series.pop(str(firma), None)
+
+    async def _load(self, firma: str) -> _Series:
+        if not await sales_rollup.ensure_firm(firma):
+            raise RollupNotReady(f"Sales rollup for firma {firma} is not ready yet")
+        rows = await db_manager.execute_pg_query_async(f"""
+            SELECT day, {', '.join(f'SUM({m}) AS {m}' for m in METRICS)}
+            FROM sales_daily_rollup WHERE firma = %s
+            GROUP BY day ORDER BY day
+        """, (firma,))
+        if not rows:
+            return _Series(date.today(), np.zeros((len(METRICS), 0)))
+        first, last = rows[0]["day"], rows[-1]["day"]
+        values = np.zeros((len(METRICS), (last - first).days + 1))
+        cols = np.fromiter(((r["day"] - first).days for r in rows), dtype=np.int64, count=len(rows))
+        values[:, cols] = np.array([[float(r[m] or 0) for r in rows] for m in METRICS])
+        logger.debug(f"Comparison series loaded for firma {firma}: {values.shape[1]} days")
+        return _Series(first, values)
+
+    async def series(self, firma: str) -> _Series:
+        f = str(firma)
+        cached = self._series.get(f)
+        if cached is not None and time.time() - cached.loaded_at < self.ttl:
+            return cached
+        lock = self._locks.setdefault(f, asyncio.Lock())
+        async with lock:
+            cached = self._series.get(f)
+            if cached is None or time.time() - cached.loaded_at >= self.ttl:
+                cached = self._series[f] = await self._load(f)
+        return cached
+
+    # --- helpers ---
+
+    @staticmethod
+    def _previous(start: date, end: date, align: str):
+        if align == "weekday":
+            # 52 weeks back: same weekdays, so a Monday is compared with a Monday
+            return start - timedelta(days=364), end - timedelta(days=364)
+        if align == "previous":
+            # The window immediately before, same length
+            length = (end - start).days + 1
+            return start - timedelta(days=length), start - timedelta(days=1)
+        return same_day_last_year(start), same_day_last_year(end)
+
+    @staticmethod
+    def _metrics(column: np.ndarray) -> dict:
+        out = {m: float(column[i]) for i, m in enumerate(METRICS)}
+        for name, (num, den) in DERIVED.items():
+            out[name] = out[num] / out[den] if out[den] else 0.0
+        return out
+
+    @staticmethod
+    def _pct(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(previous != 0, (current - previous) * 100.0 / previous, np.nan)
+
+    def _compare(self, s: _Series, windows):
+        """windows: list of (label, start, end, prev_start, prev_end) -> comparison dicts"""
+        starts = [w[1] for w in windows] + [w[3] for w in windows]
+        ends = [w[2] for w in windows] + [w[4] for w in windows]
+        totals = s.totals(starts, ends)
+        n = len(windows)
+        out = {}
+        for i, (label, start, end, prev_start, prev_end) in enumerate(windows):
+            current, previous = self._metrics(totals[:, i]), self._metrics(totals[:, n + i])
+            keys = list(current)
+            pct = self._pct(np.array([current[k] for k in keys]), np.array([previous[k] for k in keys]))
+            out[label] = {
+                "current_start": start, "current_end": end,
+                "previous_start": prev_start, "previous_end": prev_end,
+                "current": current,
+                "previous": previous,
+                "diff": {k: round(current[k] - previous[k], 2) for k in keys},
+                "pct_change": {k: None if np.isnan(v) else round(float(v), 2) for k, v in zip(keys, pct)},
+            }
+        return out
+
+    # --- public API ---
+
+    async def compare_range(self, firma: str, start: date, end: date, align: str = "date") -> dict:
+        """Any [start, end] window against last year (date or weekday aligned) or the preceding window"""
+        s = await self.series(firma)
+        return self._compare(s, [("range", start, end, *self._previous(start, end, align))])["range"]
+
+    async def to_date(self, firma: str, today: date = None, align: str = "date") -> dict:
+        """Week-, month- and year-to-date plus trailing 7/30/90 days, all against last year"""
+        s = await self.series(firma)
+        today = today or date.today()
+        windows = {
+            "wtd": today - timedelta(days=today.weekday()),
+            "mtd": today.replace(day=1),
+            "ytd": today.replace(month=1, day=1),
+            **{f"rolling_{n}": today - timedelta(days=n - 1) for n in ROLLING_WINDOWS},
+        }
+        return self._compare(s, [(label, start, today, *self._previous(start, today, align)) for label, start in windows.items()])
+
+    async def rolling_series(self, firma: str, window: int = 7, days: int = 90, end: date = None, align: str = "weekday") -> dict:
+        """Trailing `window`-day totals for each of the last `days` days, with the aligned last-year series"""
+        s = await self.series(firma)
+        end = end or date.today()
+        ends = np.arange(np.datetime64(end - timedelta(days=days - 1), "D"), np.datetime64(end, "D") + 1)
+        starts = ends - np.timedelta64(window - 1, "D")
+        shift = np.timedelta64(364, "D")
+        if align == "weekday":
+            prev_starts, prev_ends = starts - shift, ends - shift
+        else:
+            prev_starts = np.array([same_day_last_year(d) for d in starts.astype(object)], dtype="datetime64[D]")
+            prev_ends = np.array([same_day_last_year(d) for d in ends.astype(object)], dtype="datetime64[D]")
+        current, previous = s.totals(starts, ends), s.totals(prev_starts, prev_ends)
+        pct = self._pct(current, previous)
+        return {
+            "window": window,
+            "align": align,
+            "days": [str(d) for d in ends],
+            "current": {m: current[i].round(2).tolist() for i, m in enumerate(METRICS)},
+            "previous": {m: previous[i].round(2).tolist() for i, m in enumerate(METRICS)},
+            "pct_change": {m: [None if np.isnan(v) else round(float(v), 2) for v in pct[i]] for i, m in enumerate(METRICS)},
+        }
+
+    def stats(self) -> dict:
+        return {
+            f: {"first_day": s.first_day.isoformat(), "days": s.days, "age_seconds": round(time.time() - s.loaded_at, 1)}
+            for f, s in self._series.items()
+        }
+
+
+comparison_engine = ComparisonEngine(ttl=settings.COMPARISON_CACHE_SECONDS)
@@ -0,0 +1,230 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from loguru import logger
+from ..core.database import db_manager
+from ..core.config import settings
+
+
+# name -> (table template, key column, attribute columns, extra filter)
+# Tables with {f} are per firm; LG_SLSMAN is shared and filtered by FIRMNR.
+DIMENSIONS = {
+    "CLCARD": ("LG_{f}_CLCARD", "CODE", ["DEFINITION_", "CARDTYPE", "ACTIVE", "ADDR1", "CITY"], ""),
+    "ITEMS": ("LG_{f}_ITEMS", "CODE", ["NAME", "CARDTYPE", "UNITSETREF", "ACTIVE", "STGRPCODE"], ""),
+    "SRVCARD": ("LG_{f}_SRVCARD", "CODE", ["DEFINITION_", "UNITSETREF", "ACTIVE"], ""),
+    # Main unit of each unit set, keyed by UNITSETREF
+    "UNITSETL": ("LG_{f}_UNITSETL", "UNITSETREF", ["CODE", "LINENR"], "MAINUNIT = 1"),
+    "SALESMAN": ("LG_SLSMAN", "CODE", ["DEFINITION_", "ACTIVE"], "FIRMNR IN (-1, {f})"),
+}
+
+
+class _Dimension:
+    """code -> LOGICALREF plus a compact attribute tuple for one (firma, table)"""
+
+    __slots__ = ("columns", "refs", "attrs", "codes", "watermark",
+                 "loaded", "last_refresh", "last_full", "refresh_ms", "hits", "misses")
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.refs = {}     # key -> LOGICALREF
+        self.attrs = {}    # key -> tuple(columns)
+        self.codes = {}    # LOGICALREF -> key (detects renamed codes on delta)
+        self.watermark = None
+        self.loaded = False
+        self.last_refresh = None
+        self.last_full = None
+        self.refresh_ms = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, row, key_col):
+        key = row[key_col]
+        ref = row["LOGICALREF"]
+        old = self.codes.get(ref)
+        if old is not None and old != key:
+            self.refs.pop(old, None)
+            self.attrs.pop(old, None)
+        self.refs[key] = ref
+        self.attrs[key] = tuple(row.get(c) for c in self.columns)
+        self.codes[ref] = key
+        for stamp in (row.get("CAPIBLOCK_MODIFIEDDATE"), row.get("CAPIBLOCK_CREATEDDATE")):
+            if isinstance(stamp, datetime) and (self.watermark is None or stamp > self.watermark):
+                self.watermark = stamp
+
+
+class LogoDimensionCache:
+    """
+    Per-firm in-process cache of Logo master data (CLCARD, ITEMS, SRVCARD, UNITSETL, SALESMAN).
+    Loaded once, then refreshed incrementally on CAPIBLOCK_MODIFIEDDATE / CAPIBLOCK_CREATEDDATE.
+    Deletions are picked up by the periodic full reload.
+    """
+
+    def __init__(self, full_reload_seconds: int = 86400):
+        self.full_reload_seconds = full_reload_seconds
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._dims = {}  # (firma, name) -> _Dimension
+        self._listeners = []  # callback(firma, name, rows, full) after rows are applied
+
+    def subscribe(self, callback):
+        """Get notified of loaded/changed rows (e.g. to keep a derived index in sync)"""
+        self._listeners.append(callback)
+
+    def _notify(self, firma, name, rows, full):
+        for callback in self._listeners:
+            try:
+                callback(str(firma), name, rows, full)
+            except Exception as e:
+                logger.error(f"Dimension listener failed for {name} (firma {firma}): {e}")
+
+    def _dim(self, firma, name) -> _Dimension:
+        key = (str(firma), name)
+        with self._lock:
+            dim = self._dims.get(key)
+            if dim is None:
+                dim = self._dims[key] = _Dimension(DIMENSIONS[name][2])
+            return dim
+
+    def _select(self, name, firma):
+        table, key_col, columns, where = DIMENSIONS[name]
+        cols = ", ".join(dict.fromkeys(["LOGICALREF", key_col, *columns, "CAPIBLOCK_CREATEDDATE", "CAPIBLOCK_MODIFIEDDATE"]))
+        sql = f"SELECT {cols} FROM {table.format(f=firma)} (NOLOCK)"
+        conditions = [where.format(f=int(firma))] if where else []
+        return sql, conditions, key_col
+
+    # --- loading (blocking, runs on scheduler / executor threads) ---
+
+    def refresh(self, firma, name: str, full: bool = False) -> int:
+        """Full load or delta refresh of one dimension. Returns the number of rows applied."""
+        dim = self._dim(firma, name)
+        full = full or not dim.loaded or (
+            dim.last_full is not None and time.time() - dim.last_full > self.full_reload_seconds
+        )
+        sql, conditions, key_col = self._select(name, firma)
+        params = None
+        if not full and dim.watermark is not None:
+            # >= so rows stamped in the same second as the watermark are not missed
+            conditions.append("(CAPIBLOCK_MODIFIEDDATE >= %s OR CAPIBLOCK_CREATEDDATE >= %s)")
+            params = (dim.watermark, dim.watermark)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+
+        start = time.monotonic()
+        rows = db_manager.execute_ms_query(sql, params)
+        if rows is None:
+            logger.warning(f"Dimension refresh failed: {name} (firma {firma})")
+            return 0
+
+        with self._lock:
+            if full:
+                fresh = _Dimension(dim.columns)
+                fresh.hits, fresh.misses = dim.hits, dim.misses
+                for row in rows:
+                    fresh.put(row, key_col)
+                fresh.loaded = True
+                fresh.last_full = time.time()
+                dim = self._dims[(str(firma), name)] = fresh
+            else:
+                for row in rows:
+                    dim.put(row, key_col)
+            dim.last_refresh = time.time()
+            dim.refresh_ms = round((time.monotonic() - start) * 1000, 2)
+        if full or rows:
+            self._notify(firma, name, rows, full)
+        logger.debug(f"Dimension {name} (firma {firma}) {'loaded' if full else 'refreshed'}: {len(rows)} rows")
+        return len(rows)
+
+    def refresh_firm(self, firma, full: bool = False) -> dict:
+        return {name: self.refresh(firma, name, full) for name in DIMENSIONS}
+
+    def refresh_all(self, full: bool = False) -> dict:
+        """Refresh every firm seen so far (plus the configured default firm)"""
+        if not self._refresh_lock.acquire(blocking=False):
+            logger.debug("Dimension refresh already running, skipped")
+            return {}
+        try:
+            from .logo_service import logo_service
+            with self._lock:
+                firms = {f for f, _ in self._dims} | {str(logo_service.firma_no)}
+            return {f: self.refresh_firm(f, full) for f in sorted(firms)}
+        finally:
+            self._refresh_lock.release()
+
+    async def refresh_async(self, firma=None, full: bool = False) -> dict:
+        loop = asyncio.get_running_loop()
+        if firma is None:
+            return await loop.run_in_executor(None, self.refresh_all, full)
+        return await loop.run_in_executor(None, self.refresh_firm, firma, full)
+
+    # --- lookups ---
+
+    def get(self, firma, name: str, key):
+        """O(1) lookup of a loaded entry: (LOGICALREF, {attr: value}) or None"""
+        dim = self._dim(firma, name)
+        ref = dim.refs.get(key)
+        if ref is None:
+            dim.misses += 1
+            return None
+        dim.hits += 1
+        return ref, dict(zip(dim.columns, dim.attrs[key]))
+
+    async def resolve(self, firma, name: str, keys) -> dict:
+        """
+        Map keys -> LOGICALREF. Served from memory; keys that are not cached yet
+        (e.g. cards created since the last refresh) are fetched in one query and kept.
+        """
+        dim = self._dim(firma, name)
+        keys = [k for k in dict.fromkeys(keys) if k not in (None, "")]
+        found = {k: dim.refs[k] for k in keys if k in dim.refs}
+        dim.hits += len(found)
+        missing = [k for k in keys if k not in found]
+        if not missing:
+            return found
+        dim.misses += len(missing)
+
+        sql, conditions, key_col = self._select(name, firma)
+        for i in range(0, len(missing), 1000):  # SQL Server parameter limit
+            chunk = missing[i:i + 1000]
+            where = conditions + [f"{key_col} IN ({', '.join(['%s'] * len(chunk))})"]
+            rows = await db_manager.execute_ms_query_async(sql + " WHERE " + " AND ".join(where), tuple(chunk))
+            with self._lock:
+                for row in rows or []:
+                    dim.put(row, key_col)
+                    found[row[key_col]] = row["LOGICALREF"]
+            if rows:
+                self._notify(firma, name, rows, False)
+        return found
+
+    async def resolve_one(self, firma, name: str, key):
+        return (await self.resolve(firma, name, [key])).get(key)
+
+    def stats(self) -> dict:
+        """Freshness per firm / dimension"""
+        now = time.time()
+        out = {}
+        with self._lock:
+            for (firma, name), dim in sorted(self._dims.items()):
+                out.setdefault(firma, {})[name] = {
+                    "loaded": dim.loaded,
+                    "rows": len(dim.refs),
+                    "watermark": dim.watermark.isoformat() if dim.watermark else None,
+                    "last_refresh": datetime.fromtimestamp(dim.last_refresh).isoformat() if dim.last_refresh else None,
+                    "last_full": datetime.fromtimestamp(dim.last_full).isoformat() if dim.last_full else None,
+                    "age_seconds": round(now - dim.last_refresh, 1) if dim.last_refresh else None,
+                    "refresh_ms": dim.refresh_ms,
+                    "hits": dim.hits,
+                    "misses": dim.misses,
+                }
+        return out
+
+
+dimension_cache = LogoDimensionCache(full_reload_seconds=settings.DIMENSION_CACHE_FULL_RELOAD_SECONDS)
+
+
+def run_dimension_refresh():
+    """Module-level function for consistent pickling/serialization in APScheduler"""
+    try:
+        dimension_cache.refresh_all()
+    except Exception as e:
+        logger.error(f"Dimension cache refresh failed: {e}")
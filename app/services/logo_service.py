@@ -1,16 +1,15 @@
 from loguru import logger
 from ..core.database import db_manager
 from ..core.config import settings
-from datetime import datetime
+from .report_cache import cached_report
+from .dimension_cache import dimension_cache
+from .sales_rollup import RollupNotReady, sales_rollup
+from .search_index import search_index
+from .report_catalog import report_catalog
+from datetime import date, datetime, timedelta
 import sys
-
-# Try to import win32com for Logo Objects
-try:
-    import win32com.client
-    HAS_WIN32 = True
-except ImportError:
-    HAS_WIN32 = False
-    logger.warning("pywin32 not found. Logo Objects mode will be disabled.")
+import time
+from .unity_pool import unity_pool, UnityLoginError
 
 class LogoIntegrationService:
     def __init__(self):
@@ -24,54 +23,25 @@ class LogoIntegrationService:
         self.integration_mode = logo_config.get("IntegrationMode", settings.LOGO_INTEGRATION_MODE)
         self.app_user = logo_config.get("AppUser", settings.LOGO_APP_USER)
         self.app_pass = logo_config.get("AppPass", settings.LOGO_APP_PASS)
+        self._row_estimates = {}  # table -> (checked_at, row count)
         
         logger.info(f"LogoIntegrationService initialized in '{self.integration_mode}' mode. (Firma: {self.firma_no}, Donem: {self.period_no})")
         
         # Check COM Availability
-        if self.integration_mode == "LogoObjects" and not HAS_WIN32:
+        if self.integration_mode == "LogoObjects" and not unity_pool.available:
             logger.error("LogoObjects mode requested but pywin32 is missing. Falling back to DirectDB.")
             self.integration_mode = "DirectDB"
 
-    def _get_unity_app(self):
-        """Helper to create and login to Unity Application"""
-        if not HAS_WIN32:
-            return None
-            
+    async def _run_unity(self, work, firma: str = None, period: str = None, timeout: float = None):
+        """
+        Run `work(unity)` on a pooled, already logged-in Unity session.
+        On timeout the session is retired and TimeoutError is raised: the call may still complete in Logo.
+        """
         try:
-            unity = win32com.client.Dispatch("UnityObjects.UnityApplication")
-            # Login credits should be in config, fetching from settings
-            # Using placeholders or environment vars if not defined
-            # Login credits from JSON config (or env fallback)
-            u_user = self.app_user
-            u_pass = self.app_pass
-            
-            # DYNAMIC SQL CONNECTION (Overrides LCONFIG.EXE)
-            # This allows connecting to a remote Logo Server (Ankara) from a local API (Istanbul)
-            logo_config = next((c for c in settings.DB_CONFIGS if c.get("Name") == "LOGO_Database"), {})
-            db_server = logo_config.get("Server")
-            db_name = logo_config.get("Database")
-            db_user = logo_config.get("User")
-            db_pass = logo_config.get("Password")
-            
-            if db_server and db_name:
-                logger.info(f"Unity Objects: Overriding SQL Connection -> Server: {db_server}, DB: {db_name}")
-                # SQLInfo format: (ServerName, DatabaseName, SQLUser, SQLPass)
-                # UnityObjects.UnityApplication.SQLInfo prop setter
-                # Some versions require explicit setter method depending on wrapper, but typically property assignment works.
-                try:
-                    unity.SQLInfo = (db_server, db_name, db_user, db_pass)
-                except Exception as e:
-                     logger.warning(f"Failed to set Unity SQLInfo (Might use LCONFIG defaults): {e}")
-
-            if unity.Login(u_user, u_pass, int(self.firma_no), int(self.period_no)):
-                return unity
-            else:
-                err = unity.GetLastError()
-                logger.error(f"Unity Login Failed: {err} - {unity.GetLastErrorString()}")
-                return None
-        except Exception as e:
-            logger.error(f"Unity Dispatch Failed: {e}")
-            return None
+            return await unity_pool.run(firma or self.firma_no, period or self.period_no, work, timeout)
+        except UnityLoginError as e:
+            logger.error(f"Unity session unavailable: {e}")
+            return False, f"Unity Login Failed: {e}"
 
     def import_xml_data(self, xml_content: str):
         """
@@ -79,13 +49,22 @@ class LogoIntegrationService:
         This acts as a 'Mini LogoConnect'.
         RETURNS: (bool, string_message)
         """
-        if not HAS_WIN32:
+        if not unity_pool.available:
              return False, "Logo Integration is not running on Windows Server (pywin32 missing)."
 
-        unity = self._get_unity_app()
-        if not unity:
+        try:
+            return unity_pool.run_sync(self.firma_no, self.period_no, lambda unity: self._import_xml(unity, xml_content))
+        except UnityLoginError as e:
+            logger.error(f"Unity session unavailable: {e}")
             return False, "Could not connect to Unity Objects Application."
-            
+
+    async def import_xml_data_async(self, xml_content: str, firma: str = None, period: str = None):
+        """Async DataFromXML on a pooled Unity session. RETURNS: (bool, string_message)"""
+        if not unity_pool.available:
+            return False, "Logo Integration is not running on Windows Server (pywin32 missing)."
+        return await self._run_unity(lambda unity: self._import_xml(unity, xml_content), firma, period)
+
+    def _import_xml(self, unity, xml_content: str):
         try:
             logger.info("Starting XML Import via Unity Objects DataFromXML...")
             # DataFromXML returns boolean in most wrappers, logic 1=Success usually.
@@ -118,13 +97,13 @@ class LogoIntegrationService:
             query += f" AND CODE = '{item_code}'"
             
         try:
-            results = db_manager.execute_ms_query(query)
+            results = await db_manager.execute_ms_query_async(query)
             return results
         except Exception as e:
             logger.error(f"Logo stock check failed: {e}")
             return []
 
-    async def transfer_order_to_logo(self, order_id: str):
+    async def transfer_order_to_logo(self, order_id: str, firma: str = None, period: str = None):
         """
         Generic transition for Order Transfer with Mode detection.
         """
@@ -132,7 +111,7 @@ class LogoIntegrationService:
         
         if self.integration_mode == "DirectDB":
             # Current Implementation: Direct SQL Insert (e.g., L_ORFICHE)
-            return await self._transfer_via_db(order_id)
+            return await self._transfer_via_db(order_id, firma, period)
         elif self.integration_mode == "LogoObjects":
             # Future Implementation: via COM Objects
             logger.warning("LogoObjects integration mode not yet fully implemented.")
@@ -144,277 +123,378 @@ class LogoIntegrationService:
             
         return False
 
-    async def _transfer_via_db(self, order_id: str):
+    async def _transfer_via_db(self, order_id: str, firma: str = None, period: str = None):
         """Internal helper for DB-direct transfer"""
         # Fetch order from Postgres
         order_query = "SELECT * FROM sales_orders WHERE id = %s"
-        order = db_manager.execute_pg_query(order_query, (order_id,))
+        order = await db_manager.execute_pg_query_async(order_query, (order_id,))
         
         if not order:
             logger.error(f"Order not found: {order_id}")
             return False
-            
-    async def _transfer_via_objects(self, invoice_data, items_data, invoice_type="wholesale"):
+
+        f = firma or self.firma_no
+        p = period or self.period_no
+        items = await db_manager.execute_pg_query_async("SELECT * FROM sales_order_items WHERE order_id = %s", (order_id,))
+
+        # Resolve every code up front: one PG query + one MSSQL query per card table
+        product_codes = await self._resolve_product_codes([item['product_id'] for item in items or []])
+        client_code = await self._resolve_customer_code(order[0]['customer_id'])
+        codes = set(product_codes.values())
+        item_refs = await dimension_cache.resolve(f, "ITEMS", codes)
+        srv_refs = await dimension_cache.resolve(f, "SRVCARD", codes - set(item_refs))
+        client_refs = await dimension_cache.resolve(f, "CLCARD", [client_code] if client_code else [])
+        if client_code not in client_refs:
+            logger.error(f"Client not found in Logo: {client_code}")
+            return False
+
+        # 1. Insert Header (ORFICHE)
+        fiche_no = order[0]['order_number']
+        header_query = f"""
+            INSERT INTO LG_{f}_{p}_ORFICHE (FICHENO, DATE_, TRCODE, CLIENTREF, SOURCEINDEX, BILLED)
+            VALUES (%s, %s, 1, %s, 0, 0)
+        """
+        await db_manager.execute_ms_query_async(header_query, (fiche_no, order[0]['created_at'], client_refs[client_code]), fetch=False)
+        header_res = await db_manager.execute_ms_query_async(
+            f"SELECT LOGICALREF FROM LG_{f}_{p}_ORFICHE WHERE FICHENO = %s", (fiche_no,)
+        )
+        if not header_res:
+            logger.error(f"Order header insert failed: {fiche_no}")
+            return False
+        fiche_ref = header_res[0]['LOGICALREF']
+
+        # 2. Insert Lines (ORFLINE) - material first, service (LINETYPE 4) as fallback
+        rows = []
+        for item in items or []:
+            code = product_codes.get(str(item['product_id']))
+            if code in item_refs:
+                ref, line_type = item_refs[code], 0
+            elif code in srv_refs:
+                ref, line_type = srv_refs[code], 4
+            else:
+                logger.warning(f"Product not found in Logo, line skipped: {code}")
+                continue
+            rows.append((ref, item['quantity'], item['unit_price'], item['total_price'],
+                         order[0]['created_at'], 1, fiche_ref, line_type))
+
+        return await self._insert_rows_ms(
+            f"LG_{f}_{p}_ORFLINE",
+            ["STOCKREF", "AMOUNT", "PRICE", "TOTAL", "DATE_", "TRCODE", "ORFICHEREF", "LINETYPE"],
+            rows
+        )
+
+    async def _resolve_product_codes(self, product_ids) -> dict:
+        """Map local product ids to product codes with a single query (keyed by str(id))"""
+        ids = list({str(pid) for pid in product_ids if pid is not None})
+        if not ids:
+            return {}
+        # Compare as text: products.id is integer or UUID depending on the schema, and the list goes out as text[]
+        rows = await db_manager.execute_pg_query_async("SELECT id, code FROM products WHERE id::text = ANY(%s)", (ids,))
+        return {str(r['id']): r['code'] for r in rows or []}
+
+    async def _resolve_customer_code(self, customer_id):
+        res = await db_manager.execute_pg_query_async("SELECT code FROM customers WHERE id = %s", (customer_id,))
+        return res[0]['code'] if res else None
+
+    async def _insert_rows_ms(self, table: str, columns: list, rows: list) -> bool:
+        """Multi-row INSERT into a Logo table, chunked under the 2100 parameter limit"""
+        per_stmt = max(1, min(1000, 2000 // len(columns)))
+        row_sql = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        for i in range(0, len(rows), per_stmt):
+            chunk = rows[i:i + per_stmt]
+            query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([row_sql] * len(chunk))
+            params = tuple(v for row in chunk for v in row)
+            if not await db_manager.execute_ms_query_async(query, params, fetch=False):
+                logger.error(f"Bulk insert into {table} failed at row {i}")
+                return False
+        return True
+
+    async def _estimated_rows(self, table: str):
+        """Row count from partition metadata (no table scan), cached for 5 minutes"""
+        checked_at, count = self._row_estimates.get(table, (0, None))
+        if time.time() - checked_at < 300:
+            return count
+        res = await db_manager.execute_ms_query_async(
+            "SELECT SUM(row_count) AS N FROM sys.dm_db_partition_stats WHERE object_id = OBJECT_ID(%s) AND index_id IN (0, 1)",
+            (table,)
+        )
+        count = int(res[0]["N"]) if res and res[0]["N"] is not None else None
+        self._row_estimates[table] = (time.time(), count)
+        return count
+
+    async def _keyset_page(self, table: str, columns: dict, where: list, params: list,
+                           cursor: int = None, limit: int = None, fields: list = None, descending: bool = False):
+        """
+        One page of a Logo list, ordered by LOGICALREF and continued from `cursor`
+        (the last LOGICALREF of the previous page). The clustered key seek keeps every
+        page equally cheap regardless of table size.
+        columns: output name -> SQL expression. fields: projection over the output names.
+        """
+        limit = max(1, min(limit or settings.LOGO_LIST_DEFAULT_LIMIT, settings.LOGO_LIST_MAX_LIMIT))
+        if fields:
+            unknown = [c for c in fields if c not in columns]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            names = ["LOGICALREF"] + [c for c in fields if c != "LOGICALREF"]
+        else:
+            names = list(columns)
+        where, params = list(where), list(params)
+        if cursor is not None:
+            where.append("LOGICALREF < %s" if descending else "LOGICALREF > %s")
+            params.append(int(cursor))
+        select = ", ".join(columns[n] if columns[n] == n else f"{columns[n]} AS {n}" for n in names)
+        query = (f"SELECT TOP ({limit + 1}) {select} FROM {table} (NOLOCK)"
+                 + (f" WHERE {' AND '.join(where)}" if where else "")
+                 + f" ORDER BY LOGICALREF{' DESC' if descending else ''}")
+        rows = await db_manager.execute_ms_query_async(query, tuple(params) or None)
+        if rows is None:
+            return None
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "items": rows,
+            "next_cursor": rows[-1]["LOGICALREF"] if has_more else None,
+            "has_more": has_more,
+            "limit": limit,
+            # Only on the first page; table-level estimate, not the filtered count
+            "estimated_total": await self._estimated_rows(table) if cursor is None else None,
+        }
+
+    async def _indexed_search(self, firma, kind: str, columns: dict, search: str, limit: int = None, fields: list = None):
+        """Typeahead from the in-memory search index; None while the index is still being built"""
+        if not settings.LOGO_SEARCH_INDEX_ENABLED or not await search_index.ensure(firma, kind):
+            return None
+        limit = max(1, min(limit or settings.LOGO_LIST_DEFAULT_LIMIT, settings.LOGO_LIST_MAX_LIMIT))
+        if fields:
+            unknown = [c for c in fields if c not in columns]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        rows = search_index.search(firma, kind, search, limit)
+        if rows is None:
+            return None
+        if fields:
+            keep = {"LOGICALREF", "SCORE", *fields}
+            rows = [{k: v for k, v in r.items() if k in keep} for r in rows]
+        return {
+            "items": rows[:limit],
+            "next_cursor": None,  # ranked results: refine the search instead of paging
+            "has_more": len(rows) > limit,
+            "limit": limit,
+            "estimated_total": None,
+        }
+
+    @staticmethod
+    def _search_filter(search: str, *columns):
+        """Parameterized contains-search over the given columns"""
+        if not search:
+            return [], []
+        pattern = f"%{search}%"
+        return ["(" + " OR ".join(f"{c} LIKE %s" for c in columns) + ")"], [pattern] * len(columns)
+
+    async def _transfer_via_objects(self, invoice_data, items_data, invoice_type="wholesale", firma: str = None,
+                                    period: str = None, timeout: float = None):
         """
         Transfer invoice using Logo Unity Objects (COM/DLL).
         Returns: (success, result_message_or_ref)
         """
-        if not HAS_WIN32:
+        if not unity_pool.available:
             return False, "COM libraries not available"
 
-        unity = self._get_unity_app()
-        if not unity:
-            return False, "Could not login to Logo Unity Application"
+        def work(unity):
+            try:
+                # Create Invoice Object (SalesInvoice)
+                inv_obj = unity.NewDataObject(3) # 3 = SalesInvoice (IInvoice)
+                if not inv_obj:
+                    return False, "Could not create Invoice Object"
             
-        try:
-            # Create Invoice Object (SalesInvoice)
-            inv_obj = unity.NewDataObject(3) # 3 = SalesInvoice (IInvoice)
-            if not inv_obj:
-                return False, "Could not create Invoice Object"
-            
-            # Header Mapping
-            tr_code_map = {"wholesale": 8, "retail": 7, "service": 9}
-            inv_obj.New()
-            inv_obj.DataFields.FieldByName("TYPE").Value = tr_code_map.get(invoice_type, 8)
-            inv_obj.DataFields.FieldByName("NUMBER").Value = invoice_data.get('formatted_number', '~')
-            inv_obj.DataFields.FieldByName("DATE").Value = invoice_data['created_at'].strftime("%d.%m.%Y")
-            inv_obj.DataFields.FieldByName("ARP_CODE").Value = invoice_data.get('customer_code') # Must be code, not Ref
-            # inv_obj.DataFields.FieldByName("NOTES1").Value = invoice_data.get('notes', '')
+                # Header Mapping
+                tr_code_map = {"wholesale": 8, "retail": 7, "service": 9}
+                inv_obj.New()
+                inv_obj.DataFields.FieldByName("TYPE").Value = tr_code_map.get(invoice_type, 8)
+                inv_obj.DataFields.FieldByName("NUMBER").Value = invoice_data.get('formatted_number', '~')
+                inv_obj.DataFields.FieldByName("DATE").Value = invoice_data['created_at'].strftime("%d.%m.%Y")
+                inv_obj.DataFields.FieldByName("ARP_CODE").Value = invoice_data.get('customer_code') # Must be code, not Ref
+                # inv_obj.DataFields.FieldByName("NOTES1").Value = invoice_data.get('notes', '')
             
-            # Lines
-            lines = inv_obj.DataFields.FieldByName("TRANSACTIONS").Lines
-            for item in items_data:
-                lines.AppendLine()
-                # Determine Type (Material=0, Service=4) -> This logic usually handled by master code in Objects?
-                # Actually, for objects, if we set MASTER_CODE, it auto-detects? 
-                # Better to be explicit: Type 0 = Material, 4 = Service
+                # Lines
+                lines = inv_obj.DataFields.FieldByName("TRANSACTIONS").Lines
+                for item in items_data:
+                    lines.AppendLine()
+                    # Determine Type (Material=0, Service=4) -> This logic usually handled by master code in Objects?
+                    # Actually, for objects, if we set MASTER_CODE, it auto-detects? 
+                    # Better to be explicit: Type 0 = Material, 4 = Service
                 
-                # We need to know if it is service or master.
-                is_service = item.get('is_service', False) # Passed from caller
+                    # We need to know if it is service or master.
+                    is_service = item.get('is_service', False) # Passed from caller
                 
-                lines.FieldByName("TYPE").Value = 4 if is_service else 0
-                lines.FieldByName("MASTER_CODE").Value = item['product_code']
-                lines.FieldByName("QUANTITY").Value = float(item['quantity'])
-                lines.FieldByName("PRICE").Value = float(item['unit_price'])
-                # VAT included/excluded logic usually depends on settings
+                    lines.FieldByName("TYPE").Value = 4 if is_service else 0
+                    lines.FieldByName("MASTER_CODE").Value = item['product_code']
+                    lines.FieldByName("QUANTITY").Value = float(item['quantity'])
+                    lines.FieldByName("PRICE").Value = float(item['unit_price'])
+                    # VAT included/excluded logic usually depends on settings
                 
-            # Post
-            if inv_obj.Post() == 1:
-                ref = inv_obj.DataFields.FieldByName("INTERNAL_REFERENCE").Value
-                return True, ref
-            else:
-                err_code = inv_obj.ErrorCode
-                err_desc = inv_obj.ValidateErrors(0)
-                logger.error(f"Unity Post Failed: {err_desc}")
-                # unity.Disconnect() -> Handled by scope?
-                return False, f"Logo Error: {err_desc}"
+                # Post
+                if inv_obj.Post() == 1:
+                    ref = inv_obj.DataFields.FieldByName("INTERNAL_REFERENCE").Value
+                    return True, ref
+                else:
+                    err_code = inv_obj.ErrorCode
+                    err_desc = inv_obj.ValidateErrors(0)
+                    logger.error(f"Unity Post Failed: {err_desc}")
+                    return False, f"Logo Error: {err_desc}"
                 
-        except Exception as e:
-            logger.error(f"Unity Exception: {e}")
-            return False, str(e)
-        finally:
-            # Cleanup - Important for COM
-            unity = None
+            except Exception as e:
+                logger.error(f"Unity Exception: {e}")
+                return False, str(e)
+
+        return await self._run_unity(work, firma, period, timeout)
 
-    async def _transfer_dispatch_via_objects(self, dispatch_data, items_data, dispatch_type="wholesale"):
+    async def _transfer_dispatch_via_objects(self, dispatch_data, items_data, dispatch_type="wholesale", firma: str = None,
+                                             period: str = None, timeout: float = None):
         """Transfer Dispatch (İrsaliye) via Unity Objects"""
-        if not HAS_WIN32: return False, "COM lib missing"
-        unity = self._get_unity_app()
-        if not unity: return False, "Unity Login Failed"
+        if not unity_pool.available: return False, "COM lib missing"
 
-        try:
-            # 4 = Sales Dispatch (STFICHE) - For Purchase Dispatch use 4 but different TRCODE? No, Purchase Dispatch is usually different object or TRCODE.
-            # Sales Dispatch TRCODEs: 8 (Wholesale), 7 (Retail), 9 (Consignment Out)
-            # Purchase Dispatch TRCODEs: 1 (Purchase), 2 (Retail Purchase - rare), 6 (Purchase Return)
+        def work(unity):
+            try:
+                # 4 = Sales Dispatch (STFICHE) - For Purchase Dispatch use 4 but different TRCODE? No, Purchase Dispatch is usually different object or TRCODE.
+                # Sales Dispatch TRCODEs: 8 (Wholesale), 7 (Retail), 9 (Consignment Out)
+                # Purchase Dispatch TRCODEs: 1 (Purchase), 2 (Retail Purchase - rare), 6 (Purchase Return)
             
-            do = unity.NewDataObject(4) # STFICHE
-            do.New()
+                do = unity.NewDataObject(4) # STFICHE
+                do.New()
             
-            # TRCODE: 8 (Wholesale Dispatch), 7 (Retail Dispatch)
-            tr_code = 8 if dispatch_type == "wholesale" else 7
+                # TRCODE: 8 (Wholesale Dispatch), 7 (Retail Dispatch)
+                tr_code = 8 if dispatch_type == "wholesale" else 7
             
-            do.DataFields.FieldByName("TRCODE").Value = tr_code
-            do.DataFields.FieldByName("FICHENO").Value = dispatch_data.get('formatted_number', '~')
-            do.DataFields.FieldByName("DATE_").Value = dispatch_data['created_at'].strftime("%d.%m.%Y")
-            do.DataFields.FieldByName("CLIENTREF").Value = dispatch_data.get('customer_ref') # Needs REF or use ARP_CODE can work if set? Usually ARP_CODE works.
-            do.DataFields.FieldByName("ARP_CODE").Value = dispatch_data.get('customer_code')
+                do.DataFields.FieldByName("TRCODE").Value = tr_code
+                do.DataFields.FieldByName("FICHENO").Value = dispatch_data.get('formatted_number', '~')
+                do.DataFields.FieldByName("DATE_").Value = dispatch_data['created_at'].strftime("%d.%m.%Y")
+                do.DataFields.FieldByName("CLIENTREF").Value = dispatch_data.get('customer_ref') # Needs REF or use ARP_CODE can work if set? Usually ARP_CODE works.
+                do.DataFields.FieldByName("ARP_CODE").Value = dispatch_data.get('customer_code')
             
-            # Important: Set IOCODE for Dispatches (1=In, 3=Out, 4=Out) - Sales is Out (Gen. 3 or 4)
-            # 8 (Wholesale Dispatch) -> IOCODE = 4
-            # 7 (Retail Dispatch) -> IOCODE = 4
-            do.DataFields.FieldByName("IOCODE").Value = 4 
-
-            lines = do.DataFields.FieldByName("TRANSACTIONS").Lines
-            for item in items_data:
-                lines.AppendLine()
-                lines.FieldByName("TYPE").Value = 0 # Material
-                lines.FieldByName("MASTER_CODE").Value = item['product_code']
-                lines.FieldByName("AMOUNT").Value = float(item['quantity'])
-                lines.FieldByName("PRICE").Value = float(item['unit_price'])
-                lines.FieldByName("IOCODE").Value = 4 # Out
+                # Important: Set IOCODE for Dispatches (1=In, 3=Out, 4=Out) - Sales is Out (Gen. 3 or 4)
+                # 8 (Wholesale Dispatch) -> IOCODE = 4
+                # 7 (Retail Dispatch) -> IOCODE = 4
+                do.DataFields.FieldByName("IOCODE").Value = 4 
+
+                lines = do.DataFields.FieldByName("TRANSACTIONS").Lines
+                for item in items_data:
+                    lines.AppendLine()
+                    lines.FieldByName("TYPE").Value = 0 # Material
+                    lines.FieldByName("MASTER_CODE").Value = item['product_code']
+                    lines.FieldByName("AMOUNT").Value = float(item['quantity'])
+                    lines.FieldByName("PRICE").Value = float(item['unit_price'])
+                    lines.FieldByName("IOCODE").Value = 4 # Out
                 
-            if do.Post() == 1:
-                return True, do.DataFields.FieldByName("INTERNAL_REFERENCE").Value
-            else:
-                 # Clean err desc
-                err_desc = do.ValidateErrors(0)
-                return False, err_desc
-        except Exception as e:
-            logger.error(f"Dispatch Error: {e}")
-            return False, str(e)
-        finally:
-            unity.Disconnect()
+                if do.Post() == 1:
+                    return True, do.DataFields.FieldByName("INTERNAL_REFERENCE").Value
+                else:
+                     # Clean err desc
+                    err_desc = do.ValidateErrors(0)
+                    return False, err_desc
+            except Exception as e:
+                logger.error(f"Dispatch Error: {e}")
+                return False, str(e)
+
+        return await self._run_unity(work, firma, period, timeout)
 
     async def _transfer_client_via_objects(self, client_data):
         """Transfer Client (Cari) via Unity Objects"""
-        if not HAS_WIN32: return False, "COM lib missing"
-        unity = self._get_unity_app()
-        if not unity: return False, "Unity Login Failed"
+        if not unity_pool.available: return False, "COM lib missing"
 
-        try:
-            # 1 = AR/AP (CLCARD)
-            do = unity.NewDataObject(1) 
-            do.New()
+        def work(unity):
+            try:
+                # 1 = AR/AP (CLCARD)
+                do = unity.NewDataObject(1) 
+                do.New()
             
-            do.DataFields.FieldByName("CODE").Value = client_data['code']
-            do.DataFields.FieldByName("TITLE").Value = client_data['name']
-            do.DataFields.FieldByName("ADDRESS1").Value = client_data.get('address', '')
-            do.DataFields.FieldByName("CITY").Value = client_data.get('city', '')
-            do.DataFields.FieldByName("TAX_OFFICE").Value = client_data.get('tax_office', '')
-            do.DataFields.FieldByName("TAX_ID").Value = client_data.get('tax_number', '')
-            do.DataFields.FieldByName("CARD_TYPE").Value = 3 # 3=Alıcı+Satıcı (Buyer+Seller)
+                do.DataFields.FieldByName("CODE").Value = client_data['code']
+                do.DataFields.FieldByName("TITLE").Value = client_data['name']
+                do.DataFields.FieldByName("ADDRESS1").Value = client_data.get('address', '')
+                do.DataFields.FieldByName("CITY").Value = client_data.get('city', '')
+                do.DataFields.FieldByName("TAX_OFFICE").Value = client_data.get('tax_office', '')
+                do.DataFields.FieldByName("TAX_ID").Value = client_data.get('tax_number', '')
+                do.DataFields.FieldByName("CARD_TYPE").Value = 3 # 3=Alıcı+Satıcı (Buyer+Seller)
             
-            if do.Post() == 1:
-                return True, do.DataFields.FieldByName("INTERNAL_REFERENCE").Value
-            else:
-                return False, do.ValidateErrors(0)
-        except Exception as e:
-            return False, str(e)
-        finally:
-            unity.Disconnect()
+                if do.Post() == 1:
+                    return True, do.DataFields.FieldByName("INTERNAL_REFERENCE").Value
+                else:
+                    return False, do.ValidateErrors(0)
+            except Exception as e:
+                return False, str(e)
+
+        return await self._run_unity(work)
 
     async def _transfer_item_via_objects(self, item_data):
         """Transfer Item (Malzeme) via Unity Objects"""
-        if not HAS_WIN32: return False, "COM lib missing"
-        unity = self._get_unity_app()
-        if not unity: return False, "Unity Login Failed"
+        if not unity_pool.available: return False, "COM lib missing"
 
-        try:
-            # 0 = Item (ITEMS)
-            do = unity.NewDataObject(0)
-            do.New()
+        def work(unity):
+            try:
+                # 0 = Item (ITEMS)
+                do = unity.NewDataObject(0)
+                do.New()
             
-            do.DataFields.FieldByName("CODE").Value = item_data['code']
-            do.DataFields.FieldByName("NAME").Value = item_data['name']
-            do.DataFields.FieldByName("CARD_TYPE").Value = 1 # 1=TM (Comm. Good)
-            do.DataFields.FieldByName("UNITSET_CODE").Value = item_data.get('unit_set', '05') # '05' is usually ADET set code in demo data, but should be param.
+                do.DataFields.FieldByName("CODE").Value = item_data['code']
+                do.DataFields.FieldByName("NAME").Value = item_data['name']
+                do.DataFields.FieldByName("CARD_TYPE").Value = 1 # 1=TM (Comm. Good)
+                do.DataFields.FieldByName("UNITSET_CODE").Value = item_data.get('unit_set', '05') # '05' is usually ADET set code in demo data, but should be param.
             
-            if do.Post() == 1:
-                return True, do.DataFields.FieldByName("INTERNAL_REFERENCE").Value
-            else:
-                return False, do.ValidateErrors(0)
-        except Exception as e:
-            return False, str(e)
-        finally:
-            unity.Disconnect()
+                if do.Post() == 1:
+                    return True, do.DataFields.FieldByName("INTERNAL_REFERENCE").Value
+                else:
+                    return False, do.ValidateErrors(0)
+            except Exception as e:
+                return False, str(e)
 
-    async def _transfer_collection_via_objects(self, collection_data):
-        """Transfer Cash Collection via Unity Objects"""
-        if not HAS_WIN32: return False, "COM lib missing"
-        unity = self._get_unity_app()
-        if not unity: return False, "Unity Login Failed"
+        return await self._run_unity(work)
 
-        try:
-            # 10 = Safe Def (KSCARD)
-            # For Transactions: 'Kasa Islemleri' -> Data Object 11 (KSLINES within KSCARD?) No.
-            # Usually Kasa Islemleri is Data Object 19 on newer versions (7+), or via SD_TRANSACTIONS.
-            # Let's try 19 (Safe Deposit Transaction) which is most common for cash collection.
+    async def _transfer_collection_via_objects(self, collection_data, firma: str = None, period: str = None, timeout: float = None):
+        """Transfer Cash Collection via Unity Objects"""
+        if not unity_pool.available: return False, "COM lib missing"
+
+        def work(unity):
+            try:
+                # 10 = Safe Def (KSCARD)
+                # For Transactions: 'Kasa Islemleri' -> Data Object 11 (KSLINES within KSCARD?) No.
+                # Usually Kasa Islemleri is Data Object 19 on newer versions (7+), or via SD_TRANSACTIONS.
+                # Let's try 19 (Safe Deposit Transaction) which is most common for cash collection.
             
-            do = unity.NewDataObject(19) 
-            do.New()
+                do = unity.NewDataObject(19) 
+                do.New()
             
-            # TRCODE: 11 (Tahsilat/Collection), 12 (Odeme/Payment)
-            do.DataFields.FieldByName("TRCODE").Value = 11 
-            do.DataFields.FieldByName("DATE_").Value = datetime.now().strftime("%d.%m.%Y")
-            do.DataFields.FieldByName("CUST_TITLE").Value = collection_data.get('customer_name', '')
-            do.DataFields.FieldByName("AMOUNT").Value = float(collection_data['amount'])
-            do.DataFields.FieldByName("DESCRIPTION").Value = collection_data.get('description', 'API Collection')
+                # TRCODE: 11 (Tahsilat/Collection), 12 (Odeme/Payment)
+                do.DataFields.FieldByName("TRCODE").Value = 11 
+                do.DataFields.FieldByName("DATE_").Value = datetime.now().strftime("%d.%m.%Y")
+                do.DataFields.FieldByName("CUST_TITLE").Value = collection_data.get('customer_name', '')
+                do.DataFields.FieldByName("AMOUNT").Value = float(collection_data['amount'])
+                do.DataFields.FieldByName("DESCRIPTION").Value = collection_data.get('description', 'API Collection')
             
-            # Link to Customer (Compulsory for Collection)
-            do.DataFields.FieldByName("ARP_CODE").Value = collection_data.get('customer_code')
+                # Link to Customer (Compulsory for Collection)
+                do.DataFields.FieldByName("ARP_CODE").Value = collection_data.get('customer_code')
             
-            # Link to Safe (Kasa Kodu) - Required
-            do.DataFields.FieldByName("CODE").Value = collection_data.get('safe_code', '01') # Default safe
+                # Link to Safe (Kasa Kodu) - Required
+                do.DataFields.FieldByName("CODE").Value = collection_data.get('safe_code', '01') # Default safe
             
-            if do.Post() == 1:
-                return True, do.DataFields.FieldByName("INTERNAL_REFERENCE").Value
-            else:
-                return False, do.ValidateErrors(0)
-        except Exception as e:
-            return False, str(e)
-        finally:
-            unity.Disconnect()
+                if do.Post() == 1:
+                    return True, do.DataFields.FieldByName("INTERNAL_REFERENCE").Value
+                else:
+                    return False, do.ValidateErrors(0)
+            except Exception as e:
+                return False, str(e)
 
-            
-        # 1. Insert Header (ORFICHE)
-        f = self.firma_no
-        p = self.period_no
-        client_code = db_manager.execute_pg_query(f"SELECT code FROM customers WHERE id = {order[0]['customer_id']}")[0]['code']
-        
-        fiche_no = order[0]['order_number']
-        header_query = f"""
-            INSERT INTO LG_{f}_{p}_ORFICHE (FICHENO, DATE_, TRCODE, CLIENTREF, SOURCEINDEX, BILLED)
-            VALUES (%s, %s, 1, (SELECT LOGICALREF FROM LG_{f}_CLCARD WHERE CODE = %s), 0, 0)
-        """
-        db_manager.execute_ms_query(header_query, (fiche_no, order[0]['created_at'], client_code), fetch=False)
-        
-        # 2. Insert Lines (ORFLINE)
-        items_query = "SELECT * FROM sales_order_items WHERE order_id = %s"
-        items = db_manager.execute_pg_query(items_query, (order_id,))
-        
-        for item in items:
-            product_code = db_manager.execute_pg_query(f"SELECT code FROM products WHERE id = {item['product_id']}")[0]['code']
-            
-            # Check if Item or Service
-            # We need a way to know if it is a service. 
-            # Assuming 'is_service' column in 'products' or 'sales_order_items' or via prefix check.
-            # For now, let's query both ITEMS and SRVCARD to find the reference.
-            
-            is_service = False
-            item_ref = db_manager.execute_ms_query(f"SELECT LOGICALREF FROM LG_{f}_ITEMS WHERE CODE = '{product_code}'")
-            line_type = 0 # Material
-            
-            if not item_ref:
-                # Check Service
-                item_ref = db_manager.execute_ms_query(f"SELECT LOGICALREF FROM LG_{f}_SRVCARD WHERE CODE = '{product_code}'")
-                if item_ref:
-                    is_service = True
-                    line_type = 4 # Service
-            
-            if item_ref:
-                ref = item_ref[0]['LOGICALREF']
-                table = "LG_{}_{}_ORFLINE".format(f, p)
-                
-                line_query = f"""
-                    INSERT INTO {table} (STOCKREF, AMOUNT, PRICE, TOTAL, DATE_, TRCODE, ORFICHEREF, LINETYPE)
-                    VALUES (%s, %s, %s, %s, %s, 1, 
-                           (SELECT LOGICALREF FROM LG_{f}_{p}_ORFICHE WHERE FICHENO = %s),
-                           %s)
-                """
-                db_manager.execute_ms_query(line_query, (
-                    ref, item['quantity'], item['unit_price'], item['total_price'], 
-                    order[0]['created_at'], fiche_no, line_type
-                ), fetch=False)
-        
-        return True
+        return await self._run_unity(work, firma, period, timeout)
 
-    async def transfer_invoice_to_logo(self, local_invoice_id: str, invoice_type: str = "wholesale"):
+    async def transfer_invoice_to_logo(self, local_invoice_id: str, invoice_type: str = "wholesale", firma: str = None,
+                                       period: str = None, timeout: float = None):
         """
         Transfers a local invoice to Logo ERP as a Sales Invoice.
         
         Args:
             local_invoice_id: ID of the invoice in local DB (sales_invoices table)
             invoice_type: 'wholesale', 'retail', or 'service'
+            firma / period: target Logo firm and period (default: the configured ones)
+            timeout: Unity call timeout; TimeoutError means the outcome in Logo is unknown
             
         TRCODE Mapping:
             - wholesale (Toptan Satış): 8
@@ -424,8 +504,8 @@ class LogoIntegrationService:
         logger.info(f"Initiating invoice transfer to Logo: {local_invoice_id} ({invoice_type})")
         
         # 0. Setup & Validation
-        f = self.firma_no
-        p = self.period_no
+        f = firma or self.firma_no
+        p = period or self.period_no
         
         tr_code_map = {
             "wholesale": 8,
@@ -444,53 +524,58 @@ class LogoIntegrationService:
         # Actually, let's allow transferring an ORDER directly as an INVOICE.
         
         # OPTION A: Transfer from sales_orders
-        inv_data = db_manager.execute_pg_query("SELECT * FROM sales_orders WHERE id = %s", (local_invoice_id,))
+        inv_data = await db_manager.execute_pg_query_async("SELECT * FROM sales_orders WHERE id = %s", (local_invoice_id,))
         tr_code = tr_code_map.get(invoice_type.lower(), 8)
         
         # --- STRATEGY: 1. Objects -> 2. REST -> 3. DB ---
         
         # Get Invoice Data First
-        inv_data_sql = db_manager.execute_pg_query("SELECT * FROM sales_orders WHERE id = %s", (local_invoice_id,))
+        inv_data_sql = await db_manager.execute_pg_query_async("SELECT * FROM sales_orders WHERE id = %s", (local_invoice_id,))
         if not inv_data_sql:
             logger.error(f"Invoice source not found: {local_invoice_id}")
             return False
         invoice = inv_data_sql[0]
         
         # Get Items
-        items_sql = db_manager.execute_pg_query("SELECT * FROM sales_order_items WHERE order_id = %s", (local_invoice_id,))
+        items_sql = await db_manager.execute_pg_query_async("SELECT * FROM sales_order_items WHERE order_id = %s", (local_invoice_id,))
         items_prepared = []
 
-        # Pre-process items for finding codes and types (Common for all methods)
-        for item in items_sql:
-            p_code = db_manager.execute_pg_query(f"SELECT code FROM products WHERE id = {item['product_id']}")[0]['code']
-             # Check Type (Material vs Service)
-            is_srv = False
-            # Check SRVCARD 
-            if db_manager.execute_ms_query(f"SELECT LOGICALREF FROM LG_{f}_SRVCARD WHERE CODE = '{p_code}'"):
-                is_srv = True
-            
+        # Pre-process items for finding codes and types (Common for all methods).
+        # Codes and card refs are resolved in bulk so latency does not grow with the line count.
+        product_codes = await self._resolve_product_codes([item['product_id'] for item in items_sql or []])
+        codes = set(product_codes.values())
+        srv_refs = await dimension_cache.resolve(f, "SRVCARD", codes)
+        item_refs = await dimension_cache.resolve(f, "ITEMS", codes - set(srv_refs))
+
+        for item in items_sql or []:
+            p_code = product_codes.get(str(item['product_id']))
+            if p_code is None:
+                logger.error(f"Product not found: {item['product_id']}")
+                return False
+            is_srv = p_code in srv_refs
             items_prepared.append({
                 "product_code": p_code,
                 "quantity": item['quantity'],
                 "unit_price": item['unit_price'],
                 "total_price": item['total_price'],
-                "is_service": is_srv
+                "is_service": is_srv,
+                "stock_ref": srv_refs.get(p_code) if is_srv else item_refs.get(p_code, 0)
             })
             
-        customer_code_res = db_manager.execute_pg_query(f"SELECT code FROM customers WHERE id = {invoice['customer_id']}")
-        if not customer_code_res: return False
+        customer_code = await self._resolve_customer_code(invoice['customer_id'])
+        if not customer_code: return False
         
         invoice_prepared = {
             "created_at": invoice['created_at'],
             "formatted_number": invoice.get('order_number'),
-            "customer_code": customer_code_res[0]['code'],
+            "customer_code": customer_code,
             "notes": invoice.get('notes')
         }
 
         # 1. Try Objects
-        if HAS_WIN32 and self.integration_mode != "DirectDB": # Unless forced to DB
+        if unity_pool.available and self.integration_mode != "DirectDB": # Unless forced to DB
             logger.info("Attempting Transfer via Unity Objects...")
-            success, msg = await self._transfer_via_objects(invoice_prepared, items_prepared, invoice_type)
+            success, msg = await self._transfer_via_objects(invoice_prepared, items_prepared, invoice_type, f, p, timeout)
             if success:
                 logger.info(f"Unity Transfer Success. Ref: {msg}")
                 return True
@@ -508,62 +593,61 @@ class LogoIntegrationService:
         
         # 2. Get Client Ref
         client_code = invoice_prepared['customer_code']
-        client_ref_res = db_manager.execute_ms_query(f"SELECT LOGICALREF FROM LG_{f}_CLCARD WHERE CODE = '{client_code}'")
-        if not client_ref_res:
+        client_ref = await dimension_cache.resolve_one(f, "CLCARD", client_code)
+        if not client_ref:
              logger.error(f"Client not found in Logo: {client_code}")
              return False
-        client_ref = client_ref_res[0]['LOGICALREF']
         
         # 3. Insert Invoice Header (INVOICE)
         fiche_no = invoice_prepared['formatted_number'] or f"INV{datetime.now().strftime('%Y%m%d%H%M')}"
         
-        exists = db_manager.execute_ms_query(f"SELECT LOGICALREF FROM LG_{f}_{p}_INVOICE WHERE FICHENO = '{fiche_no}' AND TRCODE = {tr_code}")
+        exists = await db_manager.execute_ms_query_async(f"SELECT LOGICALREF FROM LG_{f}_{p}_INVOICE WHERE FICHENO = '{fiche_no}' AND TRCODE = {tr_code}")
         if exists: return True
 
         try:
-             db_manager.execute_ms_query(f"""
+             await db_manager.execute_ms_query_async(f"""
                 INSERT INTO LG_{f}_{p}_INVOICE (FICHENO, DATE_, TRCODE, CLIENTREF, GRPCODE, SOURCEINDEX, INVOICENO, DOCODE)
                 VALUES (%s, %s, %s, %s, 2, 0, %s, %s)
             """, (fiche_no, invoice_prepared['created_at'], tr_code, client_ref, fiche_no, fiche_no), fetch=False)
             
-             inv_ref_res = db_manager.execute_ms_query(f"SELECT LOGICALREF FROM LG_{f}_{p}_INVOICE WHERE FICHENO = '{fiche_no}' AND TRCODE = {tr_code}")
+             inv_ref_res = await db_manager.execute_ms_query_async(f"SELECT LOGICALREF FROM LG_{f}_{p}_INVOICE WHERE FICHENO = '{fiche_no}' AND TRCODE = {tr_code}")
              invoice_ref = inv_ref_res[0]['LOGICALREF']
         except Exception as e:
             logger.error(f"Failed to insert invoice header: {e}")
             return False
 
-        # 4. Insert Invoice Lines
-        for item in items_prepared:
-            stock_ref = 0
-            line_type = 4 if item['is_service'] else 0
-            
-            table_source = "SRVCARD" if item['is_service'] else "ITEMS"
-            ref_res = db_manager.execute_ms_query(f"SELECT LOGICALREF FROM LG_{f}_{table_source} WHERE CODE = '{item['product_code']}'")
-            if ref_res:
-                stock_ref = ref_res[0]['LOGICALREF']
-            
-            if stock_ref == 0: continue
-                
-            line_query = f"""
-                INSERT INTO LG_{f}_{p}_STLINE (STOCKREF, AMOUNT, PRICE, TOTAL, DATE_, TRCODE, INVOICEREF, LINETYPE, CLIENTREF, SOURCEINDEX)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 0)
-            """
-            db_manager.execute_ms_query(line_query, (
-                stock_ref, item['quantity'], item['unit_price'], item['total_price'],
-                invoice_prepared['created_at'], tr_code, invoice_ref, line_type, client_ref
-            ), fetch=False)
+        # 4. Insert Invoice Lines (single multi-row INSERT)
+        rows = [
+            (item['stock_ref'], item['quantity'], item['unit_price'], item['total_price'],
+             invoice_prepared['created_at'], tr_code, invoice_ref, 4 if item['is_service'] else 0, client_ref, 0)
+            for item in items_prepared if item['stock_ref']
+        ]
+        if not await self._insert_rows_ms(
+            f"LG_{f}_{p}_STLINE",
+            ["STOCKREF", "AMOUNT", "PRICE", "TOTAL", "DATE_", "TRCODE", "INVOICEREF", "LINETYPE", "CLIENTREF", "SOURCEINDEX"],
+            rows
+        ):
+            return False
             
         logger.info(f"Direct SQL Transfer Success: {fiche_no}")
         return True
             
     # --- CUSTOMER (CLCARD) CRUD ---
-    async def get_customers(self, search: str = None, firma: str = None):
-        """Read customers from Logo"""
+    CUSTOMER_COLUMNS = {"LOGICALREF": "LOGICALREF", "CODE": "CODE", "NAME": "DEFINITION_", "ADDRESS": "ADDR1", "CITY": "CITY"}
+    ITEM_COLUMNS = {"LOGICALREF": "LOGICALREF", "CODE": "CODE", "NAME": "NAME", "CATEGORY": "STGRPCODE"}
+    SERVICE_COLUMNS = {"LOGICALREF": "LOGICALREF", "CODE": "CODE", "NAME": "DEFINITION_", "CARDTYPE": "CARDTYPE"}
+    ORDER_COLUMNS = {"LOGICALREF": "LOGICALREF", "FICHENO": "FICHENO", "DATE_": "DATE_", "SOURCEINDEX": "SOURCEINDEX", "NETTOTAL": "NETTOTAL"}
+
+    async def get_customers(self, search: str = None, firma: str = None, cursor: int = None, limit: int = None, fields: list = None):
+        """Read a page of customers from Logo"""
         f = firma or self.firma_no
-        query = f"SELECT LOGICALREF, CODE, DEFINITION_ AS NAME, ADDR1 AS ADDRESS, CITY FROM LG_{f}_CLCARD (NOLOCK) WHERE CARDTYPE <> 22"
-        if search:
-            query += f" AND (CODE LIKE '%{search}%' OR DEFINITION_ LIKE '%{search}%')"
-        return db_manager.execute_ms_query(query)
+        if search and cursor is None:
+            page = await self._indexed_search(f, "customers", self.CUSTOMER_COLUMNS, search, limit, fields)
+            if page is not None:
+                return page
+        where, params = self._search_filter(search, "CODE", "DEFINITION_")
+        return await self._keyset_page(f"LG_{f}_CLCARD", self.CUSTOMER_COLUMNS, ["CARDTYPE <> 22"] + where, params,
+                                       cursor, limit, fields)
 
     async def create_customer(self, data: dict):
         """Insert a 'Draft' customer into Logo (Intermediary or direct table)"""
@@ -575,40 +659,49 @@ class LogoIntegrationService:
             VALUES (%s, %s, %s, %s, %s, %s, 1)
         """
         params = (data['code'], data['name'], data.get('address', ''), data.get('city', ''), data.get('tax_office', ''), data.get('tax_number', ''))
-        return db_manager.execute_ms_query(query, params, fetch=False)
+        return await db_manager.execute_ms_query_async(query, params, fetch=False)
 
     async def update_customer(self, erp_code: str, data: dict):
         """Update existing customer in Logo"""
         logger.info(f"Updating Logo customer: {erp_code}")
         query = f"UPDATE LG_{self.firma_no}_CLCARD SET DEFINITION_ = %s, ADDR1 = %s, CITY = %s WHERE CODE = %s"
         params = (data['name'], data.get('address', ''), data.get('city', ''), erp_code)
-        return db_manager.execute_ms_query(query, params, fetch=False)
+        return await db_manager.execute_ms_query_async(query, params, fetch=False)
 
     # --- ITEM (ITEMS) CRUD ---
-    async def get_items(self, search: str = None):
-        """Read items from Logo"""
-        query = f"SELECT LOGICALREF, CODE, NAME, STGRPCODE AS CATEGORY FROM LG_{self.firma_no}_ITEMS (NOLOCK) WHERE CARDTYPE = 1"
-        if search:
-            query += f" AND (CODE LIKE '%{search}%' OR NAME LIKE '%{search}%')"
-        return db_manager.execute_ms_query(query)
+    async def get_items(self, search: str = None, firma: str = None, cursor: int = None, limit: int = None, fields: list = None):
+        """Read a page of items from Logo"""
+        f = firma or self.firma_no
+        if search and cursor is None:
+            page = await self._indexed_search(f, "items", self.ITEM_COLUMNS, search, limit, fields)
+            if page is not None:
+                return page
+        where, params = self._search_filter(search, "CODE", "NAME")
+        return await self._keyset_page(f"LG_{f}_ITEMS", self.ITEM_COLUMNS, ["CARDTYPE = 1"] + where, params,
+                                       cursor, limit, fields)
 
     # --- SERVICE (SRVCARD) CRUD ---
-    async def get_services(self, search: str = None):
-        """Read services from Logo"""
-        query = f"SELECT LOGICALREF, CODE, DEFINITION_ AS NAME, CARDTYPE FROM LG_{self.firma_no}_SRVCARD (NOLOCK) WHERE CARDTYPE IN (1, 2)"
-        if search:
-            query += f" AND (CODE LIKE '%{search}%' OR DEFINITION_ LIKE '%{search}%')"
-        return db_manager.execute_ms_query(query)
+    async def get_services(self, search: str = None, firma: str = None, cursor: int = None, limit: int = None, fields: list = None):
+        """Read a page of services from Logo"""
+        f = firma or self.firma_no
+        where, params = self._search_filter(search, "CODE", "DEFINITION_")
+        return await self._keyset_page(f"LG_{f}_SRVCARD", self.SERVICE_COLUMNS, ["CARDTYPE IN (1, 2)"] + where, params,
+                                       cursor, limit, fields)
 
     # --- ORDER (ORFICHE) CRUD ---
-    async def get_orders(self, customer_code: str = None, firma: str = None, period: str = None):
-        """Read orders from Logo"""
+    async def get_orders(self, customer_code: str = None, firma: str = None, period: str = None,
+                         cursor: int = None, limit: int = None, fields: list = None):
+        """Read a page of orders from Logo, newest first"""
         f = firma or self.firma_no
         p = period or self.period_no
-        query = f"SELECT LOGICALREF, FICHENO, DATE_, SOURCEINDEX, NETTOTAL FROM LG_{f}_{p}_ORFICHE (NOLOCK)"
+        where, params = [], []
         if customer_code:
-            query += f" WHERE CLIENTREF = (SELECT LOGICALREF FROM LG_{f}_CLCARD WHERE CODE = '{customer_code}')"
-        return db_manager.execute_ms_query(query)
+            client_ref = await dimension_cache.resolve_one(f, "CLCARD", customer_code)
+            if client_ref is None:
+                return {"items": [], "next_cursor": None, "has_more": False, "limit": limit, "estimated_total": 0}
+            where, params = ["CLIENTREF = %s"], [client_ref]
+        return await self._keyset_page(f"LG_{f}_{p}_ORFICHE", self.ORDER_COLUMNS, where, params,
+                                       cursor, limit, fields, descending=True)
 
     # --- STOCK (STFICHE) CRUD ---
     async def create_stock_count(self, items: list):
@@ -627,18 +720,21 @@ class LogoIntegrationService:
             INSERT INTO LG_{f}_{p}_STFICHE (FICHENO, DATE_, TRCODE, SOURCEINDEX, BILLED)
             VALUES (%s, GETDATE(), 6, 0, 0)
         """
-        db_manager.execute_ms_query(header_query, (fiche_no,), fetch=False)
+        await db_manager.execute_ms_query_async(header_query, (fiche_no,), fetch=False)
         
         # 2. Insert Lines (STLINE)
         # In a production environment, we'd need the LOGICALREF from STFICHE.
+        item_refs = await dimension_cache.resolve(f, "ITEMS", [item['barcode'] for item in items])
+        now = datetime.now()
+        rows = []
         for item in items:
-            line_query = f"""
-                INSERT INTO LG_{f}_{p}_STLINE (STOCKREF, AMOUNT, DATE_, TRCODE, STFICHEREF, LINETYPE)
-                VALUES ((SELECT LOGICALREF FROM LG_{f}_ITEMS WHERE CODE = %s), %s, GETDATE(), 6, 0, 0)
-            """
-            db_manager.execute_ms_query(line_query, (item['barcode'], item['qty']), fetch=False)
-            
-        return True
+            if item['barcode'] not in item_refs:
+                logger.warning(f"Stock count item not found in Logo: {item['barcode']}")
+                continue
+            rows.append((item_refs[item['barcode']], item['qty'], now, 6, 0, 0))
+        return await self._insert_rows_ms(
+            f"LG_{f}_{p}_STLINE", ["STOCKREF", "AMOUNT", "DATE_", "TRCODE", "STFICHEREF", "LINETYPE"], rows
+        )
 
     # --- COLLECTION / PAYMENT (KSLINES) CRUD ---
     async def create_payment(self, data: dict):
@@ -646,12 +742,16 @@ class LogoIntegrationService:
         logger.info(f"Recording Logo payment for customer: {data.get('customer_code')}")
         # Simplistic SQL insert for draft payment. 
         # Real-world apps use Unity Objects for automatic account balancing.
+        client_ref = await dimension_cache.resolve_one(self.firma_no, "CLCARD", data['customer_code'])
+        if client_ref is None:
+            logger.error(f"Client not found in Logo: {data.get('customer_code')}")
+            return False
         query = f"""
             INSERT INTO LG_{self.firma_no}_KSLINES (DATE_, AMOUNT, CLIENTREF, SOURCEINDEX, TRCODE)
-            VALUES (%s, %s, (SELECT LOGICALREF FROM LG_{self.firma_no}_CLCARD WHERE CODE = %s), 0, 1)
+            VALUES (%s, %s, %s, 0, 1)
         """
-        params = (datetime.now(), data['amount'], data['customer_code'])
-        return db_manager.execute_ms_query(query, params, fetch=False)
+        params = (datetime.now(), data['amount'], client_ref)
+        return await db_manager.execute_ms_query_async(query, params, fetch=False)
 
     async def get_yoy_comparison(self, period_type: str = "daily"):
         """
@@ -669,13 +769,26 @@ class LogoIntegrationService:
         view_name = view_map.get(period_type.lower(), "V_YOY_DAILY_COMPARISON")
         query = f"SELECT * FROM {view_name} (NOLOCK)"
         
-        result = db_manager.execute_ms_query(query)
+        result = await db_manager.execute_ms_query_async(query)
         if result and len(result) > 0:
             return result[0]  # Return first row as dict
         return {}
 
+    async def _fetch_ms(self, query: str, params: tuple = None, stream: bool = False):
+        """Run a Logo report query; with stream=True return an async row iterator instead of a list"""
+        if stream:
+            return db_manager.stream_ms_query_async(query, params)
+        return await db_manager.execute_ms_query_async(query, params)
+
+    async def _fetch_pg(self, query: str, params: tuple = None, stream: bool = False):
+        """PostgreSQL counterpart of _fetch_ms"""
+        if stream:
+            return db_manager.stream_pg_query_async(query, params)
+        return await db_manager.execute_pg_query_async(query, params)
+
     # --- REPORTS & ANALYTICS ---
-    async def get_sales_report(self, start_date: str, end_date: str, firma: str = None, period: str = None):
+    @cached_report(ttl=60)
+    async def get_sales_report(self, start_date: str, end_date: str, firma: str = None, period: str = None, stream: bool = False):
         """Detailed Sales Report from Logo INVOICE & STLINE"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -691,24 +804,27 @@ class LogoIntegrationService:
             WHERE INV.DATE_ BETWEEN %s AND %s
             ORDER BY INV.DATE_ DESC
         """
-        return db_manager.execute_ms_query(query, (start_date, end_date))
+        return await self._fetch_ms(query, (start_date, end_date), stream=stream)
 
-    async def get_collection_report(self, start_date: str, end_date: str):
+    @cached_report(ttl=60)
+    async def get_collection_report(self, start_date: str, end_date: str, firma: str = None, stream: bool = False):
         """Collection Report from Logo KSLINES"""
+        f = firma or self.firma_no
         query = f"""
             SELECT 
                 KS.DATE_, 
                 KS.AMOUNT, 
                 CLC.DEFINITION_ AS CUSTOMER_NAME,
                 KS.TRCODE
-            FROM LG_{self.firma_no}_KSLINES KS (NOLOCK)
-            LEFT JOIN LG_{self.firma_no}_CLCARD CLC (NOLOCK) ON KS.CLIENTREF = CLC.LOGICALREF
+            FROM LG_{f}_KSLINES KS (NOLOCK)
+            LEFT JOIN LG_{f}_CLCARD CLC (NOLOCK) ON KS.CLIENTREF = CLC.LOGICALREF
             WHERE KS.DATE_ BETWEEN %s AND %s
             ORDER BY KS.DATE_ DESC
         """
-        return db_manager.execute_ms_query(query, (start_date, end_date))
+        return await self._fetch_ms(query, (start_date, end_date), stream=stream)
 
-    async def get_customer_balances(self, firma: str = None, period: str = None):
+    @cached_report(ttl=120)
+    async def get_customer_balances(self, firma: str = None, period: str = None, stream: bool = False):
         """Current Debt/Credit Status for all customers"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -721,9 +837,9 @@ class LogoIntegrationService:
             WHERE CARDTYPE <> 22
             ORDER BY BALANCE DESC
         """
-        return db_manager.execute_ms_query(query)
+        return await self._fetch_ms(query, stream=stream)
 
-    async def get_visit_performance_report(self, start_date: str, end_date: str):
+    async def get_visit_performance_report(self, start_date: str, end_date: str, stream: bool = False):
         """Field Visit Success Report"""
         # Note: Using the field_visits table from our new schema
         query = f"""
@@ -738,10 +854,11 @@ class LogoIntegrationService:
             GROUP BY U.FULL_NAME
         """
         # This targets the main app DB (Postgres)
-        return db_manager.execute_pg_query(query, (start_date, end_date))
+        return await self._fetch_pg(query, (start_date, end_date), stream=stream)
 
-    async def get_order_tracking_report(self, start_date: str, end_date: str):
+    async def get_order_tracking_report(self, start_date: str, end_date: str, firma: str = None, stream: bool = False):
         """Order Sync & Status Report from Logo & Local DB"""
+        # Local PostgreSQL tables are not split by firm: `firma` is accepted for a uniform signature only
         query = f"""
             SELECT 
                 ORD.ORDER_NUMBER, 
@@ -754,9 +871,10 @@ class LogoIntegrationService:
             WHERE ORD.CREATED_AT BETWEEN %s AND %s
             ORDER BY ORD.CREATED_AT DESC
         """
-        return db_manager.execute_pg_query(query, (start_date, end_date))
+        return await self._fetch_pg(query, (start_date, end_date), stream=stream)
 
-    async def get_inventory_status(self, firma: str = None, period: str = None):
+    @cached_report(ttl=120)
+    async def get_inventory_status(self, firma: str = None, period: str = None, stream: bool = False):
         """Full inventory status with values"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -771,9 +889,10 @@ class LogoIntegrationService:
             WHERE TOT.INVENNO = -1 -- All Warehouses sum
             ORDER BY QUANTITY DESC
         """
-        return db_manager.execute_ms_query(query)
+        return await self._fetch_ms(query, stream=stream)
 
-    async def get_top_selling_products(self, limit: int = 10, firma: str = None, period: str = None):
+    @cached_report(ttl=300)
+    async def get_top_selling_products(self, limit: int = 10, firma: str = None, period: str = None, stream: bool = False):
         """Top selling products by quantity"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -788,9 +907,10 @@ class LogoIntegrationService:
             GROUP BY ITEM.CODE, ITEM.NAME
             ORDER BY TOTAL_QUANTITY DESC
         """
-        return db_manager.execute_ms_query(query)
+        return await self._fetch_ms(query, stream=stream)
 
-    async def get_salesman_leaderboard(self, start_date: str, end_date: str, firma: str = None, period: str = None):
+    @cached_report(ttl=120)
+    async def get_salesman_leaderboard(self, start_date: str, end_date: str, firma: str = None, period: str = None, stream: bool = False):
         """Total Sales (TL) ranking for salesmen (from Logo SLSMAN)"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -805,9 +925,10 @@ class LogoIntegrationService:
             GROUP BY SLS.DEFINITION_
             ORDER BY TOTAL_SALES_TL DESC
         """
-        return db_manager.execute_ms_query(query, (start_date, end_date))
+        return await self._fetch_ms(query, (start_date, end_date), stream=stream)
 
-    async def get_debt_aging_report(self, firma: str = None, period: str = None):
+    @cached_report(ttl=600)
+    async def get_debt_aging_report(self, firma: str = None, period: str = None, stream: bool = False):
         """Borç Yaşlandırma (Debt Aging) - 0-30, 31-60, 61-90, 90+ days"""
         # Note: This is a complex query simplified for generic ERP use cases.
         # Professional Logo implementations usually query PAYTRANS table.
@@ -828,9 +949,10 @@ class LogoIntegrationService:
             GROUP BY CLC.CODE, CLC.DEFINITION_
             HAVING SUM(BALANCE) > 0
         """
-        return db_manager.execute_ms_query(query)
+        return await self._fetch_ms(query, stream=stream)
 
-    async def get_category_sales_analysis(self, start_date: str, end_date: str, firma: str = None, period: str = None):
+    @cached_report(ttl=300)
+    async def get_category_sales_analysis(self, start_date: str, end_date: str, firma: str = None, period: str = None, stream: bool = False):
         """Sales distribution by product category (Stok Grup Kodu)"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -844,9 +966,10 @@ class LogoIntegrationService:
             GROUP BY ITEM.STGRPCODE
             ORDER BY TOTAL_TL DESC
         """
-        return db_manager.execute_ms_query(query, (start_date, end_date))
+        return await self._fetch_ms(query, (start_date, end_date), stream=stream)
 
-    async def get_churn_risk_report(self, firma: str = None, period: str = None):
+    @cached_report(ttl=1800)
+    async def get_churn_risk_report(self, firma: str = None, period: str = None, stream: bool = False):
         """Müşteri Kaybetme Riski - 30+ gündür sipariş vermeyenler"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -864,9 +987,10 @@ class LogoIntegrationService:
             HAVING DATEDIFF(DAY, MAX(INV.DATE_), GETDATE()) > 30 OR MAX(INV.DATE_) IS NULL
             ORDER BY DAYS_SILENT DESC
         """
-        return db_manager.execute_ms_query(query)
+        return await self._fetch_ms(query, stream=stream)
 
-    async def get_profitability_analysis(self, start_date: str, end_date: str, firma: str = None, period: str = None):
+    @cached_report(ttl=600)
+    async def get_profitability_analysis(self, start_date: str, end_date: str, firma: str = None, period: str = None, stream: bool = False):
         """Brüt Karlılık Analizi - Satış vs Son Alış Maliyeti"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -889,9 +1013,10 @@ class LogoIntegrationService:
             GROUP BY ITEM.CODE, ITEM.NAME
             HAVING SUM(STL.LINENET) > 0
         """
-        return db_manager.execute_ms_query(query, (start_date, end_date))
+        return await self._fetch_ms(query, (start_date, end_date), stream=stream)
 
-    async def get_target_achievement_report(self, firma: str = None, period: str = None):
+    @cached_report(ttl=600)
+    async def get_target_achievement_report(self, firma: str = None, period: str = None, stream: bool = False):
         """Hedef Gerçekleşme - Cari Ay vs Geçen Yıl Aynı Ay + %10 Hedef"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -904,9 +1029,9 @@ class LogoIntegrationService:
             JOIN LG_SLSMAN SLS (NOLOCK) ON INV.SALESMANREF = SLS.LOGICALREF
             GROUP BY SLS.DEFINITION_
         """
-        return db_manager.execute_ms_query(query)
+        return await self._fetch_ms(query, stream=stream)
 
-    async def get_customer_product_history(self, customer_code: str, item_code: str, firma: str = None, period: str = None):
+    async def get_customer_product_history(self, customer_code: str, item_code: str, firma: str = None, period: str = None, stream: bool = False):
         """Cari-Ürün Çapraz Hareket - Bu müşteri bu ürünü kaça almıştı?"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -925,9 +1050,10 @@ class LogoIntegrationService:
             WHERE CLC.CODE = %s AND ITEM.CODE = %s
             ORDER BY INV.DATE_ DESC
         """
-        return db_manager.execute_ms_query(query, (customer_code, item_code))
+        return await self._fetch_ms(query, (customer_code, item_code), stream=stream)
 
-    async def get_document_chain_report(self, start_date: str, end_date: str, firma: str = None, period: str = None):
+    @cached_report(ttl=120)
+    async def get_document_chain_report(self, start_date: str, end_date: str, firma: str = None, period: str = None, stream: bool = False):
         """Belge Zinciri - Sipariş -> İrsaliye -> Fatura Takibi"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -948,9 +1074,9 @@ class LogoIntegrationService:
             WHERE ORD.DATE_ BETWEEN %s AND %s
             ORDER BY ORD.DATE_ DESC
         """
-        return db_manager.execute_ms_query(query, (start_date, end_date))
+        return await self._fetch_ms(query, (start_date, end_date), stream=stream)
 
-    async def get_detailed_line_report(self, type: str, fiche_no: str, firma: str = None, period: str = None):
+    async def get_detailed_line_report(self, type: str, fiche_no: str, firma: str = None, period: str = None, stream: bool = False):
         """Fatura/İrsaliye Satır Dökümü"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -968,9 +1094,9 @@ class LogoIntegrationService:
             JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON STL.STOCKREF = ITEM.LOGICALREF
             WHERE FICH.FICHENO = %s
         """
-        return db_manager.execute_ms_query(query, (fiche_no,))
+        return await self._fetch_ms(query, (fiche_no,), stream=stream)
 
-    async def get_pos_daily_report(self, date: str, firma: str = None, period: str = None):
+    async def get_pos_daily_report(self, date: str, firma: str = None, period: str = None, stream: bool = False):
         """POS Gün Sonu - Perakende Satışlar"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -985,9 +1111,10 @@ class LogoIntegrationService:
             WHERE INV.TRCODE = 7 -- Retail Invoice
             AND INV.DATE_ = %s
         """
-        return db_manager.execute_ms_query(query, (date,))
+        return await self._fetch_ms(query, (date,), stream=stream)
 
-    async def get_lot_expiry_report(self, days: int = 30, firma: str = None, period: str = None):
+    @cached_report(ttl=1800)
+    async def get_lot_expiry_report(self, days: int = 30, firma: str = None, period: str = None, stream: bool = False):
         """Lot/Seri SKT Takibi - Expiry Warning"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -1004,9 +1131,10 @@ class LogoIntegrationService:
             AND LT.EXPDATE <= DATEADD(DAY, %s, GETDATE())
             ORDER BY LT.EXPDATE ASC
         """
-        return db_manager.execute_ms_query(query, (days,))
+        return await self._fetch_ms(query, (days,), stream=stream)
 
-    async def get_stock_transfer_report(self, start_date: str, end_date: str, firma: str = None, period: str = None):
+    @cached_report(ttl=120)
+    async def get_stock_transfer_report(self, start_date: str, end_date: str, firma: str = None, period: str = None, stream: bool = False):
         """Ambar Transferleri"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -1026,9 +1154,10 @@ class LogoIntegrationService:
             WHERE STF.TRCODE = 25 -- Stock Transfer
             AND STF.DATE_ BETWEEN %s AND %s
         """
-        return db_manager.execute_ms_query(query, (f, f, start_date, end_date))
+        return await self._fetch_ms(query, (f, f, start_date, end_date), stream=stream)
 
-    async def get_cashflow_report(self, firma: str = None, period: str = None):
+    @cached_report(ttl=120)
+    async def get_cashflow_report(self, firma: str = None, period: str = None, stream: bool = False):
         """Nakit Akış Analizi (Kasa/Banka Özet)"""
         f = firma or self.firma_no
         p = period or self.period_no
@@ -1043,352 +1172,107 @@ class LogoIntegrationService:
             LEFT JOIN LG_{f}_{p}_BNTOT BNT (NOLOCK) ON BNC.LOGICALREF = BNT.BANKACCREF
             GROUP BY DEFINITION_
         """
-        return db_manager.execute_ms_query(query)
+        return await self._fetch_ms(query, stream=stream)
+
+    def report_codes(self) -> list:
+        """Codes served by get_report_data"""
+        return report_catalog.codes()
+
+    @cached_report(ttl=lambda call: report_catalog.ttl(call["report_code"]))
+    async def get_report_data(self, report_code: str, firma: str = None, period: str = None, params: dict = None, stream: bool = False):
+        """
+        Generic report engine over the declarative catalog (report_catalog.py).
+        Unknown codes raise KeyError, invalid params ValueError.
+        """
+        return await self.query_report_data(report_code, firma=firma, period=period, params=params, stream=stream)
 
-    async def get_report_data(self, report_code: str, firma: str = None, period: str = None, params: dict = None):
-        """160+ Rapor Şablonunu Logo Veritabanına Eşleyen Generic Motor"""
+    async def query_report_data(self, report_code: str, firma: str = None, period: str = None, params: dict = None, stream: bool = False):
+        """get_report_data without the report cache, for callers that must read Logo (snapshot refreshes)"""
         f = firma or self.firma_no
         p = period or self.period_no
-        
-        # Report Registry: Mapping generic codes to Logo MSSQL
-        registry = {
-            # 1.1 Inventory (Stok)
-            "INV_REPORT_01": f"SELECT ITEM.CODE, ITEM.NAME, SUM(GNT.ONHAND) AS VALUE FROM LG_{f}_ITEMS ITEM (NOLOCK) LEFT JOIN LG_{f}_{p}_GNTOTST GNT (NOLOCK) ON ITEM.LOGICALREF = GNT.STOCKREF GROUP BY ITEM.CODE, ITEM.NAME",
-            "INV_REPORT_02": f"SELECT W.NAME AS WH_NAME, SUM(GNT.ONHAND) AS VALUE FROM L_CAPIWHOUSE W (NOLOCK) LEFT JOIN LG_{f}_{p}_GNTOTST GNT (NOLOCK) ON W.NR = GNT.INVENNO JOIN LG_{f}_ITEMS I (NOLOCK) ON GNT.STOCKREF = I.LOGICALREF WHERE W.FIRMANR = {f} GROUP BY W.NAME",
-            "INV_REPORT_03": f"SELECT ITEM.STGRPCODE AS GROUP_CODE, SUM(GNT.ONHAND) AS VALUE FROM LG_{f}_ITEMS ITEM (NOLOCK) LEFT JOIN LG_{f}_{p}_GNTOTST GNT (NOLOCK) ON ITEM.LOGICALREF = GNT.STOCKREF GROUP BY ITEM.STGRPCODE",
-            
-            # 1.2 Sales (Satış)
-            "SAL_REPORT_01": f"SELECT DATE_ AS REPORT_DATE, SUM(NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE (NOLOCK) WHERE TRCODE IN (7,8) GROUP BY DATE_",
-            "SAL_REPORT_02": f"SELECT CLC.DEFINITION_ AS CUSTOMER, SUM(INV.NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.TRCODE IN (7,8) GROUP BY CLC.DEFINITION_",
-            "SAL_REPORT_03": f"SELECT SLS.DEFINITION_ AS SALESMAN, SUM(INV.NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_SLSMAN SLS (NOLOCK) ON INV.SALESMANREF = SLS.LOGICALREF WHERE INV.TRCODE IN (7,8) GROUP BY SLS.DEFINITION_",
-            
-            # 1.3 Purchase (Satın Alma)
-            "PUR_REPORT_01": f"SELECT DATE_ AS REPORT_DATE, SUM(NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE (NOLOCK) WHERE TRCODE IN (1,2) GROUP BY DATE_",
-            "PUR_REPORT_02": f"SELECT CLC.DEFINITION_ AS VENDOR, SUM(INV.NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.TRCODE IN (1,2) GROUP BY CLC.DEFINITION_",
-            
-            # 1.4 Finance (Finans)
-            "FIN_REPORT_01": f"SELECT DATE_ AS REPORT_DATE, SUM(AMOUNT) AS TOTAL FROM LG_{f}_{p}_KSLINES (NOLOCK) GROUP BY DATE_",
-            "FIN_REPORT_02": f"SELECT BN.DEFINITION_ AS BANK, SUM(BNT.DEBIT - BNT.CREDIT) AS BALANCE FROM LG_{f}_BANKACC BN (NOLOCK) LEFT JOIN LG_{f}_{p}_BNTOT BNT (NOLOCK) ON BN.LOGICALREF = BNT.BANKACCREF GROUP BY BN.DEFINITION_",
-            "FIN_REPORT_03": f"SELECT CLC.DEFINITION_ AS CUSTOMER, SUM(CASE WHEN DATEDIFF(DAY, DATE_, GETDATE()) > 30 THEN NETTOTAL ELSE 0 END) AS OVER_30_DAYS, SUM(CASE WHEN DATEDIFF(DAY, DATE_, GETDATE()) > 60 THEN NETTOTAL ELSE 0 END) AS OVER_60_DAYS FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.TRCODE IN (7,8) GROUP BY CLC.DEFINITION_",
-            "FIN_REPORT_04": f"SELECT INV.FICHENO, CLC.DEFINITION_ AS CUSTOMER, INV.DATE_ AS DOC_DATE, INV.NETTOTAL FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.NETTOTAL > 0 AND DATEDIFF(DAY, INV.DATE_, GETDATE()) > 90",
-            
-            # 1.5 Ops (Saha)
-            "OPS_REPORT_01": f"SELECT DATE_ AS REPORT_DATE, COUNT(*) AS ORDER_COUNT FROM LG_{f}_{p}_ORFICHE (NOLOCK) WHERE TRCODE = 1 GROUP BY DATE_",
-            "OPS_REPORT_02": f"SELECT device_id, sync_time, status, error_message FROM sync_logs (NOLOCK) WHERE status = 'ERROR' ORDER BY sync_time DESC",
-            "OPS_REPORT_03": f"SELECT salesman_name, timestamp, latitude, longitude FROM gps_logs (NOLOCK) ORDER BY timestamp DESC",
-
-            # 1.6 Production (Üretim)
-            "PROD_REPORT_01": f"SELECT BOM.CODE AS BOM_CODE, ITEM.NAME AS ITEM_NAME, BOM.DEFINITION_ AS BOM_DESC FROM LG_{f}_BOMASTER BOM (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON BOM.MAINITEMREF = ITEM.LOGICALREF",
-            "PROD_REPORT_02": f"SELECT FICHENO, DATE_, LINE.PDBNAME AS DEPT, ITEM.NAME AS ITEM_NAME, AMOUNT FROM LG_{f}_{p}_PRODORD ORD (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON ORD.ITEMREF = ITEM.LOGICALREF LEFT JOIN LG_{f}_WORKSTAT LINE (NOLOCK) ON ORD.WORKSTATREF = LINE.LOGICALREF",
-            "PROD_REPORT_03": f"SELECT WS.CODE, WS.DEFINITION_, COUNT(ORD.LOGICALREF) AS ACTIVE_ORDERS FROM LG_{f}_WORKSTAT WS (NOLOCK) LEFT JOIN LG_{f}_{p}_PRODORD ORD (NOLOCK) ON WS.LOGICALREF = ORD.WORKSTATREF GROUP BY WS.CODE, WS.DEFINITION_",
-
-            # 1.7 Advanced Analytics
-            "SAL_REPORT_04": f"SELECT ITEM.CODE, ITEM.NAME, SUM(CASE WHEN YEAR(DATE_) = YEAR(GETDATE()) THEN NETTOTAL ELSE 0 END) AS THIS_YEAR, SUM(CASE WHEN YEAR(DATE_) = YEAR(GETDATE())-1 THEN NETTOTAL ELSE 0 END) AS LAST_YEAR FROM LG_{f}_{p}_STLINE STL (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON STL.STOCKREF = ITEM.LOGICALREF GROUP BY ITEM.CODE, ITEM.NAME",
-            "SAL_REPORT_05": f"SELECT DATEPART(week, DATE_) as WEEK_NO, SUM(NETTOTAL) FROM LG_{f}_{p}_STLINE (NOLOCK) WHERE TRCODE IN (7,8) GROUP BY DATEPART(week, DATE_)",
-            "SAL_REPORT_10": f"SELECT CLC.DEFINITION_ AS CUSTOMER, SUM(STL.VATMATRAH) AS REVENUE, SUM(STL.OUTCOST) AS COST, (SUM(STL.VATMATRAH) - SUM(STL.OUTCOST)) AS PROFIT FROM LG_{f}_{p}_STLINE STL (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON STL.CLIENTREF = CLC.LOGICALREF GROUP BY CLC.DEFINITION_",
-            "PUR_REPORT_03": f"SELECT CLC.DEFINITION_ AS VENDOR, COUNT(*) AS ORDER_COUNT, AVG(NETTOTAL) AS AVG_ORDER_VALUE FROM LG_{f}_{p}_INVOICE (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON CLIENTREF = CLC.LOGICALREF WHERE TRCODE = 1 GROUP BY CLC.DEFINITION_",
-            "PUR_REPORT_04": f"SELECT FICHENO, CLC.DEFINITION_ AS VENDOR, DATE_, DATEDIFF(DAY, DATE_, GETDATE()) AS DAYS_OVERDUE FROM LG_{f}_{p}_ORFICHE (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON CLIENTREF = CLC.LOGICALREF WHERE TRCODE = 2 AND STATUS = 1",
-            
-            # 1.8 Inventory Depth
-            "INV_REPORT_02": f"SELECT L.NAME AS WAREHOUSE, SUM(I.ONHAND) AS STOCK FROM LV_{f}_{p}_GNTOTST I (NOLOCK) JOIN L_CAPIWHOUSE L (NOLOCK) ON I.INVENNO = L.NR WHERE I.ITEMREF > 0 GROUP BY L.NAME",
-            "INV_REPORT_04": f"SELECT ITEM.CODE, ITEM.NAME, SUM(I.RESERVED) AS RESERVED FROM LV_{f}_{p}_GNTOTST I (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON I.ITEMREF = ITEM.LOGICALREF WHERE I.RESERVED > 0 GROUP BY ITEM.CODE, ITEM.NAME",
-            
-            # 1.9 Quality
-            "QC_REPORT_01": f"SELECT ITEM.NAME, COUNT(*) AS REJECT_COUNT FROM LG_{f}_{p}_STLINE STL (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON STL.STOCKREF = ITEM.LOGICALREF WHERE TRCODE = 3 GROUP BY ITEM.NAME",
-        }
-
-        # Fallback to generic code if not in registry for testing purposes
-        # In production, we would map all 160 codes.
-        sql = registry.get(report_code)
-        if not sql:
-            # If not mapped yet, provide a placeholder query for high codes
-            sql = f"SELECT 'NOT_MAPPED' AS STATUS, '{report_code}' AS CODE"
-            
-        return db_manager.execute_ms_query(sql)
+        sql, values = report_catalog.query(report_code, f, p, params)
+        return await self._fetch_ms(sql, values, stream=stream)
 
     async def get_unit_code(self, item_code: str):
-        # Implementation remains the same
-        query = f"""
-            SELECT TOP 1 UNIT_CODE 
-            FROM LG_{self.firma_no}_UNITSETL (NOLOCK)
-            WHERE ITEMREF = (SELECT LOGICALREF FROM LG_{self.firma_no}_ITEMS (NOLOCK) WHERE CODE = '{item_code}')
-            ORDER BY LINENR
-        """
-        result = db_manager.execute_ms_query(query)
-        return result[0]['UNIT_CODE'] if result else "ADET"
+        # Served from the dimension cache: ITEMS.UNITSETREF -> main unit of the set
+        f = self.firma_no
+        await dimension_cache.resolve_one(f, "ITEMS", item_code)
+        item = dimension_cache.get(f, "ITEMS", item_code)
+        if item and item[1].get("UNITSETREF"):
+            unit_ref = item[1]["UNITSETREF"]
+            await dimension_cache.resolve_one(f, "UNITSETL", unit_ref)
+            unit = dimension_cache.get(f, "UNITSETL", unit_ref)
+            if unit and unit[1].get("CODE"):
+                return unit[1]["CODE"]
+        return "ADET"
 
     # =====================================================
     # YEAR-OVER-YEAR (YoY) COMPARISON REPORTS
     # =====================================================
     
-    async def get_yoy_daily_comparison(self, firma: str = None, period: str = None):
+    # Served from the daily sales rollup (sales_rollup.py); the rollup spans every
+    # period of the firm, so `period` is only kept for API compatibility.
+    # The daily/weekly/monthly responses also keep the key names of the former SQL
+    # versions (and of the V_YOY_* views): window dates and pct_change_invoices.
+
+    @staticmethod
+    def _yoy_legacy(period_type: str, result: dict, dates: dict) -> dict:
+        """dates: legacy key -> rollup key (current_start, current_end, ly_start, ly_end)"""
+        if not result:
+            return {}
+        return {
+            "period_type": period_type,
+            **result,
+            **{legacy: result[key] for legacy, key in dates.items()},
+            "pct_change_invoices": result.get("pct_change_invoice_count"),
+        }
+
+    async def get_yoy_range_comparison(self, start, end, firma: str = None):
         """
-        Year-over-Year Daily Comparison
-        Compares today vs same day last year
+        Year-over-Year comparison for any date window
+        Compares [start, end] vs the same dates last year
         """
         f = firma or self.firma_no
-        p = period or self.period_no
-        
-        query = f"""
-        WITH CurrentDay AS (
-            SELECT 
-                COUNT(DISTINCT I.LOGICALREF) AS invoice_count,
-                ISNULL(SUM(I.NETTOTAL), 0) AS total_revenue,
-                ISNULL(AVG(I.NETTOTAL), 0) AS avg_order_value,
-                COUNT(DISTINCT I.CLIENTREF) AS active_customers,
-                COUNT(DISTINCT ST.LOGICALREF) AS stock_movement_count,
-                ISNULL(SUM(ST.AMOUNT * ST.PRICE), 0) AS stock_movement_value
-            FROM LG_{f}_{p}_INVOICE I WITH (NOLOCK)
-            LEFT JOIN LG_{f}_{p}_STLINE ST WITH (NOLOCK) ON ST.DATE_ = CAST(GETDATE() AS DATE)
-            WHERE CAST(I.DATE_ AS DATE) = CAST(GETDATE() AS DATE)
-        ),
-        LastYearSameDay AS (
-            SELECT 
-                COUNT(DISTINCT I.LOGICALREF) AS invoice_count,
-                ISNULL(SUM(I.NETTOTAL), 0) AS total_revenue,
-                ISNULL(AVG(I.NETTOTAL), 0) AS avg_order_value,
-                COUNT(DISTINCT I.CLIENTREF) AS active_customers,
-                COUNT(DISTINCT ST.LOGICALREF) AS stock_movement_count,
-                ISNULL(SUM(ST.AMOUNT * ST.PRICE), 0) AS stock_movement_value
-            FROM LG_{f}_{p}_INVOICE I WITH (NOLOCK)
-            LEFT JOIN LG_{f}_{p}_STLINE ST WITH (NOLOCK) 
-                ON ST.DATE_ = DATEADD(YEAR, -1, CAST(GETDATE() AS DATE))
-            WHERE CAST(I.DATE_ AS DATE) = DATEADD(YEAR, -1, CAST(GETDATE() AS DATE))
-        )
-        SELECT 
-            'DAILY' AS period_type,
-            CAST(GETDATE() AS DATE) AS current_date,
-            DATEADD(YEAR, -1, CAST(GETDATE() AS DATE)) AS last_year_date,
-            
-            -- Current Period
-            C.invoice_count AS current_invoice_count,
-            C.total_revenue AS current_revenue,
-            C.avg_order_value AS current_avg_order,
-            C.active_customers AS current_customers,
-            C.stock_movement_count AS current_stock_movements,
-            C.stock_movement_value AS current_stock_value,
-            
-            -- Last Year Same Period
-            L.invoice_count AS ly_invoice_count,
-            L.total_revenue AS ly_revenue,
-            L.avg_order_value AS ly_avg_order,
-            L.active_customers AS ly_customers,
-            L.stock_movement_count AS ly_stock_movements,
-            L.stock_movement_value AS ly_stock_value,
-            
-            -- Differences
-            C.invoice_count - L.invoice_count AS diff_invoice_count,
-            C.total_revenue - L.total_revenue AS diff_revenue,
-            C.avg_order_value - L.avg_order_value AS diff_avg_order,
-            C.active_customers - L.active_customers AS diff_customers,
-            
-            -- Percentage Changes
-            CASE WHEN L.invoice_count = 0 THEN NULL 
-                 ELSE ((C.invoice_count - L.invoice_count) * 100.0 / L.invoice_count) END AS pct_change_invoices,
-            CASE WHEN L.total_revenue = 0 THEN NULL 
-                 ELSE ((C.total_revenue - L.total_revenue) * 100.0 / L.total_revenue) END AS pct_change_revenue,
-            CASE WHEN L.avg_order_value = 0 THEN NULL 
-                 ELSE ((C.avg_order_value - L.avg_order_value) * 100.0 / L.avg_order_value) END AS pct_change_avg_order,
-            CASE WHEN L.active_customers = 0 THEN NULL 
-                 ELSE ((C.active_customers - L.active_customers) * 100.0 / L.active_customers) END AS pct_change_customers
-        FROM CurrentDay C
-        CROSS JOIN LastYearSameDay L
-        """
-        
         try:
-            results = db_manager.execute_ms_query(query)
-            return results[0] if results else {}
+            return await sales_rollup.compare(f, start, end)
+        except RollupNotReady:
+            raise
         except Exception as e:
-            logger.error(f"YoY Daily Comparison failed: {e}")
+            logger.error(f"YoY Range Comparison failed: {e}")
             return {}
-    
+
+    async def get_yoy_daily_comparison(self, firma: str = None, period: str = None):
+        """
+        Year-over-Year Daily Comparison
+        Compares today vs same day last year
+        """
+        today = date.today()
+        result = await self.get_yoy_range_comparison(today, today, firma)
+        return self._yoy_legacy("DAILY", result, {"current_date": "current_start", "last_year_date": "ly_start"})
+
     async def get_yoy_weekly_comparison(self, firma: str = None, period: str = None):
         """
         Year-over-Year Weekly Comparison
-        Compares this week vs same week last year
-        """
-        f = firma or self.firma_no
-        p = period or self.period_no
-        
-        query = f"""
-        WITH CurrentWeek AS (
-            SELECT 
-                COUNT(DISTINCT I.LOGICALREF) AS invoice_count,
-                ISNULL(SUM(I.NETTOTAL), 0) AS total_revenue,
-                ISNULL(AVG(I.NETTOTAL), 0) AS avg_order_value,
-                COUNT(DISTINCT I.CLIENTREF) AS active_customers,
-                ISNULL(SUM(K.AMOUNT), 0) AS total_collections,
-                COUNT(DISTINCT K.LOGICALREF) AS collection_count
-            FROM LG_{f}_{p}_INVOICE I WITH (NOLOCK)
-            LEFT JOIN LG_{f}_{p}_KSLINES K WITH (NOLOCK) 
-                ON K.DATE_ BETWEEN DATEADD(DAY, 1-DATEPART(WEEKDAY, GETDATE()), CAST(GETDATE() AS DATE))
-                               AND CAST(GETDATE() AS DATE)
-            WHERE I.DATE_ BETWEEN DATEADD(DAY, 1-DATEPART(WEEKDAY, GETDATE()), CAST(GETDATE() AS DATE))
-                              AND CAST(GETDATE() AS DATE)
-        ),
-        LastYearSameWeek AS (
-            SELECT 
-                COUNT(DISTINCT I.LOGICALREF) AS invoice_count,
-                ISNULL(SUM(I.NETTOTAL), 0) AS total_revenue,
-                ISNULL(AVG(I.NETTOTAL), 0) AS avg_order_value,
-                COUNT(DISTINCT I.CLIENTREF) AS active_customers,
-                ISNULL(SUM(K.AMOUNT), 0) AS total_collections,
-                COUNT(DISTINCT K.LOGICALREF) AS collection_count
-            FROM LG_{f}_{p}_INVOICE I WITH (NOLOCK)
-            LEFT JOIN LG_{f}_{p}_KSLINES K WITH (NOLOCK) 
-                ON K.DATE_ BETWEEN DATEADD(YEAR, -1, DATEADD(DAY, 1-DATEPART(WEEKDAY, GETDATE()), CAST(GETDATE() AS DATE)))
-                               AND DATEADD(YEAR, -1, CAST(GETDATE() AS DATE))
-            WHERE I.DATE_ BETWEEN DATEADD(YEAR, -1, DATEADD(DAY, 1-DATEPART(WEEKDAY, GETDATE()), CAST(GETDATE() AS DATE)))
-                              AND DATEADD(YEAR, -1, CAST(GETDATE() AS DATE))
-        )
-        SELECT 
-            'WEEKLY' AS period_type,
-            DATEADD(DAY, 1-DATEPART(WEEKDAY, GETDATE()), CAST(GETDATE() AS DATE)) AS current_week_start,
-            CAST(GETDATE() AS DATE) AS current_week_end,
-            DATEADD(YEAR, -1, DATEADD(DAY, 1-DATEPART(WEEKDAY, GETDATE()), CAST(GETDATE() AS DATE))) AS ly_week_start,
-            DATEADD(YEAR, -1, CAST(GETDATE() AS DATE)) AS ly_week_end,
-            
-            -- Current Period
-            C.invoice_count AS current_invoice_count,
-            C.total_revenue AS current_revenue,
-            C.avg_order_value AS current_avg_order,
-            C.active_customers AS current_customers,
-            C.total_collections AS current_collections,
-            C.collection_count AS current_collection_count,
-            
-            -- Last Year Same Period
-            L.invoice_count AS ly_invoice_count,
-            L.total_revenue AS ly_revenue,
-            L.avg_order_value AS ly_avg_order,
-            L.active_customers AS ly_customers,
-            L.total_collections AS ly_collections,
-            L.collection_count AS ly_collection_count,
-            
-            -- Differences
-            C.invoice_count - L.invoice_count AS diff_invoice_count,
-            C.total_revenue - L.total_revenue AS diff_revenue,
-            C.total_collections - L.total_collections AS diff_collections,
-            
-            -- Percentage Changes
-            CASE WHEN L.invoice_count = 0 THEN NULL 
-                 ELSE ((C.invoice_count - L.invoice_count) * 100.0 / L.invoice_count) END AS pct_change_invoices,
-            CASE WHEN L.total_revenue = 0 THEN NULL 
-                 ELSE ((C.total_revenue - L.total_revenue) * 100.0 / L.total_revenue) END AS pct_change_revenue,
-            CASE WHEN L.total_collections = 0 THEN NULL 
-                 ELSE ((C.total_collections - L.total_collections) * 100.0 / L.total_collections) END AS pct_change_collections
-        FROM CurrentWeek C
-        CROSS JOIN LastYearSameWeek L
+        Compares this week (Monday to today) vs same dates last year
         """
-        
-        try:
-            results = db_manager.execute_ms_query(query)
-            return results[0] if results else {}
-        except Exception as e:
-            logger.error(f"YoY Weekly Comparison failed: {e}")
-            return {}
-    
+        today = date.today()
+        result = await self.get_yoy_range_comparison(today - timedelta(days=today.weekday()), today, firma)
+        return self._yoy_legacy("WEEKLY", result, {
+            "current_week_start": "current_start", "current_week_end": "current_end",
+            "ly_week_start": "ly_start", "ly_week_end": "ly_end",
+        })
+
     async def get_yoy_monthly_comparison(self, firma: str = None, period: str = None):
         """
         Year-over-Year Monthly Comparison
-        Compares this month vs same month last year
-        """
-        f = firma or self.firma_no
-        p = period or self.period_no
-        
-        query = f"""
-        WITH CurrentMonth AS (
-            SELECT 
-                COUNT(DISTINCT I.LOGICALREF) AS invoice_count,
-                ISNULL(SUM(I.NETTOTAL), 0) AS total_revenue,
-                ISNULL(AVG(I.NETTOTAL), 0) AS avg_order_value,
-                COUNT(DISTINCT I.CLIENTREF) AS active_customers,
-                COUNT(DISTINCT CASE WHEN I.DATE_ >= DATEADD(MONTH, -1, GETDATE()) THEN I.CLIENTREF END) AS new_customers,
-                ISNULL(SUM(K.AMOUNT), 0) AS total_collections,
-                COUNT(DISTINCT K.LOGICALREF) AS collection_count,
-                COUNT(DISTINCT ST.LOGICALREF) AS stock_movement_count,
-                ISNULL(SUM(ST.AMOUNT * ST.PRICE), 0) AS stock_movement_value
-            FROM LG_{f}_{p}_INVOICE I WITH (NOLOCK)
-            LEFT JOIN LG_{f}_{p}_KSLINES K WITH (NOLOCK) 
-                ON YEAR(K.DATE_) = YEAR(GETDATE()) AND MONTH(K.DATE_) = MONTH(GETDATE())
-            LEFT JOIN LG_{f}_{p}_STLINE ST WITH (NOLOCK)
-                ON YEAR(ST.DATE_) = YEAR(GETDATE()) AND MONTH(ST.DATE_) = MONTH(GETDATE())
-            WHERE YEAR(I.DATE_) = YEAR(GETDATE()) AND MONTH(I.DATE_) = MONTH(GETDATE())
-        ),
-        LastYearSameMonth AS (
-            SELECT 
-                COUNT(DISTINCT I.LOGICALREF) AS invoice_count,
-                ISNULL(SUM(I.NETTOTAL), 0) AS total_revenue,
-                ISNULL(AVG(I.NETTOTAL), 0) AS avg_order_value,
-                COUNT(DISTINCT I.CLIENTREF) AS active_customers,
-                COUNT(DISTINCT CASE WHEN I.DATE_ >= DATEADD(MONTH, -1, DATEADD(YEAR, -1, GETDATE())) THEN I.CLIENTREF END) AS new_customers,
-                ISNULL(SUM(K.AMOUNT), 0) AS total_collections,
-                COUNT(DISTINCT K.LOGICALREF) AS collection_count,
-                COUNT(DISTINCT ST.LOGICALREF) AS stock_movement_count,
-                ISNULL(SUM(ST.AMOUNT * ST.PRICE), 0) AS stock_movement_value
-            FROM LG_{f}_{p}_INVOICE I WITH (NOLOCK)
-            LEFT JOIN LG_{f}_{p}_KSLINES K WITH (NOLOCK) 
-                ON YEAR(K.DATE_) = YEAR(DATEADD(YEAR, -1, GETDATE())) 
-                AND MONTH(K.DATE_) = MONTH(GETDATE())
-            LEFT JOIN LG_{f}_{p}_STLINE ST WITH (NOLOCK)
-                ON YEAR(ST.DATE_) = YEAR(DATEADD(YEAR, -1, GETDATE())) 
-                AND MONTH(ST.DATE_) = MONTH(GETDATE())
-            WHERE YEAR(I.DATE_) = YEAR(DATEADD(YEAR, -1, GETDATE())) 
-              AND MONTH(I.DATE_) = MONTH(GETDATE())
-        )
-        SELECT 
-            'MONTHLY' AS period_type,
-            DATEFROMPARTS(YEAR(GETDATE()), MONTH(GETDATE()), 1) AS current_month_start,
-            EOMONTH(GETDATE()) AS current_month_end,
-            DATEFROMPARTS(YEAR(DATEADD(YEAR, -1, GETDATE())), MONTH(GETDATE()), 1) AS ly_month_start,
-            EOMONTH(DATEADD(YEAR, -1, GETDATE())) AS ly_month_end,
-            
-            -- Current Period
-            C.invoice_count AS current_invoice_count,
-            C.total_revenue AS current_revenue,
-            C.avg_order_value AS current_avg_order,
-            C.active_customers AS current_customers,
-            C.new_customers AS current_new_customers,
-            C.total_collections AS current_collections,
-            C.collection_count AS current_collection_count,
-            C.stock_movement_count AS current_stock_movements,
-            C.stock_movement_value AS current_stock_value,
-            
-            -- Last Year Same Period
-            L.invoice_count AS ly_invoice_count,
-            L.total_revenue AS ly_revenue,
-            L.avg_order_value AS ly_avg_order,
-            L.active_customers AS ly_customers,
-            L.new_customers AS ly_new_customers,
-            L.total_collections AS ly_collections,
-            L.collection_count AS ly_collection_count,
-            L.stock_movement_count AS ly_stock_movements,
-            L.stock_movement_value AS ly_stock_value,
-            
-            -- Differences
-            C.invoice_count - L.invoice_count AS diff_invoice_count,
-            C.total_revenue - L.total_revenue AS diff_revenue,
-            C.total_collections - L.total_collections AS diff_collections,
-            C.stock_movement_value - L.stock_movement_value AS diff_stock_value,
-            
-            -- Percentage Changes
-            CASE WHEN L.invoice_count = 0 THEN NULL 
-                 ELSE ((C.invoice_count - L.invoice_count) * 100.0 / L.invoice_count) END AS pct_change_invoices,
-            CASE WHEN L.total_revenue = 0 THEN NULL 
-                 ELSE ((C.total_revenue - L.total_revenue) * 100.0 / L.total_revenue) END AS pct_change_revenue,
-            CASE WHEN L.total_collections = 0 THEN NULL 
-                 ELSE ((C.total_collections - L.total_collections) * 100.0 / L.total_collections) END AS pct_change_collections,
-            CASE WHEN L.stock_movement_value = 0 THEN NULL 
-                 ELSE ((C.stock_movement_value - L.stock_movement_value) * 100.0 / L.stock_movement_value) END AS pct_change_stock_value
-        FROM CurrentMonth C
-        CROSS JOIN LastYearSameMonth L
+        Compares this month to date vs same dates last year
         """
-        
-        try:
-            results = db_manager.execute_ms_query(query)
-            return results[0] if results else {}
-        except Exception as e:
-            logger.error(f"YoY Monthly Comparison failed: {e}")
-            return {}
+        today = date.today()
+        result = await self.get_yoy_range_comparison(today.replace(day=1), today, firma)
+        return self._yoy_legacy("MONTHLY", result, {
+            "current_month_start": "current_start", "current_month_end": "current_end",
+            "ly_month_start": "ly_start", "ly_month_end": "ly_end",
+        })
 
     async def get_available_firms(self):
         """
@@ -1398,12 +1282,12 @@ class LogoIntegrationService:
         try:
             # 1. Fetch Firms
             firms_query = "SELECT NR AS FIRM_NO, NAME, TITLE FROM L_CAPIFIRM ORDER BY NR"
-            firms = db_manager.execute_ms_query(firms_query)
+            firms = await db_manager.execute_ms_query_async(firms_query)
             if not firms: return []
 
             # 2. Fetch Periods
             periods_query = "SELECT FIRMNR, NR, BEGDATE, ENDDATE, ACTIVE FROM L_CAPIPERIOD ORDER BY FIRMNR, NR DESC"
-            periods = db_manager.execute_ms_query(periods_query)
+            periods = await db_manager.execute_ms_query_async(periods_query)
             
             # 3. Nest Periods under Firms
             periods_map = {}
@@ -0,0 +1,330 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from psycopg2.extras import execute_values
+from loguru import logger
+from ..core.database import db_manager
+from ..core.config import settings
+
+# Logo master data mirrored into PostgreSQL by the /logo/data sync endpoints.
+#   select/from/where  Logo source ({f}/{p} firma/period, {table} the variant table); read in LOGICALREF keyset pages
+#   active             Logo condition for is_active (rows failing it are kept, flagged inactive)
+#   scope              PostgreSQL columns supplied by the caller (company_id, period_id, ...) -> cast
+#   columns            Logo column -> PostgreSQL cast, in insert order
+#   conflict           unique key of the target table
+#   update             columns refreshed on conflict; rows where none of them changed are left untouched
+#   stamped            Logo table carries CAPIBLOCK_* dates, so incremental runs can read only changed rows
+MASTER_DATA = {
+    "salesmen": {
+        "table": "salesmen",
+        "select": "LOGICALREF AS logo_ref, CODE AS code, DEFINITION_ AS name, EMAIL AS email, TELEPHONE1 AS phone",
+        "from": "LG_{f}_SALESMAN",
+        "active": "ACTIVE = 0",
+        "scope": {"company_id": "int"},
+        "columns": {"logo_ref": "int", "code": "text", "name": "text", "email": "text", "phone": "text"},
+        "defaults": {"email": "", "phone": ""},
+        "conflict": ["company_id", "logo_ref"],
+        "update": ["name", "email", "phone"],
+        "stamped": True,
+    },
+    "brands": {
+        "table": "brands",
+        "select": "LOGICALREF AS logo_ref, CODE AS code, DESCR AS name",
+        "from": "LG_{f}_MARK",
+        "active": "ACTIVE = 0",
+        "scope": {"company_id": "int"},
+        "columns": {"logo_ref": "int", "code": "text", "name": "text"},
+        "conflict": ["company_id", "logo_ref"],
+        "update": ["name"],
+        "stamped": True,
+    },
+    "special_codes": {
+        "table": "special_codes",
+        "variants": {"customer": "CLSPECODE", "item": "ITSPECODE", "invoice": "INVOICESPECODE"},
+        "select": "LOGICALREF AS logo_ref, CODETYPE AS code_number, SPECODE AS code, DEFINITION_ AS name",
+        "from": "LG_{f}_{table}",
+        "where": "CODETYPE BETWEEN 1 AND 5",
+        "scope": {"company_id": "int", "specode_type": "text"},
+        "columns": {"logo_ref": "int", "code_number": "int", "code": "text", "name": "text"},
+        "conflict": ["company_id", "specode_type", "code_number", "logo_ref"],
+        "update": ["name"],
+        "stamped": True,
+    },
+    "campaigns": {
+        "table": "campaigns",
+        "select": "LOGICALREF AS logo_ref, CODE AS code, NAME AS name, BEGDATE AS start_date, ENDDATE AS end_date, DISCRATE AS discount_rate",
+        "from": "LG_{f}_{p}_CAMPAIGN",
+        "active": "ACTIVE = 0",
+        "optional": True,  # not every Logo installation has a campaign table
+        "scope": {"company_id": "int", "period_id": "int"},
+        "columns": {"logo_ref": "int", "code": "text", "name": "text", "start_date": "date",
+                    "end_date": "date", "discount_rate": "numeric"},
+        "defaults": {"discount_rate": 0},
+        "conflict": ["company_id", "period_id", "logo_ref"],
+        "update": ["name", "start_date", "end_date", "discount_rate"],
+        "stamped": True,
+    },
+}
+
+SYNC_MODES = ("auto", "incremental", "full")
+
+
+def _merge_sql(spec: dict):
+    """Single-statement batch upsert; returns (sql, row template) for execute_values"""
+    casts = {**spec["scope"], **spec["columns"], "is_active": "boolean"}
+    columns = list(casts)
+    update = spec["update"] + ["is_active"]
+    template = "(" + ", ".join(f"%s::{casts[c]}" for c in columns) + ")"
+    names = ", ".join(columns)
+    sql = f"""
+        WITH incoming ({names}) AS (VALUES %s),
+        merged AS (
+            INSERT INTO {spec['table']} AS t ({names})
+            SELECT {names} FROM incoming
+            ON CONFLICT ({', '.join(spec['conflict'])}) DO UPDATE SET
+                {', '.join(f'{c} = EXCLUDED.{c}' for c in update)},
+                last_sync = CURRENT_TIMESTAMP
+            WHERE ({', '.join(f't.{c}' for c in update)}) IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in update)})
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted) AS inserted, COUNT(*) FILTER (WHERE NOT inserted) AS updated FROM merged
+    """
+    return sql, template
+
+
+def _conditions(spec: dict, incremental: bool) -> list:
+    conditions = [spec["where"]] if spec.get("where") else []
+    if incremental:
+        # >= so rows stamped in the same second as the watermark are not missed
+        conditions.append("(CAPIBLOCK_MODIFIEDDATE >= %s OR CAPIBLOCK_CREATEDDATE >= %s)")
+    return conditions
+
+
+def _source_sql(spec: dict, f: str, p: str, table: str, batch: int, incremental: bool) -> str:
+    """Keyset page query; params: last LOGICALREF (+ watermark twice when incremental)"""
+    active = f"CAST(CASE WHEN {spec['active']} THEN 1 ELSE 0 END AS BIT)" if spec.get("active") else "CAST(1 AS BIT)"
+    return f"""
+        SELECT TOP ({int(batch)}) {spec['select']}, {active} AS is_active
+        FROM {spec['from'].format(f=f, p=p, table=table)} WITH (NOLOCK)
+        WHERE {' AND '.join(["LOGICALREF > %s"] + _conditions(spec, incremental))}
+        ORDER BY LOGICALREF
+    """
+
+
+def _count_sql(spec: dict, f: str, p: str, table: str, incremental: bool) -> str:
+    """Rows a pass will read (progress / ETA); same params as _source_sql"""
+    return f"""
+        SELECT COUNT(*) AS n FROM {spec['from'].format(f=f, p=p, table=table)} WITH (NOLOCK)
+        WHERE {' AND '.join(["LOGICALREF > %s"] + _conditions(spec, incremental))}
+    """
+
+
+class MasterDataSyncService:
+    """
+    Set-based Logo -> PostgreSQL master-data sync.
+    Logo rows are read in LOGICALREF keyset pages; each page is merged with one
+    INSERT ... ON CONFLICT (execute_values) in its own transaction while the next page
+    is being read, and the merge reports how many rows were inserted, updated or unchanged.
+
+    Incremental runs read only rows created/modified since the (entity, scope) watermark.
+    A full run (first sync, on request, or when the last one is older than full_every)
+    reads everything and flags rows deleted in Logo as inactive.
+    """
+
+    def __init__(self, batch_size: int = 5000, full_every_hours: int = 24):
+        self.batch_size = batch_size
+        self.full_every = timedelta(hours=full_every_hours)
+        self._sql = {name: _merge_sql(spec) for name, spec in MASTER_DATA.items()}
+        self._schema_ready = False
+
+    async def ensure_schema(self):
+        if self._schema_ready:
+            return True
+        path = os.path.join(os.path.dirname(__file__), "..", "..", "sql", "master_sync.sql")
+        with open(path, "r", encoding="utf-8") as f:
+            ddl = f.read()
+        self._schema_ready = bool(await db_manager.execute_pg_query_async(ddl, fetch=False))
+        return self._schema_ready
+
+    # --- Logo side ---
+
+    async def _fetch(self, spec: dict, sql: str, params: tuple):
+        """Rows of one page; None when an optional table is missing"""
+        rows = await db_manager.execute_ms_query_async(sql, params)
+        if rows is None:
+            if spec.get("optional"):
+                return None
+            raise RuntimeError(f"Logo read failed for {spec['table']}")
+        return rows
+
+    async def _max_stamp(self, spec: dict, f: str, p: str, table: str):
+        rows = await db_manager.execute_ms_query_async(
+            f"SELECT MAX(CAPIBLOCK_MODIFIEDDATE) AS MODIFIED, MAX(CAPIBLOCK_CREATEDDATE) AS CREATED "
+            f"FROM {spec['from'].format(f=f, p=p, table=table)} (NOLOCK)"
+        )
+        stamps = [s for r in rows or [] for s in (r["MODIFIED"], r["CREATED"]) if isinstance(s, datetime)]
+        return max(stamps) if stamps else None
+
+    # --- PostgreSQL side ---
+
+    def _merge(self, entity: str, rows: list):
+        sql, template = self._sql[entity]
+        with db_manager.connection(settings.DEFAULT_DB) as conn:
+            if conn is None:
+                raise RuntimeError("PostgreSQL unavailable")
+            try:
+                with conn.cursor() as cur:
+                    result = execute_values(cur, sql, rows, template=template, page_size=len(rows), fetch=True)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        inserted, updated = result[0] if result else (0, 0)
+        return inserted or 0, updated or 0
+
+    async def _deactivate_missing(self, spec: dict, scope: dict, seen: list) -> int:
+        """Full reconciliation: rows of this scope that Logo no longer has"""
+        conditions = " AND ".join(f"{c} = %s" for c in spec["scope"])
+        rows = await db_manager.execute_pg_query_async(f"""
+            WITH gone AS (
+                UPDATE {spec['table']} SET is_active = false, last_sync = CURRENT_TIMESTAMP
+                WHERE {conditions} AND is_active AND NOT (logo_ref = ANY(%s))
+                RETURNING 1
+            )
+            SELECT COUNT(*) AS n FROM gone
+        """, (*(scope[c] for c in spec["scope"]), seen))
+        if rows is None:
+            raise RuntimeError(f"Reconciliation failed for {spec['table']}")
+        return rows[0]["n"]
+
+    @staticmethod
+    def scope_key(spec: dict, scope: dict) -> str:
+        return ",".join(f"{c}={scope[c]}" for c in spec["scope"])
+
+    async def _state(self, entity: str, key: str):
+        rows = await db_manager.execute_pg_query_async(
+            "SELECT watermark, last_full_at FROM master_sync_state WHERE entity = %s AND scope_key = %s", (entity, key)
+        )
+        return rows[0] if rows else None
+
+    async def _save_state(self, entity: str, key: str, firma: str, watermark, mode: str, fetched: int):
+        await db_manager.execute_pg_query_async("""
+            INSERT INTO master_sync_state (entity, scope_key, firma, watermark, last_mode, last_fetched, last_full_at, synced_at)
+            VALUES (%s, %s, %s, %s, %s, %s, CASE WHEN %s THEN CURRENT_TIMESTAMP END, CURRENT_TIMESTAMP)
+            ON CONFLICT (entity, scope_key) DO UPDATE
+            SET firma = EXCLUDED.firma,
+                watermark = EXCLUDED.watermark,
+                last_mode = EXCLUDED.last_mode,
+                last_fetched = EXCLUDED.last_fetched,
+                last_full_at = COALESCE(EXCLUDED.last_full_at, master_sync_state.last_full_at),
+                synced_at = CURRENT_TIMESTAMP
+        """, (entity, key, firma, watermark, mode, fetched, mode == "full"), fetch=False)
+
+    async def states(self, firma: str = None) -> list:
+        await self.ensure_schema()
+        if firma:
+            rows = await db_manager.execute_pg_query_async(
+                "SELECT * FROM master_sync_state WHERE firma = %s ORDER BY entity, scope_key", (firma,)
+            )
+        else:
+            rows = await db_manager.execute_pg_query_async("SELECT * FROM master_sync_state ORDER BY firma, entity, scope_key")
+        return rows or []
+
+    # --- sync ---
+
+    def _is_full(self, spec: dict, state, mode: str) -> bool:
+        if mode == "full" or not spec.get("stamped") or not state or state["watermark"] is None:
+            return True
+        if mode == "incremental":
+            return False
+        last_full = state["last_full_at"]
+        return last_full is None or datetime.now(timezone.utc) - last_full > self.full_every
+
+    async def sync(self, entity: str, scope: dict, firma: str, period: str = None, variant: str = None,
+                   mode: str = "auto", batch_size: int = None, start_after: int = 0, progress=None) -> dict:
+        """
+        Mirror one Logo master-data table. scope holds the PostgreSQL-side values named in
+        the spec (company_id, period_id, specode_type); variant picks the Logo table for
+        specs with variants (special codes). mode: auto | incremental | full.
+        start_after resumes a pass after that LOGICALREF (no delete reconciliation then);
+        progress is awaited after every merged page with the running totals plus last_ref/expected.
+        """
+        spec = MASTER_DATA[entity]
+        if mode not in SYNC_MODES:
+            raise ValueError(f"Unknown sync mode: {mode}")
+        variants = spec.get("variants")
+        table = variants.get(variant) if variants else ""
+        if variants and not table:
+            raise ValueError(f"Unknown {entity} variant: {variant}")
+        batch = batch_size or self.batch_size
+        scope_values = tuple(scope[c] for c in spec["scope"])
+        defaults = spec.get("defaults", {})
+        loop = asyncio.get_running_loop()
+
+        start = time.monotonic()
+        await self.ensure_schema()
+        key = self.scope_key(spec, scope)
+        state = await self._state(entity, key)
+        full = self._is_full(spec, state, mode)
+        # Take the watermark first: rows changed while we read are picked up next time
+        watermark = await self._max_stamp(spec, firma, period, table) if spec.get("stamped") else None
+        source = _source_sql(spec, firma, period, table, batch, incremental=not full)
+        since = () if full else (state["watermark"], state["watermark"])
+
+        totals = {"mode": "full" if full else "incremental", "fetched": 0, "inserted": 0, "updated": 0,
+                  "unchanged": 0, "deactivated": 0, "batches": 0}
+        if start_after:
+            totals["resumed_after"] = start_after
+        expected = None
+        if progress:
+            counted = await db_manager.execute_ms_query_async(
+                _count_sql(spec, firma, period, table, incremental=not full), (start_after, *since)
+            )
+            expected = counted[0]["n"] if counted else None
+        seen = []
+        rows = await self._fetch(spec, source, (start_after, *since))
+        missing = rows is None
+        while rows:
+            # Read the next page from Logo while this one is merged into PostgreSQL
+            next_page = asyncio.create_task(self._fetch(spec, source, (rows[-1]["logo_ref"], *since))) if len(rows) >= batch else None
+            values = [
+                scope_values
+                + tuple(r.get(c) if r.get(c) is not None else defaults.get(c) for c in spec["columns"])
+                + (bool(r["is_active"]),)
+                for r in rows
+            ]
+            try:
+                inserted, updated = await loop.run_in_executor(None, self._merge, entity, values)
+            except Exception:
+                if next_page:
+                    next_page.cancel()
+                raise
+            if full:
+                seen.extend(r["logo_ref"] for r in rows)
+            totals["fetched"] += len(rows)
+            totals["inserted"] += inserted
+            totals["updated"] += updated
+            totals["unchanged"] += len(rows) - inserted - updated
+            totals["batches"] += 1
+            if progress:
+                await progress({**totals, "expected": expected, "last_ref": rows[-1]["logo_ref"]})
+            rows = await next_page if next_page else []
+            if rows is None:
+                raise RuntimeError(f"Logo read failed for {spec['table']}")
+
+        if full and not missing and not start_after:
+            totals["deactivated"] = await self._deactivate_missing(spec, scope, seen)
+        if start_after or (watermark is None and state):
+            # A resumed pass skipped rows below start_after: keep the old watermark so they are re-read
+            watermark = state["watermark"] if state else None
+        await self._save_state(entity, key, firma, watermark, "resumed" if start_after else totals["mode"], totals["fetched"])
+        totals["watermark"] = watermark
+        totals["duration_ms"] = round((time.monotonic() - start) * 1000, 1)
+        logger.info(f"Master data sync {entity} ({firma}{'/' + variant if variant else ''}): {totals}")
+        return totals
+
+
+master_data_sync = MasterDataSyncService(
+    batch_size=settings.MASTER_SYNC_BATCH_SIZE, full_every_hours=settings.MASTER_SYNC_FULL_EVERY_HOURS
+)
@@ -1,7 +1,38 @@
 from loguru import logger
 from ..core.database import db_manager
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import OrderedDict
 import re
+import threading
+
+# Tag written by DatabaseManager._tag_ms: /* exfin:<METHOD path> */ or /* exfin:background */
+_API_TAG = re.compile(r"^/\* exfin:(?P<endpoint>[^;*]*)(?:;[^*]*)? \*/\s*")
+_WHITESPACE = re.compile(r"\s+")
+
+# Cumulative counters per cached plan of our own (tagged) statements.
+# %% because pymssql formats the text when params are given.
+API_QUERY_STATS_SQL = """
+    SELECT
+        CAST(LEFT(st.text, 600) AS NVARCHAR(600)) AS SQL_HEAD,
+        CONVERT(VARCHAR(130), qs.sql_handle, 1) AS SQL_HANDLE,
+        qs.statement_start_offset AS STMT_OFFSET,
+        CONVERT(VARCHAR(130), qs.plan_handle, 1) AS PLAN_HANDLE,
+        qs.creation_time AS CREATED,
+        qs.last_execution_time AS LAST_EXEC,
+        qs.execution_count AS EXECS,
+        qs.total_worker_time AS CPU_US,
+        qs.total_logical_reads AS READS,
+        qs.total_elapsed_time AS ELAPSED_US,
+        qs.max_elapsed_time AS MAX_ELAPSED_US
+    FROM sys.dm_exec_query_stats qs
+    CROSS APPLY sys.dm_exec_sql_text(qs.sql_handle) st
+    WHERE st.text LIKE '/* exfin:%%'
+      AND st.text NOT LIKE '%%dm_exec_query_stats%%'
+      AND qs.last_execution_time >= %s
+"""
+
+# sort key -> accumulated counter
+API_QUERY_SORTS = {"cpu": "cpu_ms", "reads": "logical_reads", "duration": "duration_ms", "executions": "executions"}
 
 class ProfilerService:
     def __init__(self):
@@ -50,13 +81,14 @@ class ProfilerService:
             WHERE qs.last_execution_time >= '{self._start_time.strftime('%Y-%m-%d %H:%M:%S')}'
             AND st.text LIKE '%LG_{firma_no}%'
             AND st.text NOT LIKE '%sys.dm_%' -- Exclude self
+            AND st.text NOT LIKE '/* exfin:%' -- Exclude the API's own (tagged) statements
             AND st.text NOT LIKE '%INSERT INTO%' -- Focus on SELECTs usually for reports
             AND st.text NOT LIKE '%UPDATE%'
             ORDER BY qs.last_execution_time DESC
         """
         
         try:
-            results = db_manager.execute_ms_query(query)
+            results = await db_manager.execute_ms_query_async(query)
             if not results:
                 return True, {"message": "No relevant queries captured.", "sql": [], "view_suggestion": ""}
 
@@ -91,4 +123,112 @@ class ProfilerService:
             logger.error(f"Profiler Error: {e}")
             return False, f"Profiler Error: {e}"
 
+
+class ApiQueryStats:
+    """
+    Logo server cost of the API's own SQL, per endpoint.
+    Every MSSQL statement sent through db_manager carries an /* exfin:... */ tag; collect()
+    reads sys.dm_exec_query_stats for tagged plans and adds the counter deltas since the
+    previous pass, so plans that stay cached are not counted twice.
+    """
+
+    MAX_TRACKED_PLANS = 50000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started_at = datetime.now()
+        self._last_collect = None
+        self._plans = OrderedDict()     # (sql_handle, offset, plan_handle, created) -> last counters
+        self._stats = {}                # (endpoint, statement head) -> accumulated counters
+        self.collections = 0
+        self.last_error = None
+
+    @staticmethod
+    def _new_stats() -> dict:
+        return {"executions": 0, "cpu_ms": 0.0, "logical_reads": 0, "duration_ms": 0.0,
+                "max_duration_ms": 0.0, "last_execution": None}
+
+    def collect(self) -> int:
+        """One collector pass (blocking); returns the number of plans with new executions"""
+        since = (self._last_collect or self._started_at) - timedelta(seconds=5)
+        started = datetime.now()
+        rows = db_manager.execute_ms_query(API_QUERY_STATS_SQL, (since,))
+        if rows is None:
+            self.last_error = "dm_exec_query_stats not readable (VIEW SERVER STATE permission?)"
+            return 0
+        changed = 0
+        with self._lock:
+            for row in rows:
+                match = _API_TAG.match(row["SQL_HEAD"] or "")
+                if not match:
+                    continue
+                key = (row["SQL_HANDLE"], row["STMT_OFFSET"], row["PLAN_HANDLE"], row["CREATED"])
+                current = (row["EXECS"], row["CPU_US"], row["READS"], row["ELAPSED_US"])
+                previous = self._plans.pop(key, None)
+                self._plans[key] = current
+                if previous is None and row["CREATED"] < self._started_at:
+                    continue  # cached before we started: baseline only
+                delta = [c - (previous[i] if previous else 0) for i, c in enumerate(current)]
+                if delta[0] <= 0:
+                    continue
+                changed += 1
+                endpoint = match.group("endpoint")
+                head = _WHITESPACE.sub(" ", row["SQL_HEAD"][match.end():]).strip()[:200]
+                stats = self._stats.setdefault((endpoint, head), self._new_stats())
+                stats["executions"] += delta[0]
+                stats["cpu_ms"] += delta[1] / 1000
+                stats["logical_reads"] += delta[2]
+                stats["duration_ms"] += delta[3] / 1000
+                stats["max_duration_ms"] = max(stats["max_duration_ms"], row["MAX_ELAPSED_US"] / 1000)
+                stats["last_execution"] = max(filter(None, (stats["last_execution"], row["LAST_EXEC"])))
+            while len(self._plans) > self.MAX_TRACKED_PLANS:
+                self._plans.popitem(last=False)
+            self._last_collect = started
+            self.collections += 1
+            self.last_error = None
+        return changed
+
+    def report(self, sort: str = "cpu", limit: int = 50, top_statements: int = 5) -> dict:
+        """Per-endpoint totals, most expensive first, each with its costliest statements"""
+        key = API_QUERY_SORTS.get(sort, "cpu_ms")
+        endpoints = {}
+        with self._lock:
+            for (endpoint, head), stats in self._stats.items():
+                total = endpoints.setdefault(endpoint, {**self._new_stats(), "endpoint": endpoint, "statements": []})
+                for counter in ("executions", "cpu_ms", "logical_reads", "duration_ms"):
+                    total[counter] += stats[counter]
+                total["max_duration_ms"] = max(total["max_duration_ms"], stats["max_duration_ms"])
+                total["last_execution"] = max(filter(None, (total["last_execution"], stats["last_execution"])), default=None)
+                total["statements"].append({"sql": head, **stats})
+        out = sorted(endpoints.values(), key=lambda e: e[key], reverse=True)[:limit]
+        for e in out:
+            n = e["executions"] or 1
+            e["avg_cpu_ms"] = round(e["cpu_ms"] / n, 2)
+            e["avg_logical_reads"] = round(e["logical_reads"] / n, 1)
+            e["avg_duration_ms"] = round(e["duration_ms"] / n, 2)
+            e["cpu_ms"], e["duration_ms"] = round(e["cpu_ms"], 1), round(e["duration_ms"], 1)
+            e["statements"] = sorted(e["statements"], key=lambda s: s[key], reverse=True)[:top_statements]
+        return {
+            "since": self._started_at,
+            "last_collect": self._last_collect,
+            "collections": self.collections,
+            "error": self.last_error,
+            "sort": sort,
+            "endpoints": out,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
 profiler_service = ProfilerService()
+api_query_stats = ApiQueryStats()
+
+
+def run_api_query_stats_collect():
+    """Module-level function for consistent pickling/serialization in APScheduler"""
+    try:
+        api_query_stats.collect()
+    except Exception as e:
+        logger.error(f"API query stats collection failed: {e}")
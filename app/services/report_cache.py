@@ -0,0 +1,164 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from loguru import logger
+from ..core.config import settings
+from .single_flight import report_flight
+
+
+def _normalize(value):
+    """Canonical, hashable form of a report parameter"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+class ReportCache:
+    """
+    In-memory TTL + LRU cache for Logo report results.
+    Keys are (method, firma, period, normalized params); bounded by entry and row count.
+    """
+
+    def __init__(self, max_entries: int = 500, max_rows: int = 500_000, default_ttl: int = 60):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, rows)
+        self._rows = 0
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        self._per_method = {}  # method -> {"hits": n, "misses": n}
+
+    @staticmethod
+    def make_key(method: str, firma, period, params: dict):
+        norm = tuple(sorted((k, _normalize(v)) for k, v in (params or {}).items()))
+        return (method, str(firma) if firma is not None else None, str(period) if period is not None else None, norm)
+
+    def _count(self, method: str, field: str):
+        self._stats[field] += 1
+        m = self._per_method.setdefault(method, {"hits": 0, "misses": 0})
+        m[field] += 1
+
+    def _drop(self, key):
+        _, _, rows = self._entries.pop(key)
+        self._rows -= rows
+
+    def get(self, key):
+        """Returns (hit, value)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(key[0], "misses")
+                return False, None
+            if entry[0] <= now:
+                self._drop(key)
+                self._stats["expirations"] += 1
+                self._count(key[0], "misses")
+                return False, None
+            self._entries.move_to_end(key)
+            self._count(key[0], "hits")
+            return True, entry[1]
+
+    def set(self, key, value, ttl: int = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        rows = len(value) if isinstance(value, list) else 1
+        if rows > self.max_rows:
+            return  # too big to be worth caching
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, value, rows)
+            self._rows += rows
+            self._stats["sets"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._rows > self.max_rows):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, method: str = None, firma: str = None, period: str = None) -> int:
+        """Drop matching entries (all when no filter is given). Returns the number removed."""
+        with self._lock:
+            keys = [
+                k for k in self._entries
+                if (method is None or k[0] == method)
+                and (firma is None or k[1] == str(firma))
+                and (period is None or k[2] == str(period))
+            ]
+            for k in keys:
+                self._drop(k)
+            self._stats["invalidations"] += len(keys)
+        if keys:
+            logger.info(f"Report cache invalidated: {len(keys)} entries (method={method}, firma={firma}, period={period})")
+        return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            total = s["hits"] + s["misses"]
+            s.update({
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "max_entries": self.max_entries,
+                "max_rows": self.max_rows,
+                "hit_ratio": round(s["hits"] / total, 4) if total else 0.0,
+                "methods": {k: dict(v) for k, v in self._per_method.items()},
+            })
+        return s
+
+
+report_cache = ReportCache(
+    max_entries=settings.REPORT_CACHE_MAX_ENTRIES,
+    max_rows=settings.REPORT_CACHE_MAX_ROWS,
+    default_ttl=settings.REPORT_CACHE_DEFAULT_TTL
+)
+
+
+def cached_report(ttl=None):
+    """
+    Caches an async LogoIntegrationService report method.
+    firma/period default to the service's configured values; stream=True calls bypass the cache.
+    ttl may be a callable taking the bound call arguments (e.g. a per-report catalog TTL).
+    Concurrent misses for the same key are coalesced into a single Logo query.
+    """
+    def decorator(func):
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            bound = sig.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            call = dict(bound.arguments)
+            call.pop("self", None)
+            if call.pop("stream", False):
+                return await func(self, *args, **kwargs)
+            firma = call.pop("firma", None) or self.firma_no
+            period = call.pop("period", None) or self.period_no
+
+            key = report_cache.make_key(func.__name__, firma, period, call)
+            hit, value = report_cache.get(key)
+            if hit:
+                return value
+
+            async def load():
+                value = await func(self, *args, **kwargs)
+                if value is not None:
+                    report_cache.set(key, value, ttl(call) if callable(ttl) else ttl)
+                return value
+
+            return await report_flight.do(key, load)
+
+        return wrapper
+    return decorator
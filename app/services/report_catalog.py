@@ -0,0 +1,289 @@
+import re
+import threading
+from datetime import date, datetime
+
+# Declarative catalog of the generic Logo reports (get_report_data, /reports/generic, snapshots).
+#
+#   sql          template; {f}/{p} = firma/period, %(name)s = a declared parameter
+#   params       name -> {"type": date|int|str, "default", "required", "min", "max", "choices"}
+#   cost         light | medium | heavy (heavy: full history scans, refreshed off-hours)
+#   ttl          report cache seconds
+#   stream       row-level lists suited to streaming (opt-in with ?stream=)
+#   incremental  optional watermark spec for snapshot refreshes (see sync_service._refresh_incremental);
+#                its sql takes the watermark as the single %s parameter and returns a _WM column
+
+DATE_RANGE = {
+    "start_date": {"type": "date", "default": None},
+    "end_date": {"type": "date", "default": None},
+}
+DATE_FILTER = "(%(start_date)s IS NULL OR DATE_ >= %(start_date)s) AND (%(end_date)s IS NULL OR DATE_ <= %(end_date)s)"
+
+REPORTS = {
+    # 1.1 Inventory (Stok)
+    "INV_REPORT_01": {
+        "title": "Stock on hand by item", "cost": "medium", "ttl": 300,
+        "sql": "SELECT ITEM.CODE, ITEM.NAME, SUM(GNT.ONHAND) AS VALUE FROM LG_{f}_ITEMS ITEM (NOLOCK) LEFT JOIN LG_{f}_{p}_GNTOTST GNT (NOLOCK) ON ITEM.LOGICALREF = GNT.STOCKREF GROUP BY ITEM.CODE, ITEM.NAME",
+    },
+    "INV_REPORT_02": {
+        "title": "Stock on hand by warehouse", "cost": "medium", "ttl": 300,
+        "sql": "SELECT L.NAME AS WAREHOUSE, SUM(I.ONHAND) AS STOCK FROM LV_{f}_{p}_GNTOTST I (NOLOCK) JOIN L_CAPIWHOUSE L (NOLOCK) ON I.INVENNO = L.NR WHERE I.ITEMREF > 0 GROUP BY L.NAME",
+    },
+    "INV_REPORT_03": {
+        "title": "Stock on hand by item group", "cost": "medium", "ttl": 300,
+        "sql": "SELECT ITEM.STGRPCODE AS GROUP_CODE, SUM(GNT.ONHAND) AS VALUE FROM LG_{f}_ITEMS ITEM (NOLOCK) LEFT JOIN LG_{f}_{p}_GNTOTST GNT (NOLOCK) ON ITEM.LOGICALREF = GNT.STOCKREF GROUP BY ITEM.STGRPCODE",
+    },
+    "INV_REPORT_04": {
+        "title": "Reserved stock", "cost": "heavy", "ttl": 900,
+        "sql": "SELECT ITEM.CODE, ITEM.NAME, SUM(I.RESERVED) AS RESERVED FROM LV_{f}_{p}_GNTOTST I (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON I.ITEMREF = ITEM.LOGICALREF WHERE I.RESERVED > 0 GROUP BY ITEM.CODE, ITEM.NAME",
+    },
+
+    # 1.2 Sales (Satış)
+    "SAL_REPORT_01": {
+        "title": "Daily sales", "cost": "light", "ttl": 300, "params": DATE_RANGE,
+        "sql": "SELECT DATE_ AS REPORT_DATE, SUM(NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE (NOLOCK) WHERE TRCODE IN (7,8) AND " + DATE_FILTER + " GROUP BY DATE_",
+        "incremental": {
+            "watermark": "date", "keys": ["REPORT_DATE"],
+            "sql": "SELECT DATE_ AS REPORT_DATE, SUM(NETTOTAL) AS TOTAL_AMOUNT, MAX(DATE_) AS _WM FROM LG_{f}_{p}_INVOICE (NOLOCK) WHERE TRCODE IN (7,8) AND DATE_ >= %s GROUP BY DATE_",
+        },
+    },
+    "SAL_REPORT_02": {
+        "title": "Sales by customer", "cost": "medium", "ttl": 300,
+        "sql": "SELECT CLC.DEFINITION_ AS CUSTOMER, SUM(INV.NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.TRCODE IN (7,8) GROUP BY CLC.DEFINITION_",
+        "incremental": {
+            "watermark": "ref", "keys": ["CUSTOMER"], "sums": ["TOTAL_AMOUNT"],
+            "sql": "SELECT CLC.DEFINITION_ AS CUSTOMER, SUM(INV.NETTOTAL) AS TOTAL_AMOUNT, MAX(INV.LOGICALREF) AS _WM FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.TRCODE IN (7,8) AND INV.LOGICALREF > %s GROUP BY CLC.DEFINITION_",
+        },
+    },
+    "SAL_REPORT_03": {
+        "title": "Sales by salesman", "cost": "medium", "ttl": 300,
+        "sql": "SELECT SLS.DEFINITION_ AS SALESMAN, SUM(INV.NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_SLSMAN SLS (NOLOCK) ON INV.SALESMANREF = SLS.LOGICALREF WHERE INV.TRCODE IN (7,8) GROUP BY SLS.DEFINITION_",
+        "incremental": {
+            "watermark": "ref", "keys": ["SALESMAN"], "sums": ["TOTAL_AMOUNT"],
+            "sql": "SELECT SLS.DEFINITION_ AS SALESMAN, SUM(INV.NETTOTAL) AS TOTAL_AMOUNT, MAX(INV.LOGICALREF) AS _WM FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_SLSMAN SLS (NOLOCK) ON INV.SALESMANREF = SLS.LOGICALREF WHERE INV.TRCODE IN (7,8) AND INV.LOGICALREF > %s GROUP BY SLS.DEFINITION_",
+        },
+    },
+
+    # 1.3 Purchase (Satın Alma)
+    "PUR_REPORT_01": {
+        "title": "Daily purchases", "cost": "light", "ttl": 300, "params": DATE_RANGE,
+        "sql": "SELECT DATE_ AS REPORT_DATE, SUM(NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE (NOLOCK) WHERE TRCODE IN (1,2) AND " + DATE_FILTER + " GROUP BY DATE_",
+        "incremental": {
+            "watermark": "date", "keys": ["REPORT_DATE"],
+            "sql": "SELECT DATE_ AS REPORT_DATE, SUM(NETTOTAL) AS TOTAL_AMOUNT, MAX(DATE_) AS _WM FROM LG_{f}_{p}_INVOICE (NOLOCK) WHERE TRCODE IN (1,2) AND DATE_ >= %s GROUP BY DATE_",
+        },
+    },
+    "PUR_REPORT_02": {
+        "title": "Purchases by vendor", "cost": "medium", "ttl": 300,
+        "sql": "SELECT CLC.DEFINITION_ AS VENDOR, SUM(INV.NETTOTAL) AS TOTAL_AMOUNT FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.TRCODE IN (1,2) GROUP BY CLC.DEFINITION_",
+        "incremental": {
+            "watermark": "ref", "keys": ["VENDOR"], "sums": ["TOTAL_AMOUNT"],
+            "sql": "SELECT CLC.DEFINITION_ AS VENDOR, SUM(INV.NETTOTAL) AS TOTAL_AMOUNT, MAX(INV.LOGICALREF) AS _WM FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.TRCODE IN (1,2) AND INV.LOGICALREF > %s GROUP BY CLC.DEFINITION_",
+        },
+    },
+    "PUR_REPORT_03": {
+        "title": "Vendor order statistics", "cost": "medium", "ttl": 600,
+        "sql": "SELECT CLC.DEFINITION_ AS VENDOR, COUNT(*) AS ORDER_COUNT, AVG(NETTOTAL) AS AVG_ORDER_VALUE FROM LG_{f}_{p}_INVOICE (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON CLIENTREF = CLC.LOGICALREF WHERE TRCODE = 1 GROUP BY CLC.DEFINITION_",
+    },
+    "PUR_REPORT_04": {
+        "title": "Open purchase orders", "cost": "medium", "ttl": 300, "stream": True,
+        "sql": "SELECT FICHENO, CLC.DEFINITION_ AS VENDOR, DATE_, DATEDIFF(DAY, DATE_, GETDATE()) AS DAYS_OVERDUE FROM LG_{f}_{p}_ORFICHE (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON CLIENTREF = CLC.LOGICALREF WHERE TRCODE = 2 AND STATUS = 1",
+    },
+
+    # 1.4 Finance (Finans)
+    "FIN_REPORT_01": {
+        "title": "Daily cash movements", "cost": "light", "ttl": 300, "params": DATE_RANGE,
+        "sql": "SELECT DATE_ AS REPORT_DATE, SUM(AMOUNT) AS TOTAL FROM LG_{f}_{p}_KSLINES (NOLOCK) WHERE " + DATE_FILTER + " GROUP BY DATE_",
+        "incremental": {
+            "watermark": "date", "keys": ["REPORT_DATE"],
+            "sql": "SELECT DATE_ AS REPORT_DATE, SUM(AMOUNT) AS TOTAL, MAX(DATE_) AS _WM FROM LG_{f}_{p}_KSLINES (NOLOCK) WHERE DATE_ >= %s GROUP BY DATE_",
+        },
+    },
+    "FIN_REPORT_02": {
+        "title": "Bank balances", "cost": "light", "ttl": 300,
+        "sql": "SELECT BN.DEFINITION_ AS BANK, SUM(BNT.DEBIT - BNT.CREDIT) AS BALANCE FROM LG_{f}_BANKACC BN (NOLOCK) LEFT JOIN LG_{f}_{p}_BNTOT BNT (NOLOCK) ON BN.LOGICALREF = BNT.BANKACCREF GROUP BY BN.DEFINITION_",
+    },
+    "FIN_REPORT_03": {
+        "title": "Receivables aging by customer", "cost": "heavy", "ttl": 1800,
+        "sql": "SELECT CLC.DEFINITION_ AS CUSTOMER, SUM(CASE WHEN DATEDIFF(DAY, DATE_, GETDATE()) > 30 THEN NETTOTAL ELSE 0 END) AS OVER_30_DAYS, SUM(CASE WHEN DATEDIFF(DAY, DATE_, GETDATE()) > 60 THEN NETTOTAL ELSE 0 END) AS OVER_60_DAYS FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.TRCODE IN (7,8) GROUP BY CLC.DEFINITION_",
+    },
+    "FIN_REPORT_04": {
+        "title": "Invoices older than N days", "cost": "heavy", "ttl": 1800, "stream": True,
+        "params": {"days": {"type": "int", "default": 90, "min": 0, "max": 3650}},
+        "sql": "SELECT INV.FICHENO, CLC.DEFINITION_ AS CUSTOMER, INV.DATE_ AS DOC_DATE, INV.NETTOTAL FROM LG_{f}_{p}_INVOICE INV (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON INV.CLIENTREF = CLC.LOGICALREF WHERE INV.NETTOTAL > 0 AND DATEDIFF(DAY, INV.DATE_, GETDATE()) > %(days)s",
+    },
+
+    # 1.5 Ops (Saha)
+    "OPS_REPORT_01": {
+        "title": "Daily order count", "cost": "light", "ttl": 300, "params": DATE_RANGE,
+        "sql": "SELECT DATE_ AS REPORT_DATE, COUNT(*) AS ORDER_COUNT FROM LG_{f}_{p}_ORFICHE (NOLOCK) WHERE TRCODE = 1 AND " + DATE_FILTER + " GROUP BY DATE_",
+        "incremental": {
+            "watermark": "date", "keys": ["REPORT_DATE"],
+            "sql": "SELECT DATE_ AS REPORT_DATE, COUNT(*) AS ORDER_COUNT, MAX(DATE_) AS _WM FROM LG_{f}_{p}_ORFICHE (NOLOCK) WHERE TRCODE = 1 AND DATE_ >= %s GROUP BY DATE_",
+        },
+    },
+    "OPS_REPORT_02": {
+        "title": "Failed device syncs", "cost": "light", "ttl": 60, "stream": True,
+        "sql": "SELECT device_id, sync_time, status, error_message FROM sync_logs (NOLOCK) WHERE status = 'ERROR' ORDER BY sync_time DESC",
+    },
+    "OPS_REPORT_03": {
+        "title": "Salesman GPS trail", "cost": "medium", "ttl": 60, "stream": True,
+        "sql": "SELECT salesman_name, timestamp, latitude, longitude FROM gps_logs (NOLOCK) ORDER BY timestamp DESC",
+    },
+
+    # 1.6 Production (Üretim)
+    "PROD_REPORT_01": {
+        "title": "Bills of material", "cost": "light", "ttl": 900,
+        "sql": "SELECT BOM.CODE AS BOM_CODE, ITEM.NAME AS ITEM_NAME, BOM.DEFINITION_ AS BOM_DESC FROM LG_{f}_BOMASTER BOM (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON BOM.MAINITEMREF = ITEM.LOGICALREF",
+    },
+    "PROD_REPORT_02": {
+        "title": "Production orders", "cost": "medium", "ttl": 300, "stream": True,
+        "sql": "SELECT FICHENO, DATE_, LINE.PDBNAME AS DEPT, ITEM.NAME AS ITEM_NAME, AMOUNT FROM LG_{f}_{p}_PRODORD ORD (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON ORD.ITEMREF = ITEM.LOGICALREF LEFT JOIN LG_{f}_WORKSTAT LINE (NOLOCK) ON ORD.WORKSTATREF = LINE.LOGICALREF",
+    },
+    "PROD_REPORT_03": {
+        "title": "Active orders per workstation", "cost": "light", "ttl": 300,
+        "sql": "SELECT WS.CODE, WS.DEFINITION_, COUNT(ORD.LOGICALREF) AS ACTIVE_ORDERS FROM LG_{f}_WORKSTAT WS (NOLOCK) LEFT JOIN LG_{f}_{p}_PRODORD ORD (NOLOCK) ON WS.LOGICALREF = ORD.WORKSTATREF GROUP BY WS.CODE, WS.DEFINITION_",
+    },
+
+    # 1.7 Advanced Analytics
+    "SAL_REPORT_04": {
+        "title": "Item sales, this year vs last year", "cost": "heavy", "ttl": 1800,
+        "sql": "SELECT ITEM.CODE, ITEM.NAME, SUM(CASE WHEN YEAR(DATE_) = YEAR(GETDATE()) THEN NETTOTAL ELSE 0 END) AS THIS_YEAR, SUM(CASE WHEN YEAR(DATE_) = YEAR(GETDATE())-1 THEN NETTOTAL ELSE 0 END) AS LAST_YEAR FROM LG_{f}_{p}_STLINE STL (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON STL.STOCKREF = ITEM.LOGICALREF GROUP BY ITEM.CODE, ITEM.NAME",
+    },
+    "SAL_REPORT_05": {
+        "title": "Weekly sales", "cost": "heavy", "ttl": 1800,
+        "sql": "SELECT DATEPART(week, DATE_) as WEEK_NO, SUM(NETTOTAL) FROM LG_{f}_{p}_STLINE (NOLOCK) WHERE TRCODE IN (7,8) GROUP BY DATEPART(week, DATE_)",
+    },
+    "SAL_REPORT_10": {
+        "title": "Customer profitability", "cost": "heavy", "ttl": 1800,
+        "sql": "SELECT CLC.DEFINITION_ AS CUSTOMER, SUM(STL.VATMATRAH) AS REVENUE, SUM(STL.OUTCOST) AS COST, (SUM(STL.VATMATRAH) - SUM(STL.OUTCOST)) AS PROFIT FROM LG_{f}_{p}_STLINE STL (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON STL.CLIENTREF = CLC.LOGICALREF GROUP BY CLC.DEFINITION_",
+        "incremental": {
+            "watermark": "ref", "keys": ["CUSTOMER"], "sums": ["REVENUE", "COST", "PROFIT"],
+            "sql": "SELECT CLC.DEFINITION_ AS CUSTOMER, SUM(STL.VATMATRAH) AS REVENUE, SUM(STL.OUTCOST) AS COST, (SUM(STL.VATMATRAH) - SUM(STL.OUTCOST)) AS PROFIT, MAX(STL.LOGICALREF) AS _WM FROM LG_{f}_{p}_STLINE STL (NOLOCK) JOIN LG_{f}_CLCARD CLC (NOLOCK) ON STL.CLIENTREF = CLC.LOGICALREF WHERE STL.LOGICALREF > %s GROUP BY CLC.DEFINITION_",
+        },
+    },
+
+    # 1.9 Quality
+    "QC_REPORT_01": {
+        "title": "Rejected items", "cost": "heavy", "ttl": 1800,
+        "sql": "SELECT ITEM.NAME, COUNT(*) AS REJECT_COUNT FROM LG_{f}_{p}_STLINE STL (NOLOCK) JOIN LG_{f}_ITEMS ITEM (NOLOCK) ON STL.STOCKREF = ITEM.LOGICALREF WHERE TRCODE = 3 GROUP BY ITEM.NAME",
+    },
+}
+
+_FIRMA = re.compile(r"^\d{1,4}$")
+_PERIOD = re.compile(r"^\d{1,3}$")
+_NAMED = re.compile(r"%\((\w+)\)s")
+
+
+class ReportCatalog:
+    """
+    Validates report parameters and hands out SQL compiled once per (code, firma, period):
+    table names substituted, named parameters turned into positional %s with their order.
+    """
+
+    def __init__(self, reports: dict):
+        self.reports = reports
+        self._compiled = {}  # (code, variant, firma, period) -> (sql, param names)
+        self._lock = threading.Lock()
+
+    def __contains__(self, code) -> bool:
+        return code in self.reports
+
+    def codes(self) -> list:
+        return list(self.reports)
+
+    def get(self, code: str) -> dict:
+        entry = self.reports.get(code)
+        if entry is None:
+            raise KeyError(f"Unknown report: {code}")
+        return entry
+
+    def ttl(self, code: str) -> int:
+        return self.reports.get(code, {}).get("ttl", 300)
+
+    def streams(self, code: str) -> bool:
+        return self.reports.get(code, {}).get("stream", False)
+
+    def cost(self, code: str) -> str:
+        return self.reports.get(code, {}).get("cost", "medium")
+
+    def incremental_specs(self) -> dict:
+        return {code: e["incremental"] for code, e in self.reports.items() if "incremental" in e}
+
+    # --- parameters ---
+
+    @staticmethod
+    def _coerce(name: str, spec: dict, value):
+        kind = spec.get("type", "str")
+        try:
+            if kind == "int":
+                value = int(value)
+                if "min" in spec and value < spec["min"] or "max" in spec and value > spec["max"]:
+                    raise ValueError(f"must be between {spec.get('min')} and {spec.get('max')}")
+            elif kind == "date":
+                value = value if isinstance(value, date) and not isinstance(value, datetime) else date.fromisoformat(str(value)[:10])
+            else:
+                value = str(value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid value for '{name}' ({kind}): {e}")
+        if spec.get("choices") and value not in spec["choices"]:
+            raise ValueError(f"Invalid value for '{name}': expected one of {spec['choices']}")
+        return value
+
+    def validate(self, code: str, params: dict = None) -> dict:
+        """Declared params with defaults applied; unknown or missing required params raise ValueError"""
+        schema = self.get(code).get("params", {})
+        params = {k: v for k, v in (params or {}).items() if v is not None and v != ""}
+        unknown = set(params) - set(schema)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {code}: {', '.join(sorted(unknown))}")
+        out = {}
+        for name, spec in schema.items():
+            if name in params:
+                out[name] = self._coerce(name, spec, params[name])
+            elif spec.get("required"):
+                raise ValueError(f"Missing required parameter '{name}' for {code}")
+            else:
+                out[name] = spec.get("default")
+        return out
+
+    # --- SQL ---
+
+    def compile(self, code: str, firma, period, variant: str = "sql"):
+        """(sql, param names) for one tenant; built on first use and reused after that"""
+        f, p = str(firma), str(period)
+        if not _FIRMA.match(f) or not _PERIOD.match(p):
+            raise ValueError(f"Invalid firma/period: {f}/{p}")
+        key = (code, variant, f, p)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            entry = self.get(code)
+            template = entry["sql"] if variant == "sql" else entry[variant]["sql"]
+            names = _NAMED.findall(template)
+            sql = _NAMED.sub("%s", template.replace("{f}", f).replace("{p}", p))
+            compiled = (sql, tuple(names))
+            with self._lock:
+                self._compiled[key] = compiled
+        return compiled
+
+    def query(self, code: str, firma, period, params: dict = None):
+        """Validated, compiled (sql, positional params or None) ready for db_manager"""
+        values = self.validate(code, params)
+        sql, names = self.compile(code, firma, period)
+        return sql, (tuple(values[n] for n in names) or None)
+
+    def describe(self) -> list:
+        return [
+            {
+                "code": code,
+                "title": e.get("title"),
+                "cost": e.get("cost", "medium"),
+                "ttl": e.get("ttl", 300),
+                "stream": e.get("stream", False),
+                "incremental": e.get("incremental", {}).get("watermark"),
+                "params": e.get("params", {}),
+            }
+            for code, e in self.reports.items()
+        ]
+
+
+report_catalog = ReportCatalog(REPORTS)
@@ -0,0 +1,140 @@
+import asyncio
+import inspect
+import time
+from decimal import Decimal
+from loguru import logger
+from ..core.config import settings
+from .logo_service import logo_service
+
+# /logo/erp/reports/<slug> -> (LogoIntegrationService method, accepts a period).
+# Only firm-scoped reports belong here: order-tracking reads the local SALES_ORDERS table,
+# which has no firm column, so fanning it out would repeat the same rows for every firm.
+FANOUT_REPORTS = {
+    "sales": ("get_sales_report", True),
+    "collections": ("get_collection_report", False),
+    "balances": ("get_customer_balances", True),
+    "inventory": ("get_inventory_status", True),
+    "top-selling": ("get_top_selling_products", True),
+    "leaderboard": ("get_salesman_leaderboard", True),
+    "aging": ("get_debt_aging_report", True),
+    "categories": ("get_category_sales_analysis", True),
+    "churn": ("get_churn_risk_report", True),
+    "profitability": ("get_profitability_analysis", True),
+    "targets": ("get_target_achievement_report", True),
+    "cross-history": ("get_customer_product_history", True),
+    "doc-chain": ("get_document_chain_report", True),
+    "pos-daily": ("get_pos_daily_report", True),
+    "lot-expiry": ("get_lot_expiry_report", True),
+    "transfers": ("get_stock_transfer_report", True),
+    "cashflow": ("get_cashflow_report", True),
+    "generic": ("get_report_data", True),
+}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def _tenant_key(firma: str, period) -> str:
+    return f"{firma}_{period}" if period is not None else firma
+
+
+def _sum_numeric(rows, exclude=()) -> dict:
+    totals = {}
+    for row in rows:
+        for key, value in row.items():
+            if key not in exclude and _is_number(value):
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+class ReportFanoutService:
+    """
+    Runs one Logo report for many (firma, period) pairs concurrently and merges the
+    results. Every row gets FIRMA / PERIOD discriminator columns (PERIOD is null for
+    reports without a period, which run once per firm); optional totals are summed
+    across firms (grand total, per tenant and per group_by key).
+    """
+
+    async def _run_one(self, sem: asyncio.Semaphore, method, takes_period: bool, firma: str, period: str, params: dict):
+        async with sem:
+            start = time.monotonic()
+            kwargs = dict(params, firma=firma)
+            if takes_period:
+                kwargs["period"] = period
+            try:
+                rows = await asyncio.wait_for(method(**kwargs), timeout=settings.REPORT_FANOUT_TIMEOUT)
+                error = None if rows is not None else "Query failed"
+            except asyncio.TimeoutError:
+                rows, error = None, f"Timed out after {settings.REPORT_FANOUT_TIMEOUT}s"
+            except Exception as e:
+                rows, error = None, str(e)
+            if error:
+                logger.warning(f"Fan-out {method.__name__} failed for {_tenant_key(firma, period)}: {error}")
+            return {
+                "firma": firma,
+                "period": period,
+                "status": "error" if error else "success",
+                "error": error,
+                "row_count": len(rows) if rows else 0,
+                "duration_ms": round((time.monotonic() - start) * 1000, 1),
+                "rows": rows or [],
+            }
+
+    async def run(self, report: str, tenants: list, params: dict = None, totals: bool = False,
+                  group_by: list = None, concurrency: int = None) -> dict:
+        """tenants: [(firma, period)]; params: the report's own arguments (dates, limit, report_code...)"""
+        if report not in FANOUT_REPORTS:
+            raise ValueError(f"Unknown report: {report}")
+        method_name, takes_period = FANOUT_REPORTS[report]
+        method = getattr(logo_service, method_name)
+        params = {k: v for k, v in (params or {}).items() if k != "stream"}  # rows are merged in memory
+        try:
+            # Reject bad report params once instead of failing every tenant
+            inspect.signature(method).bind(**(params or {}), firma=None, **({"period": None} if takes_period else {}))
+        except TypeError as e:
+            raise ValueError(f"Invalid params for {report}: {e}")
+        # A period-less report gives the same rows for every period of a firm: run it once per firm
+        tenants = list(dict.fromkeys((str(f), str(p) if takes_period else None) for f, p in tenants))
+        if not tenants:
+            raise ValueError("No tenants given")
+        limit = max(1, min(concurrency or settings.REPORT_FANOUT_CONCURRENCY, settings.REPORT_FANOUT_CONCURRENCY))
+        sem = asyncio.Semaphore(limit)
+
+        start = time.monotonic()
+        results = await asyncio.gather(*[
+            self._run_one(sem, method, takes_period, f, p, params or {}) for f, p in tenants
+        ])
+        elapsed = round((time.monotonic() - start) * 1000, 1)
+
+        merged = [
+            {"FIRMA": r["firma"], "PERIOD": r["period"], **row}
+            for r in results for row in r["rows"]
+        ]
+        out = {
+            "report": report,
+            "tenants": [{k: v for k, v in r.items() if k != "rows"} for r in results],
+            "rows": merged,
+            "elapsed_ms": elapsed,
+            "slowest_ms": max(r["duration_ms"] for r in results),
+        }
+        if totals or group_by:
+            discriminators = ("FIRMA", "PERIOD")
+            out["totals"] = {
+                "all": _sum_numeric(merged, discriminators),
+                "by_tenant": {_tenant_key(r["firma"], r["period"]): _sum_numeric(r["rows"]) for r in results},
+            }
+            if group_by:
+                # Consolidated view: rows with the same key are summed across firms
+                groups = {}
+                for row in merged:
+                    key = tuple(row.get(c) for c in group_by)
+                    groups.setdefault(key, []).append(row)
+                out["totals"]["by_group"] = [
+                    {**dict(zip(group_by, key)), **_sum_numeric(rows, (*discriminators, *group_by)), "TENANTS": len({(r["FIRMA"], r["PERIOD"]) for r in rows})}
+                    for key, rows in groups.items()
+                ]
+        return out
+
+
+report_fanout = ReportFanoutService()
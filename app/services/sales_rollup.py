@@ -0,0 +1,358 @@
+import asyncio
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+from psycopg2.extras import execute_values
+from loguru import logger
+from ..core.database import db_manager
+from ..core.config import settings
+
+# Sales invoices only (retail + wholesale), same filter as the SAL_* reports
+SALES_TRCODES = "(7, 8)"
+
+ROLLUP_COLUMNS = ["invoice_count", "revenue", "customer_count", "stock_movement_count",
+                  "stock_movement_value", "collection_count", "collections"]
+
+# window() key -> field name in the YoY responses (current_*, ly_*, diff_*, pct_change_*)
+METRICS = {
+    "invoice_count": "invoice_count",
+    "revenue": "revenue",
+    "avg_order_value": "avg_order",
+    "customer_count": "customers",
+    "new_customers": "new_customers",
+    "stock_movement_count": "stock_movements",
+    "stock_movement_value": "stock_value",
+    "collection_count": "collection_count",
+    "collections": "collections",
+}
+
+
+class RollupNotReady(Exception):
+    """Raised while a firm's rollup is still being backfilled"""
+    pass
+
+
+def same_day_last_year(d: date) -> date:
+    try:
+        return d.replace(year=d.year - 1)
+    except ValueError:  # 29 Feb
+        return d.replace(year=d.year - 1, day=28)
+
+
+class SalesRollupService:
+    """
+    Daily per-firm sales aggregates in PostgreSQL (sql/sales_rollup.sql).
+    Each (firma, period) is backfilled once with a few GROUP BY day queries, then kept
+    current by re-aggregating only the days touched since the CAPIBLOCK watermark plus a
+    short lookback (which also catches recently deleted fiches). Older deletions and
+    cancellations are picked up by a full re-aggregation every full_every.
+    Window queries never touch Logo.
+    """
+
+    def __init__(self):
+        self.lookback_days = settings.SALES_ROLLUP_LOOKBACK_DAYS
+        self.full_every = timedelta(hours=settings.SALES_ROLLUP_FULL_EVERY_HOURS)
+        self._busy = set()
+        self._busy_lock = threading.Lock()
+        self._ready = set()  # firms whose periods are all backfilled
+        self._backfills = {}  # firma -> running background backfill task
+        self._schema_ready = False
+
+    async def ensure_schema(self):
+        if self._schema_ready:
+            return True
+        path = os.path.join(os.path.dirname(__file__), "..", "..", "sql", "sales_rollup.sql")
+        with open(path, "r", encoding="utf-8") as f:
+            ddl = f.read()
+        self._schema_ready = bool(await db_manager.execute_pg_query_async(ddl, fetch=False))
+        return self._schema_ready
+
+    # --- Logo side ---
+
+    @staticmethod
+    def _day_filter(days):
+        if days is None:
+            return "", ()
+        return f" AND CAST(DATE_ AS DATE) IN ({', '.join(['%s'] * len(days))})", tuple(days)
+
+    async def _aggregate(self, f: str, p: str, days=None):
+        """day -> rollup values and day -> client refs, for all days or the given ones"""
+        cond, params = self._day_filter(days)
+        invoices = await db_manager.execute_ms_query_async(f"""
+            SELECT CAST(DATE_ AS DATE) AS DAY, COUNT(*) AS INVOICE_COUNT, ISNULL(SUM(NETTOTAL), 0) AS REVENUE
+            FROM LG_{f}_{p}_INVOICE (NOLOCK)
+            WHERE TRCODE IN {SALES_TRCODES} AND CANCELLED = 0{cond}
+            GROUP BY CAST(DATE_ AS DATE)
+        """, params)
+        customers = await db_manager.execute_ms_query_async(f"""
+            SELECT DISTINCT CAST(DATE_ AS DATE) AS DAY, CLIENTREF
+            FROM LG_{f}_{p}_INVOICE (NOLOCK)
+            WHERE TRCODE IN {SALES_TRCODES} AND CANCELLED = 0 AND CLIENTREF > 0{cond}
+        """, params)
+        stock = await db_manager.execute_ms_query_async(f"""
+            SELECT CAST(DATE_ AS DATE) AS DAY, COUNT(*) AS MOVEMENT_COUNT, ISNULL(SUM(AMOUNT * PRICE), 0) AS MOVEMENT_VALUE
+            FROM LG_{f}_{p}_STLINE (NOLOCK)
+            WHERE CANCELLED = 0{cond}
+            GROUP BY CAST(DATE_ AS DATE)
+        """, params)
+        collections = await db_manager.execute_ms_query_async(f"""
+            SELECT CAST(DATE_ AS DATE) AS DAY, COUNT(*) AS COLLECTION_COUNT, ISNULL(SUM(AMOUNT), 0) AS COLLECTIONS
+            FROM LG_{f}_{p}_KSLINES (NOLOCK)
+            WHERE CANCELLED = 0{cond}
+            GROUP BY CAST(DATE_ AS DATE)
+        """, params)
+        if None in (invoices, customers, stock, collections):
+            raise RuntimeError(f"Logo aggregation failed for {f}_{p}")
+
+        rollup, clients = {}, {}
+        blank = lambda: dict.fromkeys(ROLLUP_COLUMNS, 0)
+        for r in invoices:
+            rollup.setdefault(r["DAY"], blank()).update(invoice_count=r["INVOICE_COUNT"], revenue=r["REVENUE"])
+        for r in customers:
+            clients.setdefault(r["DAY"], []).append(r["CLIENTREF"])
+        for r in stock:
+            rollup.setdefault(r["DAY"], blank()).update(stock_movement_count=r["MOVEMENT_COUNT"], stock_movement_value=r["MOVEMENT_VALUE"])
+        for r in collections:
+            rollup.setdefault(r["DAY"], blank()).update(collection_count=r["COLLECTION_COUNT"], collections=r["COLLECTIONS"])
+        for day, refs in clients.items():
+            rollup.setdefault(day, blank())["customer_count"] = len(refs)
+        return rollup, clients
+
+    async def _changed_days(self, f: str, p: str, watermark: datetime):
+        """Days with fiches created/modified since the watermark, and the new watermark"""
+        days, newest = set(), watermark
+        for table in ("INVOICE", "STLINE", "KSLINES"):
+            rows = await db_manager.execute_ms_query_async(f"""
+                SELECT CAST(DATE_ AS DATE) AS DAY, MAX(CAPIBLOCK_MODIFIEDDATE) AS MODIFIED, MAX(CAPIBLOCK_CREATEDDATE) AS CREATED
+                FROM LG_{f}_{p}_{table} (NOLOCK)
+                WHERE CAPIBLOCK_MODIFIEDDATE >= %s OR CAPIBLOCK_CREATEDDATE >= %s
+                GROUP BY CAST(DATE_ AS DATE)
+            """, (watermark, watermark))
+            if rows is None:
+                raise RuntimeError(f"Change detection failed on LG_{f}_{p}_{table}")
+            for r in rows:
+                days.add(r["DAY"])
+                for stamp in (r["MODIFIED"], r["CREATED"]):
+                    if isinstance(stamp, datetime) and stamp > newest:
+                        newest = stamp
+        return days, newest
+
+    async def _max_stamp(self, f: str, p: str):
+        stamps = []
+        for table in ("INVOICE", "STLINE", "KSLINES"):
+            rows = await db_manager.execute_ms_query_async(
+                f"SELECT MAX(CAPIBLOCK_MODIFIEDDATE) AS MODIFIED, MAX(CAPIBLOCK_CREATEDDATE) AS CREATED FROM LG_{f}_{p}_{table} (NOLOCK)"
+            )
+            for r in rows or []:
+                stamps += [s for s in (r["MODIFIED"], r["CREATED"]) if isinstance(s, datetime)]
+        return max(stamps) if stamps else datetime(1900, 1, 1)
+
+    # --- PostgreSQL side ---
+
+    def _write(self, f: str, p: str, rollup: dict, clients: dict, days, watermark, full: bool):
+        """Replace the given days (or the whole period) in one transaction"""
+        with db_manager.connection(settings.DEFAULT_DB) as conn:
+            if conn is None:
+                raise RuntimeError("PostgreSQL unavailable")
+            try:
+                with conn.cursor() as cur:
+                    for table in ("sales_daily_rollup", "sales_daily_customers"):
+                        if full:
+                            cur.execute(f"DELETE FROM {table} WHERE firma = %s AND period = %s", (f, p))
+                        else:
+                            cur.execute(f"DELETE FROM {table} WHERE firma = %s AND period = %s AND day = ANY(%s)", (f, p, list(days)))
+                    execute_values(cur, f"""
+                        INSERT INTO sales_daily_rollup (firma, period, day, {', '.join(ROLLUP_COLUMNS)}) VALUES %s
+                    """, [(f, p, day, *(v[c] for c in ROLLUP_COLUMNS)) for day, v in rollup.items()], page_size=1000)
+                    execute_values(cur, "INSERT INTO sales_daily_customers (firma, period, day, client_ref) VALUES %s",
+                                   [(f, p, day, ref) for day, refs in clients.items() for ref in refs], page_size=5000)
+                    cur.execute("""
+                        INSERT INTO sales_rollup_state (firma, period, watermark, days_refreshed, last_full_at, refreshed_at)
+                        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                        ON CONFLICT (firma, period) DO UPDATE
+                        SET watermark = EXCLUDED.watermark,
+                            days_refreshed = EXCLUDED.days_refreshed,
+                            last_full_at = CASE WHEN %s THEN CURRENT_TIMESTAMP ELSE sales_rollup_state.last_full_at END,
+                            refreshed_at = CURRENT_TIMESTAMP
+                    """, (f, p, watermark, len(rollup) if full else len(days), full))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    # --- refresh ---
+
+    async def refresh(self, firma: str, period: str, full: bool = False) -> dict:
+        """Backfill (first run or full=True) or incrementally update one firm/period"""
+        f, p = str(firma), str(period)
+        with self._busy_lock:
+            if (f, p) in self._busy:
+                return {"firma": f, "period": p, "mode": "skipped"}
+            self._busy.add((f, p))
+        try:
+            await self.ensure_schema()
+            state = await db_manager.execute_pg_query_async(
+                "SELECT watermark FROM sales_rollup_state WHERE firma = %s AND period = %s", (f, p)
+            )
+            full = full or not state or state[0]["watermark"] is None
+            if full:
+                # Take the watermark first: rows written during the backfill are picked up next time
+                watermark = await self._max_stamp(f, p)
+                rollup, clients = await self._aggregate(f, p)
+                days = rollup.keys()
+            else:
+                changed, watermark = await self._changed_days(f, p, state[0]["watermark"])
+                today = date.today()
+                days = sorted(changed | {today - timedelta(days=i) for i in range(self.lookback_days)})
+                rollup, clients = {}, {}
+                for i in range(0, len(days), 500):
+                    part_rollup, part_clients = await self._aggregate(f, p, days[i:i + 500])
+                    rollup.update(part_rollup)
+                    clients.update(part_clients)
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write, f, p, rollup, clients, list(days), watermark, full)
+            from .comparison_engine import comparison_engine
+            comparison_engine.invalidate(f)
+            logger.info(f"Sales rollup {f}_{p} {'backfilled' if full else 'refreshed'}: {len(days)} days")
+            return {"firma": f, "period": p, "mode": "full" if full else "incremental", "days": len(days)}
+        finally:
+            with self._busy_lock:
+                self._busy.discard((f, p))
+
+    def _full_due(self, last_full, now: datetime) -> bool:
+        if self.full_every <= timedelta(0):
+            return False
+        return last_full is None or now - last_full > self.full_every
+
+    async def _periods(self, firma: str):
+        rows = await db_manager.execute_ms_query_async(
+            "SELECT NR FROM L_CAPIPERIOD WHERE FIRMNR = %s ORDER BY NR", (int(firma),)
+        )
+        return [f"{r['NR']:02d}" for r in rows or []]
+
+    async def backfill_firm(self, firma: str, full: bool = False) -> list:
+        """Every period of a firm, so last year's days are there even when they live in the previous period"""
+        results = []
+        for p in await self._periods(firma):
+            try:
+                results.append(await self.refresh(firma, p, full))
+            except Exception as e:
+                logger.error(f"Sales rollup {firma}_{p} failed: {e}")
+                results.append({"firma": str(firma), "period": p, "mode": "failed", "error": str(e)})
+        return results
+
+    async def refresh_all(self) -> list:
+        """Refresh every tracked firm/period (plus the default firm): incremental, or full once full_every has passed"""
+        from .logo_service import logo_service
+        await self.ensure_firm(logo_service.firma_no, wait=True)
+        tracked = await db_manager.execute_pg_query_async(
+            "SELECT firma, period, last_full_at FROM sales_rollup_state ORDER BY firma, period"
+        )
+        now = datetime.now(timezone.utc)
+        results = []
+        for r in tracked or []:
+            f, p = r["firma"], r["period"]
+            full = self._full_due(r["last_full_at"], now)
+            try:
+                results.append(await self.refresh(f, p, full=full))
+            except Exception as e:
+                logger.error(f"Sales rollup {f}_{p} failed: {e}")
+        return results
+
+    async def _backfill(self, f: str, periods: list) -> bool:
+        for p in periods:
+            try:
+                result = await self.refresh(f, p, full=True)
+            except Exception as e:
+                logger.error(f"Sales rollup backfill {f}_{p} failed: {e}")
+                return False
+            if result["mode"] == "skipped":
+                # Another refresh of this period is still writing it
+                return False
+        self._ready.add(f)
+        return True
+
+    async def ensure_firm(self, firma: str, wait: bool = False) -> bool:
+        """
+        True once every period of the firm is in the rollup (checked once per process).
+        Missing periods are backfilled in a background task and False is returned until
+        it finishes; wait=True (scheduler) runs the backfill inline instead.
+        """
+        f = str(firma)
+        if f in self._ready:
+            return True
+        await self.ensure_schema()
+        rows = await db_manager.execute_pg_query_async("SELECT period FROM sales_rollup_state WHERE firma = %s", (f,))
+        tracked = {r["period"] for r in rows or []}
+        periods = await self._periods(f)
+        if not periods:
+            return False
+        missing = [p for p in periods if p not in tracked]
+        if not missing:
+            self._ready.add(f)
+            return True
+        if wait:
+            return await self._backfill(f, missing)
+        if f not in self._backfills:
+            logger.info(f"Sales rollup for firma {f} not ready, backfilling {', '.join(missing)} in the background")
+            task = asyncio.create_task(self._backfill(f, missing))
+            self._backfills[f] = task
+            task.add_done_callback(lambda _: self._backfills.pop(f, None))
+        return False
+
+    async def state(self):
+        await self.ensure_schema()
+        return await db_manager.execute_pg_query_async(
+            "SELECT firma, period, watermark, days_refreshed, last_full_at, refreshed_at FROM sales_rollup_state ORDER BY firma, period"
+        )
+
+    # --- reads ---
+
+    async def window(self, firma: str, start: date, end: date) -> dict:
+        """Totals for [start, end] across all periods of the firm"""
+        f = str(firma)
+        rows = await db_manager.execute_pg_query_async(f"""
+            SELECT {', '.join(f'COALESCE(SUM({c}), 0) AS {c}' for c in ROLLUP_COLUMNS if c != 'customer_count')},
+                   (SELECT COUNT(DISTINCT client_ref) FROM sales_daily_customers
+                     WHERE firma = %s AND day BETWEEN %s AND %s) AS customer_count,
+                   (SELECT COUNT(*) FROM (
+                        SELECT DISTINCT c.client_ref FROM sales_daily_customers c
+                        WHERE c.firma = %s AND c.day BETWEEN %s AND %s
+                          AND NOT EXISTS (SELECT 1 FROM sales_daily_customers o
+                                          WHERE o.firma = c.firma AND o.client_ref = c.client_ref AND o.day < %s)
+                    ) n) AS new_customers
+            FROM sales_daily_rollup
+            WHERE firma = %s AND day BETWEEN %s AND %s
+        """, (f, start, end, f, start, end, start, f, start, end))
+        if not rows:
+            return {}
+        totals = {k: float(v) if k in ("revenue", "stock_movement_value", "collections") else int(v) for k, v in rows[0].items()}
+        totals["avg_order_value"] = round(totals["revenue"] / totals["invoice_count"], 2) if totals["invoice_count"] else 0
+        return totals
+
+    async def compare(self, firma: str, start: date, end: date) -> dict:
+        """A window against the same window one year earlier"""
+        if not await self.ensure_firm(firma):
+            raise RollupNotReady(f"Sales rollup for firma {firma} is not ready yet")
+        ly_start, ly_end = same_day_last_year(start), same_day_last_year(end)
+        current, last = await asyncio.gather(self.window(firma, start, end), self.window(firma, ly_start, ly_end))
+        out = {"current_start": start, "current_end": end, "ly_start": ly_start, "ly_end": ly_end}
+        for key, name in METRICS.items():
+            cur, ly = current.get(key, 0), last.get(key, 0)
+            out[f"current_{name}"] = cur
+            out[f"ly_{name}"] = ly
+            out[f"diff_{name}"] = round(cur - ly, 2)
+            out[f"pct_change_{name}"] = round((cur - ly) * 100.0 / ly, 2) if ly else None
+        return out
+
+
+sales_rollup = SalesRollupService()
+
+
+def run_sales_rollup_refresh():
+    """Module-level function for consistent pickling/serialization in APScheduler"""
+    try:
+        asyncio.run(sales_rollup.refresh_all())
+    except Exception as e:
+        logger.error(f"Sales rollup refresh failed: {e}")
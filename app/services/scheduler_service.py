@@ -1,11 +1,19 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.triggers.cron import CronTrigger
 from apscheduler.executors.pool import ThreadPoolExecutor
 from loguru import logger
 import os
 import json
 import subprocess
 import sys
+import asyncio
+import heapq
+import threading
+import time
+from collections import deque
+from datetime import datetime
 
 def run_scheduled_backup():
     """Module-level function for consistent pickling/serialization in APScheduler"""
@@ -27,12 +35,256 @@ def run_scheduled_backup():
     except Exception as e:
         logger.error(f"Scheduled backup job failed: {e}")
 
+def run_snapshot_job(report_code: str, firma: str, period: str):
+    """Module-level function for consistent pickling/serialization in APScheduler"""
+    scheduler_service.snapshots.submit(report_code, firma, period)
+
+
+class SnapshotRefreshEngine:
+    """
+    Keeps report snapshots fresh in the background.
+    APScheduler triggers (interval or cron per report) only enqueue; a fixed set of
+    worker threads drains the queue by priority, so at most `max_concurrency`
+    snapshot queries hit Logo at once. Heavy reports wait for the off-hours window
+    and every run is skipped while Logo is busy.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self._cond = threading.Condition()
+        self._queue = []          # heap of (priority, seq, key)
+        self._queued = set()
+        self._running = set()
+        self._seq = 0
+        self._workers = []
+        self._stopping = False
+        self._busy_cache = (0.0, False)
+        self.history = deque(maxlen=500)
+        self.config = {}
+
+    # --- configuration ---
+
+    def _load_config(self) -> dict:
+        from app.core.config import settings
+        config = {
+            "enabled": settings.SNAPSHOT_SCHEDULE_ENABLED,
+            "max_concurrency": settings.SNAPSHOT_MAX_CONCURRENCY,
+            "interval_minutes": settings.SNAPSHOT_REFRESH_INTERVAL_MINUTES,
+            "off_hours": settings.SNAPSHOT_OFF_HOURS,
+            "busy_threshold": settings.SNAPSHOT_BUSY_THRESHOLD,
+            "tenants": [],
+            "reports": {},
+        }
+        config_path = os.path.join(os.getcwd(), "snapshot_schedule.json")
+        if os.path.exists(config_path):
+            try:
+                with open(config_path, "r", encoding="utf-8") as f:
+                    config.update(json.load(f))
+            except Exception as e:
+                logger.error(f"Invalid snapshot_schedule.json: {e}")
+        return config
+
+    def _report_plan(self, code: str) -> dict:
+        """Effective schedule for one report: config override > defaults"""
+        from .report_catalog import report_catalog
+        # Heavy reports (full STLINE/INVOICE history scans) only run inside the off-hours window
+        entry = report_catalog.get(code)
+        heavy = entry.get("cost") == "heavy"
+        plan = {
+            "priority": 1 if "incremental" in entry else (9 if heavy else 5),
+            "heavy": heavy,
+            "interval_minutes": None if heavy else self.config["interval_minutes"],
+            "cron": "0 2 * * *" if heavy else None,
+            "enabled": True,
+        }
+        plan.update(self.config["reports"].get(code, {}))
+        return plan
+
+    def reload(self):
+        """(Re)build one trigger per report and tenant from config"""
+        from .logo_service import logo_service
+        self.config = self._load_config()
+        for job in self.scheduler.get_jobs(jobstore='snapshots'):
+            job.remove()
+        if not self.config["enabled"]:
+            logger.info("Snapshot refresh engine disabled.")
+            return
+
+        tenants = self.config["tenants"] or [{"firma": logo_service.firma_no, "period": logo_service.period_no}]
+        count = 0
+        for code in logo_service.report_codes():
+            plan = self._report_plan(code)
+            if not plan["enabled"]:
+                continue
+            if plan.get("cron"):
+                trigger = CronTrigger.from_crontab(plan["cron"])
+                label = f"cron {plan['cron']}"
+            else:
+                trigger, label = None, f"every {plan['interval_minutes']} min"
+            for t in tenants:
+                firma, period = str(t["firma"]), str(t["period"])
+                job_args = dict(
+                    args=[code, firma, period],
+                    id=f"snapshot:{code}:{firma}_{period}",
+                    name=f"Snapshot {code} {firma}_{period} ({label})",
+                    jobstore='snapshots',
+                    replace_existing=True,
+                )
+                if trigger is not None:
+                    self.scheduler.add_job(run_snapshot_job, trigger, **job_args)
+                else:
+                    self.scheduler.add_job(run_snapshot_job, 'interval', minutes=plan["interval_minutes"], **job_args)
+                count += 1
+        self._ensure_workers()
+        logger.info(f"Snapshot refresh engine: {count} jobs scheduled, max {self.config['max_concurrency']} concurrent")
+
+    # --- queue ---
+
+    def submit(self, report_code: str, firma: str, period: str, force: bool = False):
+        """Enqueue a refresh (duplicates of a queued/running refresh are dropped)"""
+        key = (report_code, str(firma), str(period), force)
+        with self._cond:
+            if key in self._queued or key[:3] in {k[:3] for k in self._running}:
+                return False
+            priority = self._report_plan(report_code)["priority"] if self.config else 5
+            self._seq += 1
+            heapq.heappush(self._queue, (priority, self._seq, key))
+            self._queued.add(key)
+            self._cond.notify()
+        self._ensure_workers()
+        return True
+
+    def _ensure_workers(self):
+        with self._cond:
+            self._stopping = False
+            wanted = max(1, int(self.config.get("max_concurrency", 1))) if self.config else 1
+            self._workers = [w for w in self._workers if w.is_alive()]
+            while len(self._workers) < wanted:
+                w = threading.Thread(target=self._worker, name=f"snapshot-worker-{len(self._workers)}", daemon=True)
+                self._workers.append(w)
+                w.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                _, _, key = heapq.heappop(self._queue)
+                self._queued.discard(key)
+                self._running.add(key)
+            try:
+                self._run(*key)
+            finally:
+                with self._cond:
+                    self._running.discard(key)
+
+    # --- gates ---
+
+    def _in_off_hours(self, now: datetime = None) -> bool:
+        window = self.config.get("off_hours") or ""
+        try:
+            start, end = [datetime.strptime(x.strip(), "%H:%M").time() for x in window.split("-")]
+        except ValueError:
+            return True  # no window configured: always allowed
+        t = (now or datetime.now()).time()
+        return start <= t < end if start <= end else (t >= start or t < end)
+
+    def _logo_busy(self) -> bool:
+        """Active user requests on the Logo database above the threshold (cached for 15s)"""
+        checked_at, busy = self._busy_cache
+        if time.monotonic() - checked_at < 15:
+            return busy
+        from app.core.database import db_manager
+        res = db_manager.execute_ms_query("""
+            SELECT COUNT(*) AS ACTIVE, SUM(CASE WHEN blocking_session_id <> 0 THEN 1 ELSE 0 END) AS BLOCKED
+            FROM sys.dm_exec_requests
+            WHERE session_id > 50 AND session_id <> @@SPID AND database_id = DB_ID()
+        """)
+        if res:
+            active, blocked = res[0]["ACTIVE"] or 0, res[0]["BLOCKED"] or 0
+            busy = active >= self.config.get("busy_threshold", 20) or blocked > 0
+        else:
+            busy = False  # can't tell; don't stall refreshes on a failed probe
+        self._busy_cache = (time.monotonic(), busy)
+        return busy
+
+    # --- execution ---
+
+    def _record(self, entry: dict):
+        self.history.appendleft(entry)
+        if entry["status"] != "skipped":
+            from app.core.database import db_manager
+            from .sync_service import sync_service
+            # report_snapshot_runs comes with the snapshot schema; a failed run may not have applied it yet
+            if not asyncio.run(sync_service.ensure_schema()):
+                return
+            db_manager.execute_pg_query("""
+                INSERT INTO report_snapshot_runs (report_code, tenant_id, status, mode, fetched, row_count, duration_ms, error, started_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (entry["report_code"], entry["tenant_id"], entry["status"], entry.get("mode"), entry.get("fetched"),
+                  entry.get("rows"), entry.get("duration_ms"), entry.get("error"), entry["started_at"]), fetch=False)
+
+    def _run(self, report_code: str, firma: str, period: str, force: bool):
+        from .sync_service import sync_service
+        plan = self._report_plan(report_code)
+        entry = {"report_code": report_code, "tenant_id": f"{firma}_{period}", "started_at": datetime.now()}
+        if not force:
+            reason = None
+            if plan["heavy"] and not self._in_off_hours():
+                reason = "heavy report outside off-hours window"
+            elif self._logo_busy():
+                reason = "Logo busy"
+            if reason:
+                logger.info(f"Snapshot {report_code} ({firma}_{period}) skipped: {reason}")
+                self._record({**entry, "status": "skipped", "error": reason})
+                return
+
+        start = time.monotonic()
+        try:
+            result = asyncio.run(sync_service.generate_and_save_snapshot(report_code, firma=firma, period=period))
+            status = "success" if result else "failed"
+            info = result if isinstance(result, dict) else {}
+            error = None if result else "snapshot refresh returned no data"
+        except Exception as e:
+            status, info, error = "failed", {}, str(e)
+            logger.error(f"Snapshot {report_code} ({firma}_{period}) failed: {e}")
+        self._record({**entry, "status": status, "duration_ms": round((time.monotonic() - start) * 1000, 1),
+                      "mode": info.get("mode"), "fetched": info.get("fetched"), "rows": info.get("rows"), "error": error})
+
+    def status(self) -> dict:
+        with self._cond:
+            queued = [{"priority": p, "report_code": k[0], "tenant_id": f"{k[1]}_{k[2]}"} for p, _, k in sorted(self._queue)]
+            running = [{"report_code": k[0], "tenant_id": f"{k[1]}_{k[2]}"} for k in self._running]
+        jobs = [
+            {"id": j.id, "name": j.name, "next_run": j.next_run_time.isoformat() if j.next_run_time else None}
+            for j in self.scheduler.get_jobs(jobstore='snapshots')
+        ] if self.scheduler.running else []
+        return {
+            "enabled": self.config.get("enabled", False),
+            "max_concurrency": self.config.get("max_concurrency"),
+            "off_hours": self.config.get("off_hours"),
+            "in_off_hours": self._in_off_hours() if self.config else None,
+            "queued": queued,
+            "running": running,
+            "jobs": jobs,
+        }
+
+
 class SchedulerService:
     def __init__(self):
         # Persistence: Use local SQLite for jobs
         db_path = os.path.join(os.getcwd(), "api.db")
         jobstores = {
-            'default': SQLAlchemyJobStore(url=f'sqlite:///{db_path}')
+            'default': SQLAlchemyJobStore(url=f'sqlite:///{db_path}'),
+            # Snapshot jobs are rebuilt from snapshot_schedule.json on every start
+            'snapshots': MemoryJobStore()
         }
         executors = {
             'default': ThreadPoolExecutor(20)
@@ -43,6 +295,7 @@ class SchedulerService:
         }
         
         self.scheduler = BackgroundScheduler(jobstores=jobstores, executors=executors, job_defaults=job_defaults)
+        self.snapshots = SnapshotRefreshEngine(self.scheduler)
         
     def start(self):
         """Starts the scheduler and loads jobs"""
@@ -50,9 +303,14 @@ class SchedulerService:
             self.scheduler.start()
             logger.info("Scheduler Started")
             self.refresh_backup_schedule()
+            self.schedule_dimension_refresh()
+            self.schedule_sales_rollup()
+            self.schedule_api_query_stats()
+            self.snapshots.reload()
             
     def shutdown(self):
         """Stops the scheduler"""
+        self.snapshots.stop()
         if self.scheduler.running:
             self.scheduler.shutdown()
             logger.info("Scheduler Stopped")
@@ -142,5 +400,76 @@ class SchedulerService:
         except Exception as e:
             logger.error(f"Error refreshing schedule: {e}")
 
+    def schedule_dimension_refresh(self):
+        """Background delta refresh of the Logo master-data dimension cache"""
+        from app.core.config import settings
+        from .dimension_cache import run_dimension_refresh
+        job_id = "dimension_cache_refresh"
+        try:
+            if self.scheduler.get_job(job_id):
+                self.scheduler.remove_job(job_id)
+            seconds = settings.DIMENSION_CACHE_REFRESH_SECONDS
+            if seconds <= 0:
+                return
+            self.scheduler.add_job(
+                run_dimension_refresh,
+                'interval',
+                seconds=seconds,
+                id=job_id,
+                replace_existing=True,
+                next_run_time=datetime.now(),
+                name=f"Logo Dimension Cache Refresh (Every {seconds}s)"
+            )
+            logger.info(f"Scheduled dimension cache refresh (Every {seconds}s).")
+        except Exception as e:
+            logger.error(f"Error scheduling dimension cache refresh: {e}")
+
+    def schedule_sales_rollup(self):
+        """Backfill on first run, then incremental refresh of the daily sales rollups (full every SALES_ROLLUP_FULL_EVERY_HOURS)"""
+        from app.core.config import settings
+        from .sales_rollup import run_sales_rollup_refresh
+        job_id = "sales_rollup_refresh"
+        try:
+            if self.scheduler.get_job(job_id):
+                self.scheduler.remove_job(job_id)
+            seconds = settings.SALES_ROLLUP_REFRESH_SECONDS
+            if seconds <= 0:
+                return
+            self.scheduler.add_job(
+                run_sales_rollup_refresh,
+                'interval',
+                seconds=seconds,
+                id=job_id,
+                replace_existing=True,
+                next_run_time=datetime.now(),
+                name=f"Daily Sales Rollup Refresh (Every {seconds}s)"
+            )
+            logger.info(f"Scheduled sales rollup refresh (Every {seconds}s).")
+        except Exception as e:
+            logger.error(f"Error scheduling sales rollup refresh: {e}")
+
+    def schedule_api_query_stats(self):
+        """Periodic dm_exec_query_stats pass for the API's tagged Logo statements"""
+        from app.core.config import settings
+        from .profiler_service import run_api_query_stats_collect
+        job_id = "api_query_stats_collect"
+        try:
+            if self.scheduler.get_job(job_id):
+                self.scheduler.remove_job(job_id)
+            seconds = settings.QUERY_STATS_INTERVAL_SECONDS
+            if seconds <= 0 or not settings.QUERY_TAGGING_ENABLED:
+                return
+            self.scheduler.add_job(
+                run_api_query_stats_collect,
+                'interval',
+                seconds=seconds,
+                id=job_id,
+                replace_existing=True,
+                name=f"API Query Stats Collector (Every {seconds}s)"
+            )
+            logger.info(f"Scheduled API query stats collection (Every {seconds}s).")
+        except Exception as e:
+            logger.error(f"Error scheduling API query stats collection: {e}")
+
 scheduler_service = SchedulerService()
 
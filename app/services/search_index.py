@@ -0,0 +1,314 @@
+import asyncio
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import Counter
+from loguru import logger
+from ..core.database import db_manager
+from .dimension_cache import dimension_cache
+
+# İ/I/ı all fold to i (so "ISPARTA", "Isparta", "ıspart" match), other letters lose their diacritics.
+# Mapped before lower(): str.lower() turns "İ" into "i" + combining dot.
+_TR_FOLD = str.maketrans("İIıĞğÜüŞşÖöÇçÂâÎîÛû", "iiigguussooccaaiiuu")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def fold(text) -> str:
+    """Turkish-aware case/diacritic folding; punctuation becomes a single space"""
+    if not text:
+        return ""
+    return _NON_ALNUM.sub(" ", str(text).translate(_TR_FOLD).lower()).strip()
+
+
+def fold_code(text) -> str:
+    """Folding for card codes: keeps punctuation ("120.01.005") but ignores case and spaces"""
+    if not text:
+        return ""
+    return str(text).translate(_TR_FOLD).lower().replace(" ", "")
+
+
+def trigrams(text: str, pad: bool = True) -> set:
+    """pad=False keeps only the grams inside the text, for substring lookups"""
+    padded = f" {text} " if pad else text
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# kind -> (dimension, output columns built from the dimension row, list filter)
+KINDS = {
+    "customers": ("CLCARD", lambda r: {"CODE": r["CODE"], "NAME": r.get("DEFINITION_"),
+                                       "ADDRESS": r.get("ADDR1"), "CITY": r.get("CITY")},
+                  lambda r: r.get("CARDTYPE") != 22),
+    "items": ("ITEMS", lambda r: {"CODE": r["CODE"], "NAME": r.get("NAME"), "CATEGORY": r.get("STGRPCODE")},
+              lambda r: r.get("CARDTYPE") == 1),
+}
+DIMENSION_KINDS = {dim: kind for kind, (dim, _, _) in KINDS.items()}
+
+
+class _Index:
+    """Prefix + trigram index over one (firma, kind)"""
+
+    def __init__(self):
+        self.docs = {}      # ref -> (code, name, barcodes, payload)
+        self.codes = []     # sorted (folded code, ref)
+        self.tokens = []    # sorted (name token or barcode, ref)
+        self.grams = {}     # trigram -> set(ref), over "code name"
+        self.barcodes = {}  # barcode -> ref
+        self.max_barcode_ref = 0
+
+    def _doc_tokens(self, doc):
+        code, name, barcodes, _ = doc
+        return set(name.split()) | set(barcodes)
+
+    def remove(self, ref):
+        doc = self.docs.pop(ref, None)
+        if doc is None:
+            return
+        self._drop(self.codes, (doc[0], ref))
+        for token in self._doc_tokens(doc):
+            self._drop(self.tokens, (token, ref))
+        for gram in trigrams(f"{doc[0]} {doc[1]}"):
+            postings = self.grams.get(gram)
+            if postings is not None:
+                postings.discard(ref)
+                if not postings:
+                    del self.grams[gram]
+        for barcode in doc[2]:
+            if self.barcodes.get(barcode) == ref:
+                del self.barcodes[barcode]
+
+    @staticmethod
+    def _drop(sorted_list, entry):
+        i = bisect.bisect_left(sorted_list, entry)
+        if i < len(sorted_list) and sorted_list[i] == entry:
+            del sorted_list[i]
+
+    def add(self, ref, code, name, barcodes, payload, bulk=False):
+        """bulk=True appends unsorted; call finish() once afterwards"""
+        self.remove(ref)
+        doc = (fold_code(code), fold(name), tuple(barcodes), payload)
+        self.docs[ref] = doc
+        insert = list.append if bulk else bisect.insort
+        insert(self.codes, (doc[0], ref))
+        for token in self._doc_tokens(doc):
+            insert(self.tokens, (token, ref))
+        for gram in trigrams(f"{doc[0]} {doc[1]}"):
+            self.grams.setdefault(gram, set()).add(ref)
+        for barcode in doc[2]:
+            self.barcodes[barcode] = ref
+
+    def finish(self):
+        self.codes.sort()
+        self.tokens.sort()
+
+    @staticmethod
+    def _prefix(sorted_list, prefix, cap):
+        i = bisect.bisect_left(sorted_list, (prefix,))
+        out = []
+        while i < len(sorted_list) and sorted_list[i][0].startswith(prefix) and len(out) < cap:
+            out.append(sorted_list[i])
+            i += 1
+        return out
+
+    def search(self, query: str, limit: int) -> list:
+        """Ranked refs: exact code/barcode > code prefix > name prefix > substring > fuzzy"""
+        q, qcode = fold(query), fold_code(query)
+        if not q and not qcode:
+            return []
+        words = q.split()
+        cap = max(limit * 20, 200)
+        scores = {}
+
+        def hit(ref, score):
+            if score > scores.get(ref, 0):
+                scores[ref] = score
+
+        if qcode in self.barcodes:
+            hit(self.barcodes[qcode], 95)
+        for code, ref in self._prefix(self.codes, qcode, cap):
+            hit(ref, 100 if code == qcode else 80)
+
+        if words:
+            # Every query word must prefix some word of the name (or a barcode)
+            longest = max(words, key=len)
+            for token, ref in self._prefix(self.tokens, longest, cap):
+                name = self.docs[ref][1]
+                doc_tokens = self._doc_tokens(self.docs[ref])
+                if all(any(t.startswith(w) for t in doc_tokens) for w in words):
+                    hit(ref, 70 if name.startswith(q) else 60)
+
+        if len(scores) < limit and max(len(q), len(qcode)) >= 3:
+            # Substring: the name form and the code form ("01.005" keeps its dots) of the query,
+            # each looked up by its unpadded trigrams, intersected from the rarest one up
+            for needle in {q, qcode}:
+                if len(needle) < 3:
+                    continue
+                inner = sorted(trigrams(needle, pad=False), key=lambda g: len(self.grams.get(g, ())))
+                found = [self.grams.get(g, set()) for g in inner]
+                if not all(found):
+                    continue
+                candidates = set(found[0])
+                for p in found[1:]:
+                    candidates &= p
+                    if not candidates:
+                        break
+                for ref in list(candidates)[:cap]:
+                    doc = self.docs[ref]
+                    if needle in f"{doc[0]} {doc[1]}":
+                        hit(ref, 40)
+            if len(scores) < limit and len(q) >= 3:
+                grams = sorted(trigrams(q), key=lambda g: len(self.grams.get(g, ())))
+                postings = [self.grams.get(g, set()) for g in grams]
+                # Fuzzy: enough shared trigrams (tolerates a typo or two); very common grams are skipped
+                common = len(self.docs) // 5 or 1
+                counts = Counter()
+                for g, p in zip(grams, postings):
+                    if 0 < len(p) <= common:
+                        counts.update(p)
+                needed = max(2, int(len(grams) * 0.6))
+                for ref, n in counts.most_common(cap):
+                    if n < needed:
+                        break
+                    hit(ref, 20 * n / len(grams))
+
+        best = heapq.nsmallest(limit, scores.items(),
+                               key=lambda kv: (-kv[1], len(self.docs[kv[0]][1]), self.docs[kv[0]][0]))
+        return best
+
+
+class LogoSearchIndex:
+    """
+    In-memory typeahead index for Logo customers and items, per firm.
+    Built from the dimension cache rows (plus UNITBARCODE for items) and kept in sync
+    through its refresh notifications, so searches never query Logo.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._indexes = {}  # (firma, kind) -> _Index
+        self._built = {}    # (firma, kind) -> build timestamp
+        self._building = set()
+        self.queries = 0
+        self.total_ms = 0.0
+        dimension_cache.subscribe(self._on_dimension_rows)
+
+    # --- maintenance (called from dimension refresh threads) ---
+
+    def _load_barcodes(self, firma, after_ref: int = 0):
+        rows = db_manager.execute_ms_query(
+            f"SELECT LOGICALREF, ITEMREF, BARCODE FROM LG_{firma}_UNITBARCODE (NOLOCK) WHERE LOGICALREF > %s AND BARCODE <> ''",
+            (after_ref,)
+        )
+        return rows or []
+
+    def _on_dimension_rows(self, firma, name, rows, full):
+        kind = DIMENSION_KINDS.get(name)
+        if kind is None:
+            return
+        _, payload_of, keep = KINDS[kind]
+        key = (firma, kind)
+
+        if full:
+            index = _Index()
+            barcodes = {}
+            if kind == "items":
+                for b in self._load_barcodes(firma):
+                    barcodes.setdefault(b["ITEMREF"], []).append(fold_code(b["BARCODE"]))
+                    index.max_barcode_ref = max(index.max_barcode_ref, b["LOGICALREF"])
+            for r in rows:
+                if keep(r):
+                    index.add(r["LOGICALREF"], r["CODE"], payload_of(r)["NAME"], barcodes.get(r["LOGICALREF"], ()),
+                              {"LOGICALREF": r["LOGICALREF"], **payload_of(r)}, bulk=True)
+            index.finish()
+            with self._lock:
+                self._indexes[key] = index
+                self._built[key] = time.time()
+            logger.info(f"Search index built: {kind} (firma {firma}), {len(index.docs)} entries")
+            return
+
+        with self._lock:
+            index = self._indexes.get(key)
+        if index is None:
+            return
+        new_barcodes = {}
+        if kind == "items":
+            try:
+                asyncio.get_running_loop()
+                in_loop = True  # read-through from the event loop: barcodes wait for the next refresh
+            except RuntimeError:
+                in_loop = False
+            if not in_loop:
+                for b in self._load_barcodes(firma, index.max_barcode_ref):
+                    new_barcodes.setdefault(b["ITEMREF"], []).append(fold_code(b["BARCODE"]))
+                    index.max_barcode_ref = max(index.max_barcode_ref, b["LOGICALREF"])
+        with self._lock:
+            for r in rows:
+                ref = r["LOGICALREF"]
+                if not keep(r):
+                    index.remove(ref)
+                    continue
+                old = index.docs.get(ref)
+                barcodes = set(old[2]) if old else set()
+                barcodes.update(new_barcodes.pop(ref, ()))
+                index.add(ref, r["CODE"], payload_of(r)["NAME"], sorted(barcodes), {"LOGICALREF": ref, **payload_of(r)})
+            # Barcodes added to items that did not change themselves
+            for ref, codes in new_barcodes.items():
+                old = index.docs.get(ref)
+                if old:
+                    index.add(ref, old[3]["CODE"], old[3]["NAME"], sorted(set(old[2]) | set(codes)), old[3])
+
+    async def ensure(self, firma, kind: str) -> bool:
+        """True when the index is ready; otherwise start building it in the background"""
+        key = (str(firma), kind)
+        if key in self._indexes:
+            return True
+        with self._lock:
+            if key in self._building:
+                return False
+            self._building.add(key)
+
+        async def build():
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, dimension_cache.refresh, firma, KINDS[kind][0], True
+                )
+            finally:
+                with self._lock:
+                    self._building.discard(key)
+
+        asyncio.create_task(build())
+        return False
+
+    # --- queries ---
+
+    def search(self, firma, kind: str, query: str, limit: int = 20):
+        """Ranked payload rows (with SCORE), or None if the index is not built yet"""
+        start = time.perf_counter()
+        with self._lock:
+            index = self._indexes.get((str(firma), kind))
+            if index is None:
+                return None
+            hits = index.search(query, limit + 1)
+            rows = [{**index.docs[ref][3], "SCORE": round(score, 1)} for ref, score in hits]
+        self.queries += 1
+        self.total_ms += (time.perf_counter() - start) * 1000
+        return rows
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {
+                f"{f}/{kind}": {
+                    "entries": len(index.docs),
+                    "trigrams": len(index.grams),
+                    "barcodes": len(index.barcodes),
+                    "built_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._built.get((f, kind), 0))),
+                }
+                for (f, kind), index in self._indexes.items()
+            }
+        out["queries"] = self.queries
+        out["avg_ms"] = round(self.total_ms / self.queries, 3) if self.queries else None
+        return out
+
+
+search_index = LogoSearchIndex()
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent async calls: the first caller for a key runs the work,
+    later callers await the same in-flight task and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}  # (loop id, key) -> asyncio.Task
+        self._stats = {"executions": 0, "coalesced": 0}
+
+    async def do(self, key, factory):
+        """Run `factory()` (a coroutine function) once per key at a time"""
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        with self._lock:
+            task = self._inflight.get(slot)
+            if task is None:
+                task = loop.create_task(factory())
+                self._inflight[slot] = task
+                self._stats["executions"] += 1
+
+                def _done(t, slot=slot):
+                    with self._lock:
+                        if self._inflight.get(slot) is t:
+                            del self._inflight[slot]
+                task.add_done_callback(_done)
+            else:
+                self._stats["coalesced"] += 1
+        # shield: one impatient caller must not cancel the work others are waiting on
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["in_flight"] = len(self._inflight)
+        return s
+
+
+report_flight = SingleFlight()
@@ -0,0 +1,98 @@
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from loguru import logger
+from ..core.config import settings
+
+# Optional: zstd gives smaller/faster blobs when the package is installed
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+FORMAT = "exfin-columnar/1"
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _type_of(values) -> str:
+    kinds = {type(v) for v in values if v is not None}
+    if not kinds:
+        return "null"
+    if kinds <= {bool}:
+        return "bool"
+    if kinds <= {int}:
+        return "int"
+    if kinds <= {int, float}:
+        return "float"
+    return "string"
+
+
+def to_columnar(rows: list) -> dict:
+    """
+    Row dicts -> column-oriented document with a schema header:
+    {"format", "schema": [{"name", "type"}], "row_count", "columns": {name: [values]}}
+    """
+    rows = json.loads(json.dumps(rows or [], default=_json_default))
+    names = list(dict.fromkeys(k for row in rows for k in row))
+    columns = {name: [row.get(name) for row in rows] for name in names}
+    return {
+        "format": FORMAT,
+        "schema": [{"name": n, "type": _type_of(columns[n])} for n in names],
+        "row_count": len(rows),
+        "columns": columns,
+    }
+
+
+def encode(rows: list, encoding: str = None):
+    """Rows -> (compressed bytes, content encoding). The bytes are a valid HTTP body as-is."""
+    encoding = encoding or settings.SNAPSHOT_COMPRESSION
+    if encoding == "zstd" and not HAS_ZSTD:
+        logger.warning("zstandard not installed, snapshot compression falls back to gzip")
+        encoding = "gzip"
+    raw = json.dumps(to_columnar(rows), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(raw), "zstd"
+    return gzip.compress(raw, compresslevel=6), "gzip"
+
+
+def decode(blob: bytes, encoding: str) -> dict:
+    blob = bytes(blob)
+    if encoding == "zstd":
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    else:
+        raw = gzip.decompress(blob)
+    return json.loads(raw)
+
+
+def select(doc: dict, columns: list = None, offset: int = 0, limit: int = None) -> dict:
+    """Column projection + row window over a columnar document"""
+    names = [c["name"] for c in doc["schema"]]
+    if columns:
+        missing = [c for c in columns if c not in doc["columns"]]
+        if missing:
+            raise KeyError(", ".join(missing))
+        names = list(columns)
+    end = None if limit is None else offset + limit
+    return {
+        "format": doc["format"],
+        "schema": [next(c for c in doc["schema"] if c["name"] == n) for n in names],
+        "row_count": doc["row_count"],
+        "offset": offset,
+        "limit": limit,
+        "columns": {n: doc["columns"][n][offset:end] for n in names},
+    }
+
+
+def to_rows(doc: dict) -> list:
+    """Columnar document (or a selection of it) back to row dicts"""
+    names = list(doc["columns"])
+    return [dict(zip(names, values)) for values in zip(*(doc["columns"][n] for n in names))]
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import time
+import uuid
+from loguru import logger
+from ..core.config import settings
+from ..core.database import db_manager
+from .company_sync import company_sync
+from .master_data_sync import master_data_sync
+
+# step -> what it syncs, where it applies and what it waits for.
+# per: None = once per run, "company" = every company, "period" = every company's working period
+SYNC_PLAN = {
+    "companies": {"per": None, "after": ()},
+    "salesmen": {"entity": "salesmen", "per": "company", "after": ("companies",)},
+    "brands": {"entity": "brands", "per": "company", "after": ("companies",)},
+    "special_codes:customer": {"entity": "special_codes", "variant": "customer", "per": "company", "after": ("companies",)},
+    "special_codes:item": {"entity": "special_codes", "variant": "item", "per": "company", "after": ("companies",)},
+    "campaigns": {"entity": "campaigns", "per": "period", "after": ("companies",)},
+}
+
+# Company targets with the period campaigns are read from: the default period, else the latest active one
+TARGETS_SQL = """
+    SELECT DISTINCT ON (c.id) c.id AS company_id, c.logo_nr, p.id AS period_id, p.logo_period_nr
+    FROM companies c
+    LEFT JOIN periods p ON p.company_id = c.id AND p.is_active
+    WHERE c.is_active {filter}
+    ORDER BY c.id, p.is_default DESC NULLS LAST, p.logo_period_nr DESC NULLS LAST
+"""
+
+
+async def _broadcast(message: dict):
+    # Lazy import: the realtime endpoint module imports the API stack
+    from ..api.v1.endpoints.pdks.realtime import manager
+    try:
+        await manager.broadcast(message)
+    except Exception as e:
+        logger.debug(f"Sync progress broadcast failed: {e}")
+
+
+class SyncOrchestrator:
+    """
+    Runs the whole Logo master-data sync as one checkpointed run: the companies step
+    first, then every (entity, company) step concurrently under a connection budget
+    (each running step holds one Logo and one PostgreSQL connection).
+    Per-step progress (rows/sec, ETA) is pushed over the realtime websocket; step state
+    and the last merged LOGICALREF are stored, so a failed run resumes where it stopped.
+    """
+
+    def __init__(self):
+        self._tasks = {}  # run_id -> asyncio.Task
+        self._live = {}   # run_id -> {(step, company_id): progress}
+
+    # --- checkpoints ---
+
+    async def _save_step(self, run_id: str, step: str, company_id: int, status: str, **fields):
+        columns = ["status", *fields]
+        values = [status, *(json.dumps(v, default=str) if k == "result" else v for k, v in fields.items())]
+        stamps = ""
+        if status == "running":
+            stamps = ", started_at = COALESCE(master_sync_run_steps.started_at, CURRENT_TIMESTAMP)"
+        elif status in ("done", "failed", "skipped"):
+            stamps = ", finished_at = CURRENT_TIMESTAMP"
+        await db_manager.execute_pg_query_async(f"""
+            INSERT INTO master_sync_run_steps (run_id, step, company_id, {', '.join(columns)})
+            VALUES (%s, %s, %s, {', '.join(['%s'] * len(columns))})
+            ON CONFLICT (run_id, step, company_id) DO UPDATE
+            SET {', '.join(f'{c} = EXCLUDED.{c}' for c in columns)}{stamps}
+        """, (run_id, step, company_id, *values), fetch=False)
+
+    async def _steps(self, run_id: str) -> dict:
+        rows = await db_manager.execute_pg_query_async(
+            "SELECT * FROM master_sync_run_steps WHERE run_id = %s ORDER BY step, company_id", (run_id,)
+        )
+        return {(r["step"], r["company_id"]): r for r in rows or []}
+
+    async def _finish_run(self, run_id: str, status: str, error: str = None):
+        await db_manager.execute_pg_query_async(
+            "UPDATE master_sync_runs SET status = %s, error = %s, finished_at = CURRENT_TIMESTAMP WHERE run_id = %s",
+            (status, error, run_id), fetch=False
+        )
+        await _broadcast({"type": "master_sync_run", "run_id": run_id, "status": status, "error": error})
+
+    # --- steps ---
+
+    def _progress(self, run_id: str, step: str, company_id: int):
+        """Progress callback for master_data_sync.sync: checkpoint every page, broadcast throttled"""
+        started = time.monotonic()
+        state = {"sent": 0.0}
+
+        async def report(p: dict):
+            elapsed = time.monotonic() - started
+            rate = p["fetched"] / elapsed if elapsed > 0 else None
+            expected = p.get("expected")
+            live = {
+                "type": "master_sync_progress", "run_id": run_id, "step": step, "company_id": company_id,
+                "status": "running", "mode": p["mode"], "fetched": p["fetched"], "expected": expected,
+                "rows_per_sec": round(rate, 1) if rate else None,
+                "eta_seconds": round(max(expected - p["fetched"], 0) / rate, 1) if rate and expected is not None else None,
+            }
+            self._live.setdefault(run_id, {})[(step, company_id)] = live
+            await self._save_step(run_id, step, company_id, "running", mode=p["mode"], last_ref=p["last_ref"], fetched=p["fetched"])
+            now = time.monotonic()
+            if now - state["sent"] >= settings.MASTER_SYNC_PROGRESS_INTERVAL:
+                state["sent"] = now
+                await _broadcast(live)
+
+        return report
+
+    async def _run_companies(self) -> dict:
+        result = await company_sync.sync()
+        return {
+            "synced_companies": result["synced_companies"],
+            "synced_periods": result["synced_periods"],
+            "duration_ms": result["duration_ms"],
+            **{table: {k: len(v) if isinstance(v, list) else v for k, v in d.items()} for table, d in result["diff"].items()},
+        }
+
+    async def _run_step(self, run_id: str, step: str, target: dict, mode: str, checkpoint) -> dict:
+        plan = SYNC_PLAN[step]
+        if step == "companies":
+            return await self._run_companies()
+        company_id = target["company_id"]
+        scope = {"company_id": company_id}
+        if plan.get("variant"):
+            scope["specode_type"] = plan["variant"]
+        period = None
+        if plan["per"] == "period":
+            scope["period_id"] = target["period_id"]
+            period = str(target["logo_period_nr"]).zfill(2)
+        start_after = 0
+        if checkpoint and checkpoint["last_ref"] and checkpoint["mode"] in ("full", "incremental"):
+            # Resume the interrupted pass in the mode it was started with
+            start_after, mode = checkpoint["last_ref"], checkpoint["mode"]
+        return await master_data_sync.sync(
+            plan["entity"], scope, str(target["logo_nr"]).zfill(3), period=period, variant=plan.get("variant"),
+            mode=mode, start_after=start_after, progress=self._progress(run_id, step, company_id)
+        )
+
+    async def _execute(self, run_id: str, mode: str, company_ids: list, concurrency: int):
+        sem = asyncio.Semaphore(concurrency)
+        checkpoints = await self._steps(run_id)
+        done = {}  # (step, company_id) -> Future[bool], True when the step succeeded
+
+        async def run(step: str, company_id: int, target: dict):
+            key = (step, company_id)
+            deps = [(d, company_id if SYNC_PLAN[d]["per"] else 0) for d in SYNC_PLAN[step]["after"]]
+            ok = all([await done[d] for d in deps if d in done])
+            checkpoint = checkpoints.get(key)
+            if checkpoint and checkpoint["status"] == "done":
+                done[key].set_result(True)
+                return
+            if not ok:
+                await self._save_step(run_id, step, company_id, "skipped", error="dependency failed")
+                done[key].set_result(False)
+                return
+            async with sem:
+                await self._save_step(run_id, step, company_id, "running")
+                try:
+                    result = await self._run_step(run_id, step, target, mode, checkpoint)
+                    await self._save_step(run_id, step, company_id, "done", result=result)
+                    status, error = "done", None
+                except Exception as e:
+                    error = str(e)
+                    logger.error(f"Sync run {run_id}: {step} (company {company_id}) failed: {error}")
+                    await self._save_step(run_id, step, company_id, "failed", error=error)
+                    status = "failed"
+            self._live.get(run_id, {}).pop(key, None)
+            await _broadcast({"type": "master_sync_progress", "run_id": run_id, "step": step,
+                              "company_id": company_id, "status": status, "error": error})
+            done[key].set_result(status == "done")
+
+        loop = asyncio.get_running_loop()
+        global_steps = [s for s, plan in SYNC_PLAN.items() if plan["per"] is None]
+        for step in global_steps:
+            done[(step, 0)] = loop.create_future()
+        # Global steps (companies) first: they decide which companies the other steps run for
+        await asyncio.gather(*[run(step, 0, {}) for step in global_steps])
+
+        company_filter, params = "", ()
+        if company_ids:
+            company_filter, params = "AND c.id = ANY(%s)", (company_ids,)
+        targets = await db_manager.execute_pg_query_async(TARGETS_SQL.format(filter=company_filter), params) or []
+        jobs = []
+        for target in targets:
+            for step, plan in SYNC_PLAN.items():
+                if plan["per"] is None or (plan["per"] == "period" and target["period_id"] is None):
+                    continue
+                done[(step, target["company_id"])] = loop.create_future()
+                jobs.append(run(step, target["company_id"], target))
+        await asyncio.gather(*jobs)
+
+        results = [f.result() for f in done.values()]
+        return "done" if all(results) else "failed", len(results), results.count(False)
+
+    async def _main(self, run_id: str, mode: str, company_ids: list, concurrency: int):
+        start = time.monotonic()
+        try:
+            status, steps, failed = await self._execute(run_id, mode, company_ids, concurrency)
+            error = f"{failed} of {steps} steps failed" if failed else None
+            logger.info(f"Sync run {run_id} {status}: {steps} steps in {time.monotonic() - start:.1f}s")
+        except Exception as e:
+            logger.error(f"Sync run {run_id} aborted: {e}")
+            status, error = "failed", str(e)
+        self._live.pop(run_id, None)
+        await self._finish_run(run_id, status, error)
+
+    def _launch(self, run_id: str, mode: str, company_ids: list, concurrency: int):
+        task = asyncio.create_task(self._main(run_id, mode, company_ids, concurrency))
+        self._tasks[run_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(run_id, None))
+
+    # --- public ---
+
+    async def start(self, mode: str = "auto", company_ids: list = None, concurrency: int = None) -> str:
+        """Start a run in the background; returns its run_id"""
+        if not await master_data_sync.ensure_schema():
+            raise RuntimeError("master_sync schema could not be created")
+        limit = max(1, min(concurrency or settings.MASTER_SYNC_CONCURRENCY, settings.MASTER_SYNC_CONCURRENCY))
+        run_id = str(uuid.uuid4())
+        created = await db_manager.execute_pg_query_async(
+            "INSERT INTO master_sync_runs (run_id, mode, company_ids, concurrency) VALUES (%s, %s, %s, %s)",
+            (run_id, mode, company_ids or None, limit), fetch=False
+        )
+        if not created:
+            raise RuntimeError("Sync run could not be recorded")
+        self._launch(run_id, mode, company_ids, limit)
+        return run_id
+
+    async def resume(self, run_id: str) -> str:
+        """Re-run the unfinished steps of a failed or interrupted run"""
+        if run_id in self._tasks:
+            raise ValueError("Run is still in progress")
+        rows = await db_manager.execute_pg_query_async("SELECT * FROM master_sync_runs WHERE run_id = %s", (run_id,))
+        if not rows:
+            raise KeyError(run_id)
+        run = rows[0]
+        if run["status"] == "done":
+            raise ValueError("Run already completed")
+        await db_manager.execute_pg_query_async(
+            "UPDATE master_sync_runs SET status = 'running', error = NULL, finished_at = NULL WHERE run_id = %s",
+            (run_id,), fetch=False
+        )
+        self._launch(run_id, run["mode"], run["company_ids"], run["concurrency"])
+        return run_id
+
+    async def get(self, run_id: str):
+        await master_data_sync.ensure_schema()
+        rows = await db_manager.execute_pg_query_async("SELECT * FROM master_sync_runs WHERE run_id = %s", (run_id,))
+        if not rows:
+            return None
+        live = self._live.get(run_id, {})
+        steps = [
+            {**s, **({"progress": live[key]} if key in live else {})}
+            for key, s in (await self._steps(run_id)).items()
+        ]
+        return {**rows[0], "active": run_id in self._tasks, "steps": steps}
+
+    async def runs(self, limit: int = 20) -> list:
+        await master_data_sync.ensure_schema()
+        rows = await db_manager.execute_pg_query_async(
+            "SELECT * FROM master_sync_runs ORDER BY started_at DESC LIMIT %s", (limit,)
+        )
+        return rows or []
+
+
+sync_orchestrator = SyncOrchestrator()
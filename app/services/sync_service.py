@@ -1,54 +1,200 @@
 import json
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from loguru import logger
 from ..core.database import db_manager
 from ..core.config import settings
 from .logo_service import logo_service
+from .single_flight import report_flight
+from .report_catalog import report_catalog
+from . import snapshot_codec
+
+# Reports that can be refreshed from a watermark instead of a full re-query
+# (the "incremental" entries of report_catalog.REPORTS).
+#   watermark: "date" -> re-read buckets from (last DATE_ - lookback_days) and replace them
+#              "ref"  -> read rows with LOGICALREF > last and add them to the stored sums
+# A full rebuild runs the same query from the initial watermark.
+INCREMENTAL_REPORTS = report_catalog.incremental_specs()
+
+INITIAL_WATERMARK = {"date": datetime(1900, 1, 1), "ref": 0}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _format_watermark(value):
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _jsonable(rows):
+    """Round-trip through JSON so fresh rows compare equal to stored ones"""
+    return json.loads(json.dumps(rows, default=_json_default))
+
 
 class ReportSyncService:
     def __init__(self):
-        pass
+        self._schema_ready = False
 
-    async def generate_and_save_snapshot(self, report_code: str, firma: str = None, period: str = None):
+    async def ensure_schema(self):
+        if self._schema_ready:
+            return True
+        path = os.path.join(os.path.dirname(__file__), "..", "..", "sql", "report_snapshots.sql")
+        with open(path, "r", encoding="utf-8") as f:
+            ddl = f.read()
+        self._schema_ready = bool(await db_manager.execute_pg_query_async(ddl, fetch=False))
+        return self._schema_ready
+
+    async def generate_and_save_snapshot(self, report_code: str, firma: str = None, period: str = None, full: bool = False):
         """EXFIN Raporunun bir snapshot'ını alıp PostgreSQL'e kaydeder"""
         f = firma or settings.LOGO_FIRMA_NO
         p = period or settings.LOGO_PERIOD_NO
+        # Concurrent refreshes of the same snapshot share one run
+        return await report_flight.do(
+            ("snapshot", report_code, f, p, full),
+            lambda: self._generate_and_save_snapshot(report_code, f, p, full)
+        )
+
+    async def _generate_and_save_snapshot(self, report_code: str, f: str, p: str, full: bool = False):
+        await self.ensure_schema()
         tenant_id = f"{f}_{p}"
+        spec = INCREMENTAL_REPORTS.get(report_code)
+        if spec:
+            return await self._refresh_incremental(report_code, spec, f, p, full)
 
         logger.info(f"Generating snapshot for {report_code} (Tenant: {tenant_id})")
         
         # 1. Fetch data from Logo (MSSQL)
-        data = await logo_service.get_report_data(report_code, firma=f, period=p)
+        # Uncached: a refresh must not re-save a cached result as a new version
+        data = await logo_service.query_report_data(report_code, firma=f, period=p)
         
         if data is None:
             logger.error(f"Failed to fetch data for report {report_code}")
             return False
 
         # 2. Save/Update snapshot in PostgreSQL
+        success = await self._save(report_code, tenant_id, _jsonable(data), watermark=None, full=True)
+        if success:
+            logger.info(f"Snapshot for {report_code} saved successfully.")
+            return {"mode": "full", "fetched": len(data), "rows": len(data)}
+        return False
+
+    async def _save(self, report_code: str, tenant_id: str, data, watermark, full: bool):
         query = """
-            INSERT INTO report_snapshots (report_code, tenant_id, snapshot_data, version_id)
-            VALUES (%s, %s, %s, 1)
+            INSERT INTO report_snapshots (report_code, tenant_id, snapshot_data, snapshot_blob, snapshot_encoding, row_count,
+                                          version_id, watermark, last_full_at)
+            VALUES (%s, %s, NULL, %s, %s, %s, 1, %s, CURRENT_TIMESTAMP)
             ON CONFLICT (report_code, tenant_id) DO UPDATE
-            SET snapshot_data = EXCLUDED.snapshot_data,
+            SET snapshot_data = NULL,
+                snapshot_blob = EXCLUDED.snapshot_blob,
+                snapshot_encoding = EXCLUDED.snapshot_encoding,
+                row_count = EXCLUDED.row_count,
                 version_id = report_snapshots.version_id + 1,
+                watermark = EXCLUDED.watermark,
+                last_full_at = CASE WHEN %s THEN CURRENT_TIMESTAMP ELSE report_snapshots.last_full_at END,
                 updated_at = CURRENT_TIMESTAMP
         """
-        success = db_manager.execute_pg_query(query, (report_code, tenant_id, json.dumps(data)), fetch=False)
-        
-        if success:
-            logger.info(f"Snapshot for {report_code} saved successfully.")
-        return success
+        blob, encoding = snapshot_codec.encode(data)
+        return await db_manager.execute_pg_query_async(
+            query, (report_code, tenant_id, blob, encoding, len(data), _format_watermark(watermark), full), fetch=False
+        )
+
+    @staticmethod
+    def _stored_rows(row) -> list:
+        """Rows of a stored snapshot, whichever format it was written in"""
+        if row.get("snapshot_blob") is not None:
+            return snapshot_codec.to_rows(snapshot_codec.decode(row["snapshot_blob"], row["snapshot_encoding"]))
+        data = row.get("snapshot_data") or []
+        return json.loads(data) if isinstance(data, str) else data
+
+    async def _refresh_incremental(self, report_code: str, spec: dict, f: str, p: str, full: bool):
+        """Fetch only rows past the stored watermark and merge them into the snapshot"""
+        tenant_id = f"{f}_{p}"
+        kind = spec["watermark"]
+        stored = None
+        if not full:
+            res = await db_manager.execute_pg_query_async(
+                "SELECT snapshot_data, snapshot_blob, snapshot_encoding, watermark FROM report_snapshots WHERE report_code = %s AND tenant_id = %s",
+                (report_code, tenant_id)
+            )
+            if res and res[0].get("watermark"):
+                stored = res[0]
+        full = stored is None
+
+        if full:
+            since = INITIAL_WATERMARK[kind]
+        elif kind == "date":
+            # late-posted documents land on recent days; re-read a short window
+            since = datetime.fromisoformat(stored["watermark"]) - timedelta(days=settings.SNAPSHOT_DATE_LOOKBACK_DAYS)
+        else:
+            since = int(stored["watermark"])
+
+        logger.info(f"{'Full' if full else 'Incremental'} snapshot for {report_code} (Tenant: {tenant_id}, since {since})")
+        sql, _ = report_catalog.compile(report_code, f, p, "incremental")
+        delta = await db_manager.execute_ms_query_async(sql, (since,))
+        if delta is None:
+            logger.error(f"Failed to fetch data for report {report_code}")
+            return False
+
+        marks = [r.pop("_WM") for r in delta if r.get("_WM") is not None]
+        delta = _jsonable(delta)
+        keys = spec["keys"]
+        key_of = lambda row: tuple(row.get(k) for k in keys)
+
+        if full:
+            merged = delta
+            watermark = max(marks) if marks else since
+        else:
+            data = self._stored_rows(stored)
+            index = {key_of(r): r for r in data}
+            for row in delta:
+                k = key_of(row)
+                if kind == "ref" and k in index:
+                    current = index[k]
+                    for col in spec["sums"]:
+                        current[col] = (current.get(col) or 0) + (row.get(col) or 0)
+                else:
+                    index[k] = row  # date buckets in the window are recomputed whole
+            merged = list(index.values())
+            previous = datetime.fromisoformat(stored["watermark"]) if kind == "date" else int(stored["watermark"])
+            watermark = max(marks + [previous])
+
+        success = await self._save(report_code, tenant_id, merged, watermark, full)
+        if not success:
+            return False
+        logger.info(f"Snapshot for {report_code} saved ({len(delta)} rows fetched, {len(merged)} total).")
+        return {"mode": "full" if full else "incremental", "fetched": len(delta), "rows": len(merged), "watermark": _format_watermark(watermark)}
 
     async def get_latest_snapshot(self, report_code: str, firma: str = None, period: str = None):
         """En son kaydedilen snapshot dökümünü getirir"""
         f = firma or settings.LOGO_FIRMA_NO
         p = period or settings.LOGO_PERIOD_NO
         tenant_id = f"{f}_{p}"
+        await self.ensure_schema()
 
-        query = "SELECT snapshot_data, version_id, updated_at FROM report_snapshots WHERE report_code = %s AND tenant_id = %s"
-        result = db_manager.execute_pg_query(query, (report_code, tenant_id))
+        query = """
+            SELECT snapshot_data, snapshot_blob, snapshot_encoding, row_count, version_id, updated_at
+            FROM report_snapshots WHERE report_code = %s AND tenant_id = %s
+        """
+        result = await db_manager.execute_pg_query_async(query, (report_code, tenant_id))
         
         if result and len(result) > 0:
-            return result[0]
+            snapshot = result[0]
+            if snapshot.get("snapshot_blob") is None:
+                # written before the compact format; encode on the fly
+                rows = self._stored_rows(snapshot)
+                snapshot["snapshot_blob"], snapshot["snapshot_encoding"] = snapshot_codec.encode(rows)
+                snapshot["row_count"] = len(rows)
+            snapshot["snapshot_blob"] = bytes(snapshot["snapshot_blob"])
+            snapshot.pop("snapshot_data", None)
+            return snapshot
         return None
 
 sync_service = ReportSyncService()
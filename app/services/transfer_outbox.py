@@ -0,0 +1,339 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from loguru import logger
+from ..core.database import db_manager
+from ..core.config import settings
+from .logo_service import logo_service
+
+
+# Handlers run against the job's own firma/period; `timeout` bounds the Unity call itself
+# (a timed-out session is retired) and TimeoutError means the document may have been posted.
+
+async def _run_invoice(payload, firma, period, timeout):
+    ok = await logo_service.transfer_invoice_to_logo(
+        payload["local_invoice_id"], invoice_type=payload.get("invoice_type", "wholesale"),
+        firma=firma, period=period, timeout=timeout
+    )
+    return ok, None if ok else "Invoice transfer failed"
+
+
+async def _run_order(payload, firma, period, timeout):
+    ok = await logo_service.transfer_order_to_logo(payload["order_id"], firma=firma, period=period)
+    return ok, None if ok else "Order transfer failed"
+
+
+async def _run_dispatch(payload, firma, period, timeout):
+    return await logo_service._transfer_dispatch_via_objects(
+        payload["dispatch_data"], payload.get("items", []), firma=firma, period=period, timeout=timeout
+    )
+
+
+async def _run_collection(payload, firma, period, timeout):
+    return await logo_service._transfer_collection_via_objects(
+        payload["collection_data"], firma=firma, period=period, timeout=timeout
+    )
+
+
+HANDLERS = {
+    "invoice": _run_invoice,
+    "order": _run_order,
+    "dispatch": _run_dispatch,
+    "collection": _run_collection,
+}
+
+INVOICE_TRCODES = {"wholesale": 8, "retail": 7, "service": 9}
+
+
+async def _order_number(order_id):
+    rows = await db_manager.execute_pg_query_async("SELECT order_number FROM sales_orders WHERE id = %s", (order_id,))
+    return rows[0]["order_number"] if rows else None
+
+
+async def _fiche_key(kind: str, payload: dict):
+    """(Logo table suffix, FICHENO, TRCODEs) the transfer writes, or None when it has no natural key"""
+    if kind == "invoice":
+        number = await _order_number(payload["local_invoice_id"])
+        return number and ("INVOICE", number, (INVOICE_TRCODES.get(payload.get("invoice_type", "wholesale").lower(), 8),))
+    if kind == "order":
+        number = await _order_number(payload["order_id"])
+        return number and ("ORFICHE", number, (1,))
+    if kind == "dispatch":
+        number = payload["dispatch_data"].get("formatted_number")
+        return number and ("STFICHE", number, (7, 8))
+    return None
+
+
+class TransferOutboxService:
+    """
+    Durable outbox for Logo transfers (erp_outbox table, see sql/erp_outbox.sql).
+    The API only enqueues; a pool of asyncio workers pushes to Logo with bounded
+    concurrency per firm, exponential backoff and a dead-letter state.
+
+    A job whose outcome is unknown (timed out, or interrupted by a restart) is never
+    retried automatically: it goes to 'unknown' until an operator retries it. Before
+    every attempt the document's FICHENO is looked up in Logo, so a transfer that did
+    go through is marked done instead of being posted twice.
+    """
+
+    def __init__(self):
+        self.workers = settings.OUTBOX_WORKERS
+        self.per_firm = settings.OUTBOX_PER_FIRM_CONCURRENCY
+        self.max_attempts = settings.OUTBOX_MAX_ATTEMPTS
+        self._tasks = []
+        self._wakeup = None
+        self._claim_lock = None
+        self._running = {}  # firma -> jobs in progress in this process
+
+    # --- schema / lifecycle ---
+
+    async def ensure_schema(self):
+        path = os.path.join(os.path.dirname(__file__), "..", "..", "sql", "erp_outbox.sql")
+        with open(path, "r", encoding="utf-8") as f:
+            ddl = f.read()
+        return await db_manager.execute_pg_query_async(ddl, fetch=False)
+
+    async def start(self):
+        """Start the worker pool on the running event loop (called from the app lifespan)"""
+        if self._tasks or self.workers <= 0:
+            return
+        try:
+            await self.ensure_schema()
+            # Single API instance: anything still 'running' was interrupted by a restart and may have
+            # reached Logo, so it is parked instead of re-queued
+            await db_manager.execute_pg_query_async("""
+                UPDATE erp_outbox SET status = 'unknown', locked_at = NULL, updated_at = CURRENT_TIMESTAMP,
+                       last_error = 'Interrupted by a restart while running; outcome in Logo unknown'
+                WHERE status = 'running'
+            """, fetch=False)
+        except Exception as e:
+            logger.error(f"Outbox init failed: {e}")
+        self._wakeup = asyncio.Event()
+        self._claim_lock = asyncio.Lock()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"ERP outbox started ({self.workers} workers, {self.per_firm} per firm)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("ERP outbox stopped")
+
+    # --- producer side ---
+
+    @staticmethod
+    def _default_key(kind: str, firma: str, payload: dict) -> str:
+        body = json.dumps(payload, sort_keys=True, default=str)
+        return f"{kind}:{firma}:" + hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    async def enqueue(self, kind: str, payload: dict, idempotency_key: str = None, firma: str = None, period: str = None):
+        """
+        Queue a transfer and return its job row. A repeated idempotency key (by default a
+        hash of the payload) returns the existing job instead of creating a duplicate.
+        """
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown transfer kind: {kind}")
+        f = str(firma or logo_service.firma_no)
+        p = str(period or logo_service.period_no)
+        key = idempotency_key or self._default_key(kind, f, payload)
+
+        rows = await db_manager.execute_pg_query_async("""
+            INSERT INTO erp_outbox (idempotency_key, kind, firma, period, payload, max_attempts)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (idempotency_key) DO NOTHING
+            RETURNING id, status, attempts, created_at
+        """, (key, kind, f, p, json.dumps(payload, default=str), self.max_attempts))
+        if rows:
+            if self._wakeup is not None:
+                self._wakeup.set()
+            return {**rows[0], "duplicate": False}
+
+        rows = await db_manager.execute_pg_query_async(
+            "SELECT id, status, attempts, created_at FROM erp_outbox WHERE idempotency_key = %s", (key,)
+        )
+        if not rows:
+            return None
+        return {**rows[0], "duplicate": True}
+
+    # --- status ---
+
+    async def get_job(self, job_id: str):
+        rows = await db_manager.execute_pg_query_async("""
+            SELECT id, idempotency_key, kind, firma, period, status, attempts, max_attempts,
+                   next_attempt_at, last_error, result, created_at, updated_at
+            FROM erp_outbox WHERE id = %s
+        """, (job_id,))
+        return rows[0] if rows else None
+
+    async def list_jobs(self, status: str = None, kind: str = None, limit: int = 100):
+        conditions, params = [], []
+        if status:
+            conditions.append("status = %s")
+            params.append(status)
+        if kind:
+            conditions.append("kind = %s")
+            params.append(kind)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+        return await db_manager.execute_pg_query_async(f"""
+            SELECT id, kind, firma, period, status, attempts, next_attempt_at, last_error, created_at, updated_at
+            FROM erp_outbox {where} ORDER BY created_at DESC LIMIT %s
+        """, tuple(params))
+
+    async def retry(self, job_id: str):
+        """Put a dead-lettered or unknown-outcome job back in the queue (its FICHENO is checked in Logo first)"""
+        rows = await db_manager.execute_pg_query_async("""
+            UPDATE erp_outbox SET status = 'pending', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP,
+                   updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND status IN ('dead', 'unknown')
+            RETURNING id, status
+        """, (job_id,))
+        if rows and self._wakeup is not None:
+            self._wakeup.set()
+        return rows[0] if rows else None
+
+    async def stats(self) -> dict:
+        rows = await db_manager.execute_pg_query_async("SELECT status, COUNT(*) AS count FROM erp_outbox GROUP BY status")
+        return {
+            "queue": {r["status"]: r["count"] for r in rows or []},
+            "workers": len(self._tasks),
+            "per_firm_limit": self.per_firm,
+            "in_progress": dict(self._running),
+        }
+
+    # --- consumer side ---
+
+    async def _claim(self):
+        """Lock the oldest due job whose firm still has a free slot"""
+        async with self._claim_lock:
+            busy = [f for f, n in self._running.items() if n >= self.per_firm]
+            rows = await db_manager.execute_pg_query_async("""
+                UPDATE erp_outbox SET status = 'running', attempts = attempts + 1,
+                       locked_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = (
+                    SELECT id FROM erp_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                      AND NOT (firma = ANY(%s))
+                    ORDER BY next_attempt_at, created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, kind, firma, period, payload, attempts, max_attempts
+            """, (busy,))
+            if not rows:
+                return None
+            job = rows[0]
+            self._running[job["firma"]] = self._running.get(job["firma"], 0) + 1
+            return job
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(settings.OUTBOX_BACKOFF_MAX, settings.OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _posted_ref(self, job, payload):
+        """LOGICALREF of the document if Logo already has it, else None"""
+        key = await _fiche_key(job["kind"], payload)
+        if not key:
+            return None
+        table, fiche_no, tr_codes = key
+        rows = await db_manager.execute_ms_query_async(
+            f"SELECT TOP 1 LOGICALREF FROM LG_{job['firma']}_{job['period']}_{table} (NOLOCK) "
+            f"WHERE FICHENO = %s AND TRCODE IN ({', '.join(['%s'] * len(tr_codes))})",
+            (fiche_no, *tr_codes)
+        )
+        if rows is None:
+            raise RuntimeError(f"Could not check Logo for {fiche_no}")
+        return rows[0]["LOGICALREF"] if rows else None
+
+    async def _park_unknown(self, job, info: str):
+        await db_manager.execute_pg_query_async("""
+            UPDATE erp_outbox SET status = 'unknown', last_error = %s, locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (info, job["id"]), fetch=False)
+        logger.error(f"Outbox job {job['id']} ({job['kind']}) outcome unknown, not retried: {info}")
+
+    async def _process(self, job):
+        payload = job["payload"]
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        timeout = settings.OUTBOX_JOB_TIMEOUT
+        try:
+            ref = await self._posted_ref(job, payload)
+            if ref is not None:
+                ok, info = True, ref
+                logger.warning(f"Outbox job {job['id']} ({job['kind']}) already in Logo (ref {ref}), not posted again")
+            else:
+                # The Unity call gets `timeout` itself (and retires its session); the outer bound only
+                # covers session checkout on top of it
+                ok, info = await asyncio.wait_for(
+                    HANDLERS[job["kind"]](payload, job["firma"], job["period"], timeout),
+                    timeout=timeout + settings.UNITY_POOL_ACQUIRE_TIMEOUT
+                )
+        except (asyncio.TimeoutError, FutureTimeoutError):
+            await self._park_unknown(job, f"Timed out after {timeout}s; the document may have been posted")
+            return
+        except Exception as e:
+            ok, info = False, str(e)
+
+        if ok:
+            await db_manager.execute_pg_query_async("""
+                UPDATE erp_outbox SET status = 'done', result = %s, last_error = NULL,
+                       locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (json.dumps({"ref": info}, default=str), job["id"]), fetch=False)
+            logger.info(f"Outbox job {job['id']} ({job['kind']}) done")
+            return
+
+        if job["attempts"] >= job["max_attempts"]:
+            await db_manager.execute_pg_query_async("""
+                UPDATE erp_outbox SET status = 'dead', last_error = %s, locked_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (str(info), job["id"]), fetch=False)
+            logger.error(f"Outbox job {job['id']} ({job['kind']}) dead-lettered after {job['attempts']} attempts: {info}")
+            return
+
+        delay = self._backoff(job["attempts"])
+        await db_manager.execute_pg_query_async("""
+            UPDATE erp_outbox SET status = 'pending', last_error = %s, locked_at = NULL,
+                   next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %s), updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (str(info), delay, job["id"]), fetch=False)
+        logger.warning(f"Outbox job {job['id']} ({job['kind']}) attempt {job['attempts']} failed, retry in {delay:.0f}s: {info}")
+
+    async def _worker(self, n: int):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker {n} claim failed: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker {n} failed on job {job['id']}: {e}")
+            finally:
+                self._running[job["firma"]] -= 1
+                if self._running[job["firma"]] <= 0:
+                    del self._running[job["firma"]]
+                # a firm slot was freed; let idle workers look again
+                self._wakeup.set()
+
+
+transfer_outbox = TransferOutboxService()
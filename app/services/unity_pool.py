@@ -0,0 +1,442 @@
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from loguru import logger
+from ..core.config import settings
+
+# Try to import win32com for Logo Objects
+try:
+    import win32com.client
+    import pythoncom
+    HAS_WIN32 = True
+except ImportError:
+    HAS_WIN32 = False
+    logger.warning("pywin32 not found. Logo Objects mode will be disabled.")
+
+
+class UnityLoginError(Exception):
+    """Raised when a Unity Objects session could not be opened"""
+    pass
+
+
+# =====================================================
+# BACKENDS (COM layer behind a small interface)
+# =====================================================
+
+class UnityBackend:
+    """
+    What the session pool needs from Unity Objects. Every method is called on the
+    session's own thread, so COM objects never cross apartments.
+    """
+    available = False
+
+    def thread_init(self):
+        pass
+
+    def thread_exit(self):
+        pass
+
+    def login(self, firma: str, period: str):
+        """Return a logged-in UnityApplication (or raise UnityLoginError)"""
+        raise NotImplementedError
+
+    def is_alive(self, app) -> bool:
+        raise NotImplementedError
+
+    def logout(self, app):
+        raise NotImplementedError
+
+
+class ComUnityBackend(UnityBackend):
+    """UnityObjects.UnityApplication via pywin32 (Windows only)"""
+    available = HAS_WIN32
+
+    def thread_init(self):
+        pythoncom.CoInitialize()
+
+    def thread_exit(self):
+        pythoncom.CoUninitialize()
+
+    def login(self, firma: str, period: str):
+        # Priority: JSON > Settings/Env
+        logo_config = next((c for c in settings.DB_CONFIGS if c.get("Name") == "LOGO_Database"), {})
+        unity = win32com.client.Dispatch("UnityObjects.UnityApplication")
+
+        # DYNAMIC SQL CONNECTION (Overrides LCONFIG.EXE)
+        db_server = logo_config.get("Server")
+        db_name = logo_config.get("Database")
+        if db_server and db_name:
+            try:
+                unity.SQLInfo = (db_server, db_name, logo_config.get("User"), logo_config.get("Password"))
+            except Exception as e:
+                logger.warning(f"Failed to set Unity SQLInfo (Might use LCONFIG defaults): {e}")
+
+        user = logo_config.get("AppUser", settings.LOGO_APP_USER)
+        password = logo_config.get("AppPass", settings.LOGO_APP_PASS)
+        if not unity.Login(user, password, int(firma), int(period)):
+            raise UnityLoginError(f"Unity Login Failed: {unity.GetLastError()} - {unity.GetLastErrorString()}")
+        return unity
+
+    def is_alive(self, app) -> bool:
+        try:
+            return bool(app.Connected)
+        except Exception:
+            return False
+
+    def logout(self, app):
+        try:
+            app.Logout()
+        except Exception:
+            pass
+        try:
+            app.Disconnect()
+        except Exception:
+            pass
+
+
+class _FakeField:
+    def __init__(self):
+        self.Value = None
+        self.Lines = _FakeLines()
+
+
+class _FakeFields:
+    def __init__(self):
+        self._fields = {}
+
+    def FieldByName(self, name):
+        return self._fields.setdefault(name, _FakeField())
+
+
+class _FakeLines(_FakeFields):
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+
+    def AppendLine(self):
+        self._fields = {}
+        self.rows.append(self._fields)
+
+
+class _FakeDataObject:
+    _refs = itertools.count(1)
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.DataFields = _FakeFields()
+        self.ErrorCode = 0
+
+    def New(self):
+        self.DataFields = _FakeFields()
+
+    def Post(self):
+        self.DataFields.FieldByName("INTERNAL_REFERENCE").Value = next(self._refs)
+        return 1
+
+    def ValidateErrors(self, index):
+        return ""
+
+
+class _FakeUnityApp:
+    def __init__(self, firma, period):
+        self.firma = firma
+        self.period = period
+        self.Connected = True
+        self.posted = 0
+
+    def NewDataObject(self, kind):
+        self.posted += 1
+        return _FakeDataObject(kind)
+
+    def DataFromXML(self, xml_content):
+        return True
+
+    def GetLastError(self):
+        return 0
+
+    def GetLastErrorString(self):
+        return ""
+
+
+class FakeUnityBackend(UnityBackend):
+    """
+    Pure-Python stand-in for Unity Objects (tests / benchmarks on Linux).
+    `login_delay` simulates the cost of a real Login call.
+    """
+    available = True
+
+    def __init__(self, login_delay: float = 0.0):
+        self.login_delay = login_delay
+        self.logins = 0
+
+    def login(self, firma: str, period: str):
+        time.sleep(self.login_delay)
+        self.logins += 1
+        return _FakeUnityApp(firma, period)
+
+    def is_alive(self, app) -> bool:
+        return app.Connected
+
+    def logout(self, app):
+        app.Connected = False
+
+
+# =====================================================
+# SESSION POOL
+# =====================================================
+
+class UnitySession:
+    """One logged-in Unity application pinned to its own worker thread"""
+
+    def __init__(self, backend: UnityBackend, firma: str, period: str):
+        self.backend = backend
+        self.key = (str(firma), str(period))
+        self.app = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"unity-{firma}-{period}", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        self.backend.thread_init()
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                func, fut = job
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                try:
+                    fut.set_result(func())
+                except BaseException as e:
+                    fut.set_exception(e)
+        finally:
+            if self.app is not None:
+                self.backend.logout(self.app)
+                self.app = None
+            self.backend.thread_exit()
+
+    def submit(self, func) -> Future:
+        """Run `func()` on the session thread"""
+        fut = Future()
+        self._jobs.put((func, fut))
+        return fut
+
+    def login(self, timeout: float = None):
+        def _login():
+            self.app = self.backend.login(*self.key)
+        self.submit(_login).result(timeout)
+
+    def is_alive(self, timeout: float = 10.0) -> bool:
+        try:
+            return self.submit(lambda: self.app is not None and self.backend.is_alive(self.app)).result(timeout)
+        except Exception:
+            return False
+
+    def close(self):
+        """Logout and stop the thread (after queued work finishes)"""
+        self._jobs.put(None)
+
+
+class UnitySessionPool:
+    """
+    Pre-authenticated Unity Objects sessions keyed by (firma, period).
+    Sessions are reused across transfers, health-checked after being idle,
+    logged out after `idle_timeout` and capped at `max_size` in total.
+    """
+
+    def __init__(self, backend: UnityBackend, max_size: int = 4, idle_timeout: float = 600.0,
+                 health_interval: float = 60.0, acquire_timeout: float = 60.0):
+        self.backend = backend
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._idle = {}     # key -> [UnitySession]
+        self._size = 0
+        self._reaper = None
+        self._stats = {"logins": 0, "login_failures": 0, "reuses": 0, "health_failures": 0, "idle_logouts": 0, "timeouts": 0}
+
+    @property
+    def available(self) -> bool:
+        return self.backend.available
+
+    def _evict_one_idle_locked(self):
+        """Free a slot by closing the least recently used idle session of any key"""
+        candidates = [(s.last_used, key, s) for key, lst in self._idle.items() for s in lst]
+        if not candidates:
+            return None
+        _, key, session = min(candidates, key=lambda c: c[0])
+        self._idle[key].remove(session)
+        self._size -= 1
+        return session
+
+    def acquire(self, firma, period, timeout: float = None) -> UnitySession:
+        """Borrow a logged-in session (blocking). Logs in a new one when none is idle."""
+        key = (str(firma), str(period))
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            evicted = None
+            session = None
+            with self._cond:
+                while True:
+                    if self._idle.get(key):
+                        session = self._idle[key].pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1  # reserve the slot, login happens outside the lock
+                        break
+                    evicted = self._evict_one_idle_locked()
+                    if evicted is not None:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise UnityLoginError(f"No Unity session available for {key} within {timeout}s")
+                    self._cond.wait(remaining)
+            if evicted is not None:
+                evicted.close()
+
+            if session is None:
+                session = UnitySession(self.backend, *key)
+                try:
+                    session.login(timeout=max(1.0, deadline - time.monotonic()))
+                except Exception as e:
+                    session.close()
+                    with self._cond:
+                        self._size -= 1
+                        self._stats["login_failures"] += 1
+                        self._cond.notify()
+                    raise UnityLoginError(str(e)) from e
+                with self._cond:
+                    self._stats["logins"] += 1
+                self._ensure_reaper()
+                return session
+
+            if time.monotonic() - session.last_used > self.health_interval and not session.is_alive():
+                session.close()
+                with self._cond:
+                    self._size -= 1
+                    self._stats["health_failures"] += 1
+                    self._cond.notify()
+                continue
+            with self._cond:
+                self._stats["reuses"] += 1
+            return session
+
+    def release(self, session: UnitySession, broken: bool = False):
+        session.last_used = time.monotonic()
+        session.uses += 1
+        if broken:
+            session.close()
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.setdefault(session.key, []).append(session)
+            self._cond.notify()
+
+    def run_sync(self, firma, period, func, timeout: float = None):
+        """Run `func(app)` on a pooled session and return its result (blocking)"""
+        session = self.acquire(firma, period)
+        broken = False
+        try:
+            return session.submit(lambda: func(session.app)).result(timeout)
+        except FutureTimeoutError:
+            broken = True  # still busy on its thread; retire it once the call returns
+            raise
+        except Exception:
+            broken = not session.is_alive()
+            raise
+        finally:
+            self.release(session, broken=broken)
+
+    async def run(self, firma, period, func, timeout: float = None):
+        """Async wrapper of run_sync; the event loop never touches COM"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.run_sync, firma, period, func, timeout)
+
+    # --- idle logout ---
+
+    def _ensure_reaper(self):
+        with self._cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="unity-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        interval = max(5.0, min(self.idle_timeout, self.health_interval) / 2)
+        while True:
+            time.sleep(interval)
+            self.reap()
+
+    def reap(self) -> int:
+        """Logout sessions idle longer than idle_timeout"""
+        now = time.monotonic()
+        stale = []
+        with self._cond:
+            for key, lst in self._idle.items():
+                keep = []
+                for s in lst:
+                    (stale if now - s.last_used > self.idle_timeout else keep).append(s)
+                self._idle[key] = keep
+            self._size -= len(stale)
+            self._stats["idle_logouts"] += len(stale)
+            if stale:
+                self._cond.notify_all()
+        for s in stale:
+            s.close()
+        if stale:
+            logger.info(f"Unity pool: logged out {len(stale)} idle session(s)")
+        return len(stale)
+
+    def close_all(self):
+        with self._cond:
+            sessions = [s for lst in self._idle.values() for s in lst]
+            self._idle.clear()
+            self._size -= len(sessions)
+            self._cond.notify_all()
+        for s in sessions:
+            s.close()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            idle = {f"{k[0]}_{k[1]}": [round(now - s.last_used, 1) for s in lst] for k, lst in self._idle.items() if lst}
+            s = dict(self._stats)
+            s.update({
+                "backend": type(self.backend).__name__,
+                "available": self.available,
+                "size": self._size,
+                "max_size": self.max_size,
+                "idle": sum(len(v) for v in idle.values()),
+                "idle_seconds": idle,
+            })
+        return s
+
+
+def _make_backend() -> UnityBackend:
+    if settings.UNITY_BACKEND == "fake":
+        logger.warning("Unity Objects: using the pure-Python stand-in backend")
+        return FakeUnityBackend()
+    return ComUnityBackend()
+
+
+unity_pool = UnitySessionPool(
+    _make_backend(),
+    max_size=settings.UNITY_POOL_MAX_SIZE,
+    idle_timeout=settings.UNITY_POOL_IDLE_TIMEOUT,
+    health_interval=settings.UNITY_POOL_HEALTH_INTERVAL,
+    acquire_timeout=settings.UNITY_POOL_ACQUIRE_TIMEOUT
+)
@@ -1,7 +1,30 @@
 import xml.etree.ElementTree as ET
+import asyncio
+import codecs
+import io
+import re
+import time
 from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
 from loguru import logger
 from ..core.database import db_manager
+from ..core.config import settings
+
+# Child elements used to name a record in import results (first one present wins)
+RECORD_KEY_FIELDS = ("NUMBER", "FICHENO", "CODE", "DOC_NUMBER")
+
+# XML root -> (Logo table, key column, period table). After a failed multi-record batch, records
+# already in Logo (committed before the failing one) are looked up here instead of being re-sent.
+XML_RECORD_TABLES = {
+    "SALES_INVOICES": ("INVOICE", "FICHENO", True),
+    "PURCHASE_INVOICES": ("INVOICE", "FICHENO", True),
+    "SALES_ORDERS": ("ORFICHE", "FICHENO", True),
+    "PURCHASE_ORDERS": ("ORFICHE", "FICHENO", True),
+    "SALES_DISPATCHES": ("STFICHE", "FICHENO", True),
+    "PURCHASE_DISPATCHES": ("STFICHE", "FICHENO", True),
+    "AR_APS": ("CLCARD", "CODE", False),
+    "ITEMS": ("ITEMS", "CODE", False),
+}
 
 class XmlService:
     def __init__(self):
@@ -14,55 +37,105 @@ class XmlService:
         reparsed = minidom.parseString(rough_string)
         return reparsed.toprettyxml(indent="  ")
 
+    # =====================================================
+    # SALES INVOICE EXPORT (set-based, streamed)
+    # =====================================================
+
+    @staticmethod
+    def _el(tag: str, value, pad: str) -> str:
+        return f"{pad}<{tag}>{escape('' if value is None else str(value))}</{tag}>\n"
+
+    def _render_invoice(self, order: dict, lines: list) -> str:
+        """One <INVOICE> element as text (Logo SALES_INVOICES layout)"""
+        inv_no = order.get('order_number') or f"INV{datetime.now().strftime('%d%H%M')}"
+        out = ["  <INVOICE>\n",
+               self._el("TYPE", "8", "    "),  # 8=Wholesale, 9=Service
+               self._el("NUMBER", inv_no, "    "),
+               self._el("DATE", order['created_at'].strftime("%d.%m.%Y"), "    "),
+               self._el("ARP_CODE", order.get('customer_code') or '', "    "),
+               self._el("TOTAL_NET", order['total_amount'], "    "),
+               "    <TRANSACTIONS>\n"]
+        for item in lines:
+            out += ["      <TRANSACTION>\n",
+                    self._el("TYPE", "0", "        "),  # 0=Material, 4=Service (Logic needed)
+                    self._el("MASTER_CODE", item.get('product_code') or "UNKNOWN", "        "),
+                    self._el("QUANTITY", item['quantity'], "        "),
+                    self._el("PRICE", item['unit_price'], "        "),
+                    self._el("TOTAL", item['total_price'], "        "),
+                    self._el("UNIT_CODE", "ADET", "        "),  # Default
+                    "      </TRANSACTION>\n"]
+        out.append("    </TRANSACTIONS>\n  </INVOICE>\n")
+        return "".join(out)
+
+    async def _fetch_invoice_lines(self, order_ids: list) -> dict:
+        """Lines (with product codes) for many orders in one query, keyed by str(order_id)"""
+        # ids are compared as text: sales_orders.id is integer or UUID depending on the schema
+        rows = await db_manager.execute_pg_query_async("""
+            SELECT i.order_id, i.quantity, i.unit_price, i.total_price, p.code AS product_code
+            FROM sales_order_items i
+            LEFT JOIN products p ON p.id = i.product_id
+            WHERE i.order_id::text = ANY(%s)
+            ORDER BY i.order_id
+        """, ([str(i) for i in order_ids],))
+        lines = {}
+        for row in rows or []:
+            lines.setdefault(str(row['order_id']), []).append(row)
+        return lines
+
+    @staticmethod
+    def _invoice_header_query(start_date=None, end_date=None, ids=None):
+        conditions, params = [], []
+        if ids:
+            conditions.append("o.id::text = ANY(%s)")  # text[] param, works for integer and UUID ids
+            params.append([str(i) for i in ids])
+        if start_date:
+            conditions.append("o.created_at >= %s")
+            params.append(start_date)
+        if end_date:
+            conditions.append("o.created_at < %s::date + 1")
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT o.id, o.order_number, o.created_at, o.total_amount, c.code AS customer_code
+            FROM sales_orders o
+            LEFT JOIN customers c ON c.id = o.customer_id
+            {where}
+            ORDER BY o.created_at, o.id
+        """
+        return query, tuple(params)
+
+    async def iter_sales_invoices_xml(self, start_date: str = None, end_date: str = None, ids: list = None,
+                                      batch_size: int = 500):
+        """
+        Streams a SALES_INVOICES document for a date range and/or id list.
+        Headers come from a server-side cursor; lines are fetched once per batch of headers.
+        """
+        query, params = self._invoice_header_query(start_date, end_date, ids)
+        yield '<?xml version="1.0" encoding="utf-8"?>\n<SALES_INVOICES>\n'
+        batch = []
+        async for order in db_manager.stream_pg_query_async(query, params, batch_size):
+            batch.append(order)
+            if len(batch) >= batch_size:
+                yield await self._render_batch(batch)
+                batch = []
+        if batch:
+            yield await self._render_batch(batch)
+        yield "</SALES_INVOICES>\n"
+
+    async def _render_batch(self, orders: list) -> str:
+        lines = await self._fetch_invoice_lines([o['id'] for o in orders])
+        return "".join(self._render_invoice(o, lines.get(str(o['id']), [])) for o in orders)
+
     async def generate_sales_invoice_xml(self, invoice_id: str):
         """Generates Logo XML for a Sales Invoice (Verilen Hizmet / Toptan Satış)"""
-        # Fetch Data
-        order_query = "SELECT * FROM sales_orders WHERE id = %s"
-        order_res = db_manager.execute_pg_query(order_query, (invoice_id,))
+        query, params = self._invoice_header_query(ids=[invoice_id])
+        order_res = await db_manager.execute_pg_query_async(query, params)
         if not order_res: return None, "Invoice not found"
-        order = order_res[0]
-        
-        items_query = "SELECT * FROM sales_order_items WHERE order_id = %s"
-        items = db_manager.execute_pg_query(items_query, (invoice_id,))
-        
-        customer_id = order['customer_id']
-        cust_res = db_manager.execute_pg_query(f"SELECT * FROM customers WHERE id = {customer_id}")
-        customer = cust_res[0] if cust_res else {}
-
-        # Build XML
-        root = ET.Element("SALES_INVOICES")
-        invoice = ET.SubElement(root, "INVOICE")
-        inv_no = order.get('order_number') or f"INV{datetime.now().strftime('%d%H%M')}"
-        
-        # Header
-        ET.SubElement(invoice, "TYPE").text = "8" # 8=Wholesale, 9=Service
-        ET.SubElement(invoice, "NUMBER").text = inv_no
-        ET.SubElement(invoice, "DATE").text = order['created_at'].strftime("%d.%m.%Y")
-        ET.SubElement(invoice, "ARP_CODE").text = customer.get('code', '')
-        ET.SubElement(invoice, "TOTAL_NET").text = str(order['total_amount'])
-        
-        # Transactions
-        trans_node = ET.SubElement(invoice, "TRANSACTIONS")
-        
-        for item in items:
-            product_id = item['product_id']
-            # Fetch Product Code
-            p_res = db_manager.execute_pg_query(f"SELECT code FROM products WHERE id = {product_id}")
-            p_code = p_res[0]['code'] if p_res else "UNKNOWN"
-            
-            line = ET.SubElement(trans_node, "TRANSACTION")
-            ET.SubElement(line, "TYPE").text = "0" # 0=Material, 4=Service (Logic needed)
-            ET.SubElement(line, "MASTER_CODE").text = p_code
-            ET.SubElement(line, "QUANTITY").text = str(item['quantity'])
-            ET.SubElement(line, "PRICE").text = str(item['unit_price'])
-            ET.SubElement(line, "TOTAL").text = str(item['total_price'])
-            ET.SubElement(line, "UNIT_CODE").text = "ADET" # Default
-            
-        return self._prettify(root)
+        return '<?xml version="1.0" encoding="utf-8"?>\n<SALES_INVOICES>\n' + await self._render_batch(order_res) + "</SALES_INVOICES>\n"
 
     async def generate_client_xml(self, customer_id: int):
         """Generates Logo XML for a Client (AR/AP)"""
-        cust_res = db_manager.execute_pg_query(f"SELECT * FROM customers WHERE id = {customer_id}")
+        cust_res = await db_manager.execute_pg_query_async(f"SELECT * FROM customers WHERE id = {customer_id}")
         if not cust_res: return None, "Customer not found"
         client = cust_res[0]
 
@@ -79,4 +152,165 @@ class XmlService:
 
         return self._prettify(root)
 
+    # =====================================================
+    # STREAMING XML IMPORT
+    # =====================================================
+
+    @staticmethod
+    def _sniff_encoding(fileobj) -> str:
+        """XML declaration if present, else UTF-8 when the head decodes cleanly, else Windows-1254"""
+        head = fileobj.read(65536)
+        fileobj.seek(0)
+        m = re.match(rb'\s*<\?xml[^>]*encoding=["\']([A-Za-z0-9._-]+)["\']', head)
+        if m:
+            return m.group(1).decode("ascii")
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+            return "utf-8"
+        except UnicodeDecodeError:
+            return "cp1254"
+
+    def _iter_xml_batches(self, fileobj, batch_size: int):
+        """
+        Split a Logo XML document (<ROOT><RECORD/>...</ROOT>) into batches of records
+        without loading it whole. Yields (root_open, root_close, [record_xml], [(index, key)]).
+        """
+        text = io.TextIOWrapper(fileobj, encoding=self._sniff_encoding(fileobj), errors="strict")
+        depth = 0
+        root = None
+        opening = closing = None
+        records, meta = [], []
+        index = 0
+
+        for event, elem in ET.iterparse(text, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    root = elem
+                    attrs = "".join(f" {k}={quoteattr(v)}" for k, v in elem.attrib.items())
+                    opening, closing = f"<{elem.tag}{attrs}>", f"</{elem.tag}>"
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            key = next((elem.findtext(f) for f in RECORD_KEY_FIELDS if elem.findtext(f)), None)
+            records.append(ET.tostring(elem, encoding="unicode"))
+            meta.append((index, key))
+            index += 1
+            root.clear()  # drop parsed records, memory stays flat
+            if len(records) >= batch_size:
+                yield opening, closing, records, meta
+                records, meta = [], []
+
+        if records:
+            yield opening, closing, records, meta
+
+    async def _existing_keys(self, opening: str, keys: list, firma: str, period: str):
+        """Keys of the batch Logo already has, or None when that can't be checked for this XML type"""
+        root = re.match(r"<([\w.:-]+)", opening).group(1)
+        target = XML_RECORD_TABLES.get(root)
+        if not target or not keys:
+            return None
+        table, column, per_period = target
+        name = f"LG_{firma}_{period}_{table}" if per_period else f"LG_{firma}_{table}"
+        found = set()
+        for n in range(0, len(keys), 2000):  # MSSQL parameter limit
+            chunk = keys[n:n + 2000]
+            rows = await db_manager.execute_ms_query_async(
+                f"SELECT {column} AS KEY_ FROM {name} (NOLOCK) WHERE {column} IN ({', '.join(['%s'] * len(chunk))})",
+                tuple(chunk)
+            )
+            if rows is None:
+                return None
+            found.update(r["KEY_"] for r in rows)
+        return found
+
+    async def _import_batch(self, opening: str, closing: str, records: list, meta: list, firma=None, period=None):
+        """
+        Import one batch. When Logo rejects a multi-record batch, the records it committed before
+        the failing one must not be sent again: records found in Logo by key are reported as
+        'exists', records that can't be checked as 'unverified', and only the rest are retried
+        one by one to pinpoint the failures.
+        """
+        from .logo_service import logo_service
+        ok, msg = await logo_service.import_xml_data_async(opening + "".join(records) + closing, firma=firma, period=period)
+        if ok:
+            return [{"index": i, "key": k, "status": "success"} for i, k in meta]
+        if len(meta) == 1:
+            return [{"index": meta[0][0], "key": meta[0][1], "status": "failed", "error": msg}]
+
+        existing = await self._existing_keys(
+            opening, sorted({k for _, k in meta if k}), firma or logo_service.firma_no, period or logo_service.period_no
+        )
+        results = []
+        for (i, k), record in zip(meta, records):
+            if existing is None or not k:
+                results.append({"index": i, "key": k, "status": "unverified",
+                                "error": f"Batch failed ({msg}); record may already be in Logo, not re-sent"})
+                continue
+            if k in existing:
+                results.append({"index": i, "key": k, "status": "exists"})
+                continue
+            ok, err = await logo_service.import_xml_data_async(opening + record + closing, firma=firma, period=period)
+            results.append({"index": i, "key": k, "status": "success"} if ok else
+                           {"index": i, "key": k, "status": "failed", "error": err})
+        return results
+
+    async def import_xml_stream(self, fileobj, batch_size: int = None, concurrency: int = None,
+                                firma: str = None, period: str = None):
+        """
+        Streaming Logo XML import. Parses with iterparse, sends record batches to
+        DataFromXML concurrently (bounded) and yields progress events per finished batch.
+        """
+        batch_size = batch_size or settings.XML_IMPORT_BATCH_SIZE
+        concurrency = concurrency or settings.XML_IMPORT_CONCURRENCY
+        loop = asyncio.get_running_loop()
+        gen = self._iter_xml_batches(fileobj, batch_size)
+        start = time.monotonic()
+        pending = set()
+        totals = {"processed": 0, "succeeded": 0, "existing": 0, "failed": 0}
+        batch_no = 0
+        parse_error = None
+
+        def _event(task):
+            records = task.result()
+            ok = sum(1 for r in records if r["status"] == "success")
+            existing = sum(1 for r in records if r["status"] == "exists")
+            totals["processed"] += len(records)
+            totals["succeeded"] += ok
+            totals["existing"] += existing
+            totals["failed"] += len(records) - ok - existing
+            return {"event": "batch", "batch": task.batch_no, "records": records, **totals}
+
+        while True:
+            try:
+                item = await loop.run_in_executor(None, next, gen, None)
+            except (ET.ParseError, UnicodeDecodeError) as e:
+                parse_error = str(e)
+                item = None
+            if item is None:
+                break
+            batch_no += 1
+            task = asyncio.create_task(self._import_batch(*item, firma, period))
+            task.batch_no = batch_no
+            pending.add(task)
+            # Backpressure: never parse further ahead than `concurrency` batches
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in sorted(done, key=lambda t: t.batch_no):
+                    yield _event(t)
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in sorted(done, key=lambda t: t.batch_no):
+                yield _event(t)
+
+        if parse_error:
+            logger.error(f"XML import stopped on parse error: {parse_error}")
+            yield {"event": "error", "error": parse_error, **totals}
+        elapsed = round((time.monotonic() - start) * 1000, 1)
+        logger.info(f"XML import finished: {totals['succeeded']} ok, {totals['failed']} failed in {elapsed} ms")
+        yield {"event": "done", "batches": batch_no, "elapsed_ms": elapsed, **totals}
+
+
 xml_service = XmlService()
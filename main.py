@@ -5,11 +5,12 @@ import sys
 from app.api.v1.api import api_router
 
 from app.core.logging import configure_logging
-from app.core.middleware import LoggingMiddleware
+from app.core.middleware import LoggingMiddleware, QueryTagMiddleware
 
 from contextlib import asynccontextmanager
 from app.core.config import settings
 from app.services.scheduler_service import scheduler_service
+from app.services.transfer_outbox import transfer_outbox
 
 # Configure Loguru
 # Configure Loguru
@@ -58,10 +59,16 @@ async def lifespan(app: FastAPI):
         logger.warning(f"Could not initialize sent_invoices table: {e}")
 
     scheduler_service.start()
+    await transfer_outbox.start()
     yield
     # Shutdown
     logger.info("Shutting down EXFIN API...")
+    await transfer_outbox.stop()
     scheduler_service.shutdown()
+    from app.services.unity_pool import unity_pool
+    unity_pool.close_all()
+    from app.core.database import db_manager
+    db_manager.close_all()
 
 app = FastAPI(
     title="EXFIN OPS API",
@@ -81,6 +88,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tags Logo SQL with the endpoint / request id (see profiler_service.ApiQueryStats)
+app.add_middleware(QueryTagMiddleware)
+
 # Include API Router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -0,0 +1,24 @@
+-- EXFIN ERP Transfer Outbox
+-- Durable queue for Logo transfers (invoice, order, dispatch, collection).
+-- Rows are written by the API and processed by the outbox worker pool (app/services/transfer_outbox.py).
+
+CREATE TABLE IF NOT EXISTS erp_outbox (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    idempotency_key VARCHAR(200) NOT NULL UNIQUE,
+    kind VARCHAR(50) NOT NULL,               -- invoice, order, dispatch, collection
+    firma VARCHAR(10) NOT NULL,
+    period VARCHAR(10),
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending, running, done, dead, unknown (outcome in Logo not known; retried by hand only)
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 6,
+    next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    result JSONB,
+    locked_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_erp_outbox_pending ON erp_outbox(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_erp_outbox_created ON erp_outbox(created_at DESC);
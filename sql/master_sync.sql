@@ -0,0 +1,44 @@
+-- EXFIN Logo master-data sync state
+-- One row per synced (entity, scope): change-detection watermark (CAPIBLOCK_MODIFIEDDATE /
+-- CAPIBLOCK_CREATEDDATE) and the last full reconciliation. Maintained by app/services/master_data_sync.py.
+
+CREATE TABLE IF NOT EXISTS master_sync_state (
+    entity VARCHAR(50) NOT NULL,
+    scope_key VARCHAR(200) NOT NULL,
+    firma VARCHAR(10) NOT NULL,
+    watermark TIMESTAMP,
+    last_mode VARCHAR(20),
+    last_fetched INT,
+    last_full_at TIMESTAMP WITH TIME ZONE,
+    synced_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (entity, scope_key)
+);
+
+-- Orchestrated runs (app/services/sync_orchestrator.py): one row per run, one per step
+-- (entity x company). A failed run resumes from its unfinished steps; last_ref is the
+-- checkpoint inside a step (last merged LOGICALREF).
+CREATE TABLE IF NOT EXISTS master_sync_runs (
+    run_id VARCHAR(36) PRIMARY KEY,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    mode VARCHAR(20),
+    company_ids INT[],
+    concurrency INT,
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE TABLE IF NOT EXISTS master_sync_run_steps (
+    run_id VARCHAR(36) NOT NULL REFERENCES master_sync_runs(run_id) ON DELETE CASCADE,
+    step VARCHAR(50) NOT NULL,
+    company_id INT NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    mode VARCHAR(20),
+    last_ref INT NOT NULL DEFAULT 0,
+    fetched INT NOT NULL DEFAULT 0,
+    result JSONB,
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (run_id, step, company_id)
+);
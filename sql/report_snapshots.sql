@@ -14,6 +14,17 @@ CREATE TABLE IF NOT EXISTS report_snapshots (
 
 CREATE INDEX IF NOT EXISTS idx_report_snapshots_code_tenant ON report_snapshots(report_code, tenant_id);
 
+-- Incremental refresh state (see ReportSyncService / INCREMENTAL_REPORTS)
+ALTER TABLE report_snapshots ADD COLUMN IF NOT EXISTS watermark VARCHAR(100);
+ALTER TABLE report_snapshots ADD COLUMN IF NOT EXISTS last_full_at TIMESTAMP WITH TIME ZONE;
+
+-- Compact storage: compressed column-oriented blob (app/services/snapshot_codec.py).
+-- snapshot_data is kept only for rows written before the blob format.
+ALTER TABLE report_snapshots ALTER COLUMN snapshot_data DROP NOT NULL;
+ALTER TABLE report_snapshots ADD COLUMN IF NOT EXISTS snapshot_blob BYTEA;
+ALTER TABLE report_snapshots ADD COLUMN IF NOT EXISTS snapshot_encoding VARCHAR(10);
+ALTER TABLE report_snapshots ADD COLUMN IF NOT EXISTS row_count INT;
+
 -- Function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -23,6 +34,23 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+-- Run history of the scheduled snapshot refresh engine (scheduler_service.SnapshotRefreshEngine)
+CREATE TABLE IF NOT EXISTS report_snapshot_runs (
+    id BIGSERIAL PRIMARY KEY,
+    report_code VARCHAR(100) NOT NULL,
+    tenant_id VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL,   -- success, failed
+    mode VARCHAR(20),              -- full, incremental
+    fetched INT,
+    row_count INT,
+    duration_ms NUMERIC(12, 1),
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_report_snapshot_runs_code ON report_snapshot_runs(report_code, started_at DESC);
+
+DROP TRIGGER IF EXISTS update_report_snapshots_modtime ON report_snapshots;
 CREATE TRIGGER update_report_snapshots_modtime
     BEFORE UPDATE ON report_snapshots
     FOR EACH ROW
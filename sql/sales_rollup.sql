@@ -0,0 +1,43 @@
+-- EXFIN Daily Sales Rollups
+-- Per-day, per-firm aggregates of Logo sales, stock movements and collections.
+-- Maintained by app/services/sales_rollup.py (backfill once, then incremental); the YoY reports read from here.
+
+CREATE TABLE IF NOT EXISTS sales_daily_rollup (
+    firma VARCHAR(10) NOT NULL,
+    period VARCHAR(10) NOT NULL,
+    day DATE NOT NULL,
+    invoice_count INT NOT NULL DEFAULT 0,
+    revenue NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    customer_count INT NOT NULL DEFAULT 0,
+    stock_movement_count INT NOT NULL DEFAULT 0,
+    stock_movement_value NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    collection_count INT NOT NULL DEFAULT 0,
+    collections NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (firma, period, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_sales_daily_rollup_day ON sales_daily_rollup(firma, day);
+
+-- Distinct invoiced customers per day, so customer counts over any window stay exact
+CREATE TABLE IF NOT EXISTS sales_daily_customers (
+    firma VARCHAR(10) NOT NULL,
+    period VARCHAR(10) NOT NULL,
+    day DATE NOT NULL,
+    client_ref INT NOT NULL,
+    PRIMARY KEY (firma, period, day, client_ref)
+);
+
+CREATE INDEX IF NOT EXISTS idx_sales_daily_customers_client ON sales_daily_customers(firma, client_ref, day);
+CREATE INDEX IF NOT EXISTS idx_sales_daily_customers_day ON sales_daily_customers(firma, day);
+
+-- One row per (firma, period): change-detection watermark and last backfill
+CREATE TABLE IF NOT EXISTS sales_rollup_state (
+    firma VARCHAR(10) NOT NULL,
+    period VARCHAR(10) NOT NULL,
+    watermark TIMESTAMP,
+    days_refreshed INT,
+    last_full_at TIMESTAMP WITH TIME ZONE,
+    refreshed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (firma, period)
+);
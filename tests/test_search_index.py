@@ -0,0 +1,40 @@
+"""_Index ranking tiers on a handful of in-memory cards"""
+import pytest
+
+from app.services.search_index import _Index
+
+
+@pytest.fixture
+def index():
+    idx = _Index()
+    idx.add(1, "120.01.005", "Ahmet Yılmaz Ltd", (), {})
+    idx.add(2, "120.02.010", "Isparta Gıda", (), {})
+    idx.add(3, "153.01.001", "Vida M8", ("8690001000011",), {})
+    idx.finish()
+    return idx
+
+
+def refs(idx, query, limit=10):
+    return [ref for ref, _ in idx.search(query, limit)]
+
+
+def test_exact_code_ranks_first(index):
+    assert refs(index, "120.01.005")[0] == 1
+
+
+def test_code_prefix(index):
+    assert set(refs(index, "120.0")) == {1, 2}
+
+
+def test_code_substring_keeps_punctuation(index):
+    assert refs(index, "01.005") == [1]
+    assert set(refs(index, ".01.00")) == {1, 3}
+
+
+def test_name_substring_is_turkish_folded(index):
+    assert refs(index, "ILMAZ") == [1]
+    assert refs(index, "ıspart") == [2]
+
+
+def test_barcode(index):
+    assert refs(index, "8690001000011") == [3]
@@ -0,0 +1,191 @@
+"""UnitySessionPool against the pure-Python FakeUnityBackend (no COM needed)"""
+import asyncio
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+from app.services.unity_pool import FakeUnityBackend, UnityLoginError, UnitySessionPool
+
+
+class FailingBackend(FakeUnityBackend):
+    def login(self, firma, period):
+        raise RuntimeError("bad credentials")
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(backend=None, **kwargs):
+        kwargs.setdefault("idle_timeout", 600.0)
+        kwargs.setdefault("health_interval", 600.0)
+        kwargs.setdefault("acquire_timeout", 5.0)
+        pool = UnitySessionPool(backend or FakeUnityBackend(), **kwargs)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close_all()
+
+
+def _wait_closed(session, timeout=5.0):
+    session._thread.join(timeout)
+    assert not session._thread.is_alive()
+
+
+def test_acquire_logs_in_and_reuses_session(make_pool):
+    backend = FakeUnityBackend()
+    pool = make_pool(backend)
+
+    session = pool.acquire("001", "01")
+    assert session.app.firma == "001" and session.app.period == "01"
+    pool.release(session)
+
+    again = pool.acquire("001", "01")
+    assert again is session
+    pool.release(again)
+
+    assert backend.logins == 1
+    stats = pool.stats()
+    assert stats["logins"] == 1 and stats["reuses"] == 1
+    assert stats["size"] == 1 and stats["idle"] == 1
+
+
+def test_sessions_are_keyed_by_firm_and_period(make_pool):
+    backend = FakeUnityBackend()
+    pool = make_pool(backend, max_size=4)
+
+    a = pool.acquire("001", "01")
+    b = pool.acquire("001", "02")
+    assert a is not b
+    pool.release(a)
+    pool.release(b)
+    assert backend.logins == 2
+    assert pool.stats()["size"] == 2
+
+
+def test_full_pool_evicts_least_recently_used_idle_session(make_pool):
+    backend = FakeUnityBackend()
+    pool = make_pool(backend, max_size=1)
+
+    old = pool.acquire("001", "01")
+    old_app = old.app
+    pool.release(old)
+
+    new = pool.acquire("002", "01")
+    assert new is not old
+    _wait_closed(old)
+    assert old_app.Connected is False  # logged out on its own thread
+    pool.release(new)
+
+    assert backend.logins == 2
+    assert pool.stats()["size"] == 1
+
+
+def test_acquire_times_out_when_every_session_is_busy(make_pool):
+    pool = make_pool(max_size=1)
+    busy = pool.acquire("001", "01")
+
+    start = time.monotonic()
+    with pytest.raises(UnityLoginError):
+        pool.acquire("002", "01", timeout=0.2)
+    assert time.monotonic() - start >= 0.2
+    assert pool.stats()["timeouts"] == 1
+
+    pool.release(busy)
+
+
+def test_waiting_acquire_gets_released_session(make_pool):
+    pool = make_pool(max_size=1)
+    busy = pool.acquire("001", "01")
+    got = []
+
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire("001", "01", timeout=5.0)))
+    waiter.start()
+    time.sleep(0.05)
+    pool.release(busy)
+    waiter.join(5.0)
+
+    assert got == [busy]
+    pool.release(busy)
+
+
+def test_login_failure_frees_the_slot(make_pool):
+    pool = make_pool(FailingBackend(), max_size=1)
+
+    with pytest.raises(UnityLoginError):
+        pool.acquire("001", "01")
+    stats = pool.stats()
+    assert stats["login_failures"] == 1 and stats["size"] == 0
+
+
+def test_run_sync_timeout_retires_the_session(make_pool):
+    backend = FakeUnityBackend()
+    pool = make_pool(backend)
+    release = threading.Event()
+    apps = []
+
+    def slow(app):
+        apps.append(app)
+        release.wait(5.0)
+        return "late"
+
+    with pytest.raises(FutureTimeoutError):
+        pool.run_sync("001", "01", slow, timeout=0.1)
+    assert pool.stats()["size"] == 0  # not handed out again while still busy
+
+    release.set()
+    # The next call gets a fresh login, the retired session logs out once its work returns
+    assert pool.run_sync("001", "01", lambda app: app is not apps[0]) is True
+    assert backend.logins == 2
+    deadline = time.monotonic() + 5.0
+    while apps[0].Connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert apps[0].Connected is False
+
+
+def test_dead_session_is_replaced_after_health_check(make_pool):
+    backend = FakeUnityBackend()
+    pool = make_pool(backend, health_interval=0.0)
+
+    session = pool.acquire("001", "01")
+    pool.release(session)
+    session.app.Connected = False  # e.g. Logo server restarted while idle
+    time.sleep(0.01)
+
+    fresh = pool.acquire("001", "01")
+    assert fresh is not session
+    pool.release(fresh)
+    assert backend.logins == 2
+    assert pool.stats()["health_failures"] == 1
+
+
+def test_reap_logs_out_idle_sessions(make_pool):
+    pool = make_pool()
+    session = pool.acquire("001", "01")
+    app = session.app
+    pool.release(session)
+
+    assert pool.reap() == 0  # still within idle_timeout
+    pool.idle_timeout = 0.0
+    time.sleep(0.01)
+    assert pool.reap() == 1
+
+    _wait_closed(session)
+    assert app.Connected is False
+    stats = pool.stats()
+    assert stats["idle_logouts"] == 1 and stats["size"] == 0 and stats["idle"] == 0
+
+
+def test_async_run_uses_pooled_session(make_pool):
+    backend = FakeUnityBackend()
+    pool = make_pool(backend)
+
+    async def main():
+        return await asyncio.gather(*[pool.run("001", "01", lambda app: app.firma) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["001"] * 5
+    assert backend.logins <= pool.max_size